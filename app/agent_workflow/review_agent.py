@@ -1,8 +1,17 @@
 from agents import Agent, Runner
 from dotenv import load_dotenv
 
+from agent_workflow.review_scheduler import get_review_scheduler
+from logic_functions.review_cache import review_cache, review_cache_key
+from logic_functions.async_utils import run_blocking
+from logic_functions.telemetry import record_cache, record_run_usage
+
 load_dotenv()
 
+REVIEW_MODEL = 'gpt-4o-mini'
+# Bump whenever review_instructions or build_review_prompt change, so cached reviews are not reused
+REVIEW_PROMPT_VERSION = "1"
+
 review_instructions = """
     The input is the raw diff of a pull request for a single file. You are a meticulous code reviewer with deep expertise in algorithms, 
     data structures, and software engineering best practices.
@@ -30,11 +39,26 @@ review_instructions = """
 review_agent = Agent(
     name="Review Agent",
     instructions=review_instructions,
-    model='gpt-4o-mini'
+    model=REVIEW_MODEL
 )
 
-async def run_review_agent(file_path: str, diff_content: str, context: str):
-    prompt = f"""Here is a diff for the file `{file_path}`:
+def build_review_prompt(label: str, diff_content: str, context: str, multi_file: bool = False) -> str:
+    if multi_file:
+        # Several files share one request; headings keep each finding attributed to its file
+        return f"""Here is a diff covering the files {label}:
+
+        ```diff
+        {diff_content}
+        ```
+
+        Here is some additional context from the codebase:
+        ```
+        {context}
+        ```
+
+        Please provide your review for each file's changes, starting each file's section with a `#### <file path>` heading.
+    """
+    return f"""Here is a diff for the file {label}:
 
         ```diff
         {diff_content}
@@ -48,5 +72,19 @@ async def run_review_agent(file_path: str, diff_content: str, context: str):
         Please provide your review for this file's changes.
     """
 
-    result = await Runner.run(review_agent, prompt)
-    return result.final_output 
\ No newline at end of file
+async def run_review_agent(label: str, diff_content: str, context: str, multi_file: bool = False):
+    prompt = build_review_prompt(label, diff_content, context, multi_file)
+
+    # An identical diff with identical context was already reviewed by this model and prompt
+    cache_key = review_cache_key(REVIEW_MODEL, REVIEW_PROMPT_VERSION, label, diff_content, context)
+    cached_review = await run_blocking(review_cache.get, cache_key)
+    record_cache("review", int(cached_review is not None), int(cached_review is None))
+    if cached_review is not None:
+        print(f"[CACHE]: Reusing earlier review for {label}")
+        return cached_review
+
+    # Admitted against the shared token/request budget, with retries on rate limits
+    result = await get_review_scheduler().submit(prompt, lambda: Runner.run(review_agent, prompt))
+    record_run_usage(REVIEW_MODEL, result)
+    await run_blocking(review_cache.put, cache_key, result.final_output)
+    return result.final_output
\ No newline at end of file
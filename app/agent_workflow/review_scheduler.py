@@ -0,0 +1,134 @@
+from logic_functions.embedding_service import estimate_tokens
+from logic_functions.telemetry import span, metrics
+
+from dotenv import load_dotenv
+import os
+import time
+import random
+import asyncio
+import logging
+import openai
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Account limits for the review model; admission waits rather than bursting into 429s
+REVIEW_TOKENS_PER_MINUTE = int(os.getenv("REVIEW_TOKENS_PER_MINUTE", "200000"))
+REVIEW_REQUESTS_PER_MINUTE = int(os.getenv("REVIEW_REQUESTS_PER_MINUTE", "500"))
+REVIEW_MAX_CONCURRENCY = int(os.getenv("REVIEW_MAX_CONCURRENCY", "16"))
+REVIEW_MAX_RETRIES = int(os.getenv("REVIEW_MAX_RETRIES", "4"))
+# Completion tokens also count against TPM, so reserve room for the review itself
+REVIEW_COMPLETION_TOKENS = int(os.getenv("REVIEW_COMPLETION_TOKENS", "1000"))
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+
+class _Bucket:
+    """Token bucket refilled continuously at capacity per minute."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+def _retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            return None
+    return None
+
+
+class ReviewScheduler:
+    """Admits review calls against a tokens-per-minute and requests-per-minute budget, retrying on rate limits."""
+
+    def __init__(self, tokens_per_minute: int = REVIEW_TOKENS_PER_MINUTE, requests_per_minute: int = REVIEW_REQUESTS_PER_MINUTE,
+                 max_concurrency: int = REVIEW_MAX_CONCURRENCY, max_retries: int = REVIEW_MAX_RETRIES):
+        self.tokens = _Bucket(tokens_per_minute)
+        self.requests = _Bucket(requests_per_minute)
+        self.max_retries = max_retries
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # Held while waiting for budget, so admission is first-come first-served and large prompts are not starved
+        self._admission = asyncio.Lock()
+        self._paused_until = 0.0
+
+    ### CALLED BY: submit
+    ### PURPOSE: Waits until the budget has room for a call of the given size, then spends it
+    # @param tokens: int - The estimated prompt + completion tokens of the call
+    async def acquire(self, tokens: int):
+        tokens = min(tokens, self.tokens.capacity)
+        async with self._admission:
+            while True:
+                now = time.monotonic()
+                self.tokens.refill(now)
+                self.requests.refill(now)
+                wait = max(self._paused_until - now, self.tokens.wait_time(tokens), self.requests.wait_time(1))
+                if wait <= 0:
+                    self.tokens.level -= tokens
+                    self.requests.level -= 1
+                    return
+                await asyncio.sleep(wait)
+
+    ### CALLED BY: submit
+    ### PURPOSE: Pauses all admissions after a rate-limit response, honouring its retry-after
+    # @param seconds: float - How long the account should be left alone
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    ### CALLED BY: run_review_agent
+    ### PURPOSE: Runs one model call under the budget, retrying retryable errors with exponential backoff
+    # 1. Wait for budget and a concurrency slot
+    # 2. Run the call; on a retryable error, back off (retry-after if given) and go back to 1
+    # @param prompt: str - The prompt, used to estimate the tokens the call will spend
+    # @param call: callable - Zero-argument coroutine factory performing the call
+    # @return: The result of the call; the last error is raised once retries are exhausted
+    async def submit(self, prompt: str, call):
+        estimated_tokens = estimate_tokens(prompt) + REVIEW_COMPLETION_TOKENS
+        for attempt in range(self.max_retries + 1):
+            with span("review_scheduler.admission", estimated_tokens=estimated_tokens):
+                await self.acquire(estimated_tokens)
+            try:
+                async with self._slots:
+                    with span("openai.review", attempt=attempt):
+                        return await call()
+            except RETRYABLE_ERRORS as e:
+                metrics.inc("review_retries_total", help="Review model calls retried", error=type(e).__name__)
+                if attempt == self.max_retries:
+                    raise
+                delay = _retry_after(e) or min(2 ** attempt, 60) + random.uniform(0, 1)
+                if isinstance(e, openai.RateLimitError):
+                    self.pause(delay)
+                logger.warning(f"Review call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+
+_scheduler = None
+_scheduler_loop = None
+
+
+### CALLED BY: run_review_agent
+### PURPOSE: Returns the process-wide scheduler, so concurrent PR reviews share one account budget
+# @return: ReviewScheduler - The shared scheduler (recreated if the event loop changed)
+def get_review_scheduler() -> ReviewScheduler:
+    global _scheduler, _scheduler_loop
+    loop = asyncio.get_running_loop()
+    if _scheduler is None or _scheduler_loop is not loop:
+        _scheduler = ReviewScheduler()
+        _scheduler_loop = loop
+    return _scheduler
@@ -0,0 +1,182 @@
+from agents import Agent, Runner
+from dotenv import load_dotenv
+import os
+import time
+import asyncio
+import contextlib
+
+from logic_functions.diff_functions import post_comment, update_comment, delete_comment
+from logic_functions.embedding_service import estimate_tokens
+from logic_functions.telemetry import span, record_run_usage
+from agent_workflow.review_scheduler import get_review_scheduler
+
+load_dotenv()
+
+summarizer_agent = Agent(
+    name="Summarizer Agent",
+    instructions="You have been provided with a list of reviews for a pull request, with each review corresponding to a single file. Your task is to synthesize these individual reviews into a single, cohesive pull request comment. Make sure to format it nicely in markdown.",
+    model='gpt-4o'
+)
+
+# Intermediate reductions only condense; the final, user-facing summary is written by summarizer_agent
+SUMMARY_REDUCE_MODEL = os.getenv("SUMMARY_REDUCE_MODEL", "gpt-4o-mini")
+reduce_agent = Agent(
+    name="Review Reducer Agent",
+    instructions="You have been provided with several code reviews from one pull request. Merge them into one concise review that keeps every concrete finding, each attributed to its file. Drop repetition and low-impact remarks, and do not add an introduction.",
+    model=SUMMARY_REDUCE_MODEL
+)
+
+# Reviews given to a single summarizer call; more than this are first reduced in concurrent groups
+SUMMARY_GROUP_TOKEN_BUDGET = int(os.getenv("SUMMARY_GROUP_TOKEN_BUDGET", "12000"))
+# Minimum gap between progressive edits of the review comment, to stay well inside GitHub's rate limits
+COMMENT_UPDATE_INTERVAL_SECONDS = float(os.getenv("COMMENT_UPDATE_INTERVAL_SECONDS", "2"))
+
+
+class ProgressiveComment:
+    """A pull request comment created early and rewritten as the review progresses, at most once per interval."""
+
+    def __init__(self, issue_url: str, comment_url: str | None = None, compose=None,
+                 interval: float = COMMENT_UPDATE_INTERVAL_SECONDS):
+        self.issue_url = issue_url
+        self.url = comment_url
+        # Maps the review text to the full comment body (e.g. appended to an earlier review)
+        self.compose = compose or (lambda text: text)
+        self.interval = interval
+        self.created = comment_url is None
+        self._pending = None
+        self._writer = None
+        self._last_write = 0.0
+
+    async def _write(self, text: str) -> dict:
+        body = self.compose(text)
+        self._last_write = time.monotonic()
+        if self.url is None:
+            with span("post_comment"):
+                result = await post_comment(self.issue_url, body)
+            self.url = result.get("url")
+        else:
+            with span("update_comment"):
+                result = await update_comment(self.url, body)
+        return {**result, "body": body}
+
+    async def _write_pending(self):
+        while self._pending is not None:
+            await asyncio.sleep(max(0.0, self._last_write + self.interval - time.monotonic()))
+            text, self._pending = self._pending, None
+            await self._write(text)
+
+    async def _stop_writer(self):
+        self._pending = None
+        if self._writer is not None and not self._writer.done():
+            self._writer.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await self._writer
+
+    ### CALLED BY: run_orchestration_agent
+    ### PURPOSE: Writes the placeholder right away, so the PR shows the review has started
+    async def start(self, text: str) -> dict:
+        return await self._write(text)
+
+    ### CALLED BY: run_orchestration_agent, summarize_reviews
+    ### PURPOSE: Schedules the comment to show text; returns at once, and only the latest text of an interval is written
+    def update(self, text: str):
+        self._pending = text
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending())
+
+    ### CALLED BY: run_orchestration_agent
+    ### PURPOSE: Writes the finished review, superseding any pending progressive edit
+    # @return: dict - The API result, with the "url" and full "body" of the comment
+    async def finish(self, text: str) -> dict:
+        await self._stop_writer()
+        return await self._write(text)
+
+    ### CALLED BY: run_orchestration_agent
+    ### PURPOSE: Undoes the placeholder of a review that failed: a comment it created is deleted, an earlier one restored
+    # @param previous_body: str | None - The comment's body before this review
+    async def abandon(self, previous_body: str | None = None):
+        await self._stop_writer()
+        if self.url is None:
+            return
+        if self.created:
+            await delete_comment(self.url)
+        elif previous_body is not None:
+            await update_comment(self.url, previous_body)
+
+
+### CALLED BY: reduce_reviews
+### PURPOSE: Groups reviews, in order, into groups of at most budget tokens
+# Every group but a trailing one holds at least two reviews, so each reduction round shrinks the list
+# @param reviews: list[str] - The reviews
+# @param budget: int - The token budget of one group
+# @return: list[list[str]] - The groups
+def group_reviews(reviews: list[str], budget: int = SUMMARY_GROUP_TOKEN_BUDGET) -> list[list[str]]:
+    groups = []
+    current = []
+    current_tokens = 0
+    for review in reviews:
+        tokens = estimate_tokens(review)
+        if len(current) >= 2 and current_tokens + tokens > budget:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(review)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def _reduce_group(group: list[str]) -> str:
+    if len(group) == 1:
+        return group[0]
+    prompt = "Here are reviews of parts of one pull request:\n\n" + "\n\n".join(group) + "\n\nPlease merge them into one review."
+    # Shares the review model's budget, with retries on rate limits
+    result = await get_review_scheduler().submit(prompt, lambda: Runner.run(reduce_agent, prompt))
+    record_run_usage(reduce_agent.model, result)
+    return result.final_output
+
+
+### CALLED BY: summarize_reviews
+### PURPOSE: Reduces reviews in concurrent groups, round after round, until they fit one summarizer call
+# @param reviews: list[str] - The per-file reviews
+# @param budget: int - The token budget of one call
+# @return: list[str] - Reviews (or merged reviews) totalling at most budget tokens, or a single one
+async def reduce_reviews(reviews: list[str], budget: int = SUMMARY_GROUP_TOKEN_BUDGET) -> list[str]:
+    level = 0
+    while len(reviews) > 1 and sum(estimate_tokens(review) for review in reviews) > budget:
+        level += 1
+        groups = group_reviews(reviews, budget)
+        with span("reduce_reviews", level=level, reviews=len(reviews), groups=len(groups)):
+            reviews = list(await asyncio.gather(*(_reduce_group(group) for group in groups)))
+    return reviews
+
+
+### CALLED BY: run_orchestration_agent
+### PURPOSE: Writes the final comment from the per-file reviews, streaming it into the progressive comment as it is generated
+# 1. A single review is the comment as is; no summarizer call is made
+# 2. Otherwise reduce the reviews to fit one call, then stream the summarizer's output
+# @param reviews: list[str] - The per-file reviews
+# @param note: str - Extra instructions appended to the summarizer prompt
+# @param comment: ProgressiveComment | None - Receives the partial summary as it streams
+# @return: str - The final comment text
+async def summarize_reviews(reviews: list[str], note: str = "", comment: ProgressiveComment | None = None) -> str:
+    if not reviews:
+        return ""
+    if len(reviews) == 1:
+        return reviews[0]
+
+    reviews = await reduce_reviews(reviews)
+    full_review_text = "\n\n".join(reviews)
+    final_prompt = f"Here are the reviews for each file in the pull request:\n\n{full_review_text}\n\nPlease synthesize this into a single, cohesive pull request comment.{note}"
+
+    with span("summarize", reviews=len(reviews)):
+        result = Runner.run_streamed(summarizer_agent, final_prompt)
+        text = ""
+        async for event in result.stream_events():
+            if event.type == "raw_response_event" and getattr(event.data, "type", None) == "response.output_text.delta":
+                text += event.data.delta
+                if comment is not None:
+                    comment.update(text + "\n\n_Summarizing..._")
+    record_run_usage(summarizer_agent.model, result)
+    return result.final_output
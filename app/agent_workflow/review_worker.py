@@ -0,0 +1,166 @@
+from logic_functions.job_queue import get_job_queue, job_from_sqs_record, Job, JOB_VISIBILITY_TIMEOUT_SECONDS
+from logic_functions.review_cache import delivery_log
+from logic_functions.async_utils import run_blocking
+from logic_functions.telemetry import metrics, log_event
+from agent_workflow.run_agent import run_orchestration_agent
+
+from dotenv import load_dotenv
+import os
+import random
+import asyncio
+import logging
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Reviews run at once per worker process, and per PR across all workers (SQLite queue; SQS FIFO serves one per PR).
+# One per PR keeps a PR's pushes in order, so its review state only moves forward
+REVIEW_WORKER_CONCURRENCY = int(os.getenv("REVIEW_WORKER_CONCURRENCY", "4"))
+REVIEW_WORKER_MAX_PER_PR = int(os.getenv("REVIEW_WORKER_MAX_PER_PR", "1"))
+REVIEW_JOB_MAX_ATTEMPTS = int(os.getenv("REVIEW_JOB_MAX_ATTEMPTS", "3"))
+# Idle wait between polls of a queue without long polling
+REVIEW_WORKER_POLL_SECONDS = float(os.getenv("REVIEW_WORKER_POLL_SECONDS", "1"))
+
+
+### CALLED BY: ReviewWorkerPool, sqs_handler
+### PURPOSE: Runs the review of one job
+# @param payload: dict - The arguments of run_orchestration_agent, as enqueued by the webhook
+# @return: bool - Whether the review completed (run_orchestration_agent returns None when it gave up)
+async def process_review_job(payload: dict) -> bool:
+    return await run_orchestration_agent(
+        payload["diff_url"], payload["repo_name"], payload["issue_url"], payload.get("full_repo"),
+        payload.get("pr_number"), payload.get("head_sha"), trace_id=payload.get("delivery_id")
+    ) is not None
+
+
+### CALLED BY: ReviewWorkerPool._process, sqs_handler
+### PURPOSE: Gives up on a job after its last attempt, releasing its dedupe claims so a redelivery or re-trigger can run it
+async def abandon_job(queue, job: Job, error: str):
+    metrics.inc("review_jobs_total", help="Review jobs by outcome", outcome="dead")
+    log_event("job_dead", job_id=job.id, group=job.group, attempts=job.attempts, error=error)
+    await run_blocking(queue.dead_letter, job, error)
+    for key in job.payload.get("claim_keys", []):
+        await run_blocking(delivery_log.release, key)
+
+
+class ReviewWorkerPool:
+    """Pulls review jobs from the queue and runs up to concurrency of them at once, with retries."""
+
+    def __init__(self, queue=None, concurrency: int = REVIEW_WORKER_CONCURRENCY, max_per_pr: int = REVIEW_WORKER_MAX_PER_PR,
+                 max_attempts: int = REVIEW_JOB_MAX_ATTEMPTS, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT_SECONDS):
+        self.queue = queue or get_job_queue()
+        self.concurrency = concurrency
+        self.max_per_pr = max_per_pr
+        self.max_attempts = max_attempts
+        self.visibility_timeout = visibility_timeout
+        self._running = set()
+
+    async def _heartbeat(self, job: Job):
+        # Extends the lease while the review runs, so a long review is not redelivered to another worker
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            await run_blocking(self.queue.extend, job, self.visibility_timeout)
+
+    async def _process(self, job: Job):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        error = "review did not complete"
+        completed = False
+        try:
+            completed = await process_review_job(job.payload)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.exception(f"Review job {job.id} failed")
+        finally:
+            heartbeat.cancel()
+
+        if completed:
+            metrics.inc("review_jobs_total", help="Review jobs by outcome", outcome="completed")
+            await run_blocking(self.queue.ack, job)
+        elif job.attempts >= self.max_attempts:
+            await abandon_job(self.queue, job, error)
+        else:
+            delay = min(30 * 2 ** (job.attempts - 1), 600) + random.uniform(0, 5)
+            metrics.inc("review_jobs_total", help="Review jobs by outcome", outcome="retried")
+            logger.warning(f"Review job {job.id} failed (attempt {job.attempts}), retrying in {delay:.0f}s")
+            await run_blocking(self.queue.retry, job, delay)
+
+    ### CALLED BY: main (startup), __main__
+    ### PURPOSE: Leases jobs whenever a slot is free and runs them, until stop is set; in-flight reviews are then awaited
+    # @param stop: asyncio.Event | None - Set to stop taking new jobs
+    async def run(self, stop: asyncio.Event | None = None):
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            free = self.concurrency - len(self._running)
+            if free <= 0:
+                await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            try:
+                jobs = await run_blocking(self.queue.receive, free, self.visibility_timeout, self.max_per_pr)
+            except Exception as e:
+                logger.error(f"Error receiving review jobs: {e}")
+                jobs = []
+            if not jobs:
+                try:
+                    await asyncio.wait_for(stop.wait(), REVIEW_WORKER_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for job in jobs:
+                task = asyncio.create_task(self._process(job))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+
+### PURPOSE: Lambda entry point for an SQS trigger on the job queue (image CMD "agent_workflow.review_worker.sqs_handler");
+###          failed messages are reported individually, so SQS redelivers only those. A FIFO batch can hold several
+###          jobs of one PR: they run in order, and after a failure the rest of that PR's jobs are returned too
+# @param event: dict - The SQS event, one record per job
+# @return: dict - The partial batch response
+def sqs_handler(event: dict, context=None) -> dict:
+    queue = get_job_queue()
+
+    async def handle(record: dict) -> str | None:
+        job = job_from_sqs_record(record)
+        try:
+            if await process_review_job(job.payload):
+                metrics.inc("review_jobs_total", help="Review jobs by outcome", outcome="completed")
+                return None
+            error = "review did not complete"
+        except Exception as e:
+            logger.exception(f"Review job {job.id} failed")
+            error = f"{type(e).__name__}: {e}"
+        if job.attempts >= REVIEW_JOB_MAX_ATTEMPTS:
+            await abandon_job(queue, job, error)
+            return None
+        return job.id
+
+    async def handle_group(records: list[dict]) -> list[str]:
+        failed = []
+        for record in records:
+            if failed:
+                # Reviewing a later push before the failed one would let the failed one move the PR's state back
+                failed.append(job_from_sqs_record(record).id)
+                continue
+            job_id = await handle(record)
+            if job_id:
+                failed.append(job_id)
+        return failed
+
+    async def handle_all():
+        groups = {}
+        for record in event.get("Records", []):
+            groups.setdefault(job_from_sqs_record(record).group, []).append(record)
+        results = await asyncio.gather(*(handle_group(records) for records in groups.values()))
+        return [job_id for failed in results for job_id in failed]
+
+    failed = asyncio.run(handle_all())
+    return {"batchItemFailures": [{"itemIdentifier": job_id} for job_id in failed if job_id]}
+
+
+if __name__ == "__main__":
+    # Standalone worker, e.g. next to the web container: python -m agent_workflow.review_worker
+    asyncio.run(ReviewWorkerPool().run())
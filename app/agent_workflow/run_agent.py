@@ -1,66 +1,197 @@
-from agents import Agent, Runner
 from dotenv import load_dotenv
 import asyncio
 
-from logic_functions.diff_functions import get_diff, split_diff_by_file, retrieve_context_from_diff, post_comment, update_file_embeddings, initialize_chunk_store
+from logic_functions.diff_functions import get_diff, get_compare_diff, get_compare_status, retrieve_context_from_diff, update_file_embeddings, initialize_chunk_store, create_retrieval_context
+from logic_functions.diff_parser import parse_diff
+from logic_functions.diff_packing import pack_file_diffs
+from logic_functions.review_cache import review_state
+from logic_functions.async_utils import run_blocking
+from logic_functions.telemetry import span, start_trace, metrics
 from agent_workflow.review_agent import run_review_agent
+from agent_workflow.review_summarizer import ProgressiveComment, summarize_reviews
 
 load_dotenv()
 
-summarizer_agent = Agent(
-    name="Summarizer Agent",
-    instructions="You have been provided with a list of reviews for a pull request, with each review corresponding to a single file. Your task is to synthesize these individual reviews into a single, cohesive pull request comment. Make sure to format it nicely in markdown.",
-    model='gpt-4o'
-)
+# GitHub rejects comment bodies longer than this
+GITHUB_COMMENT_MAX_CHARS = 65536
+# Separates the original review from the updates appended for later pushes
+UPDATE_MARKER = "\n\n---\n<!-- git-lint update -->\n"
+# Conditional writes of a PR's review state before giving up to a concurrent review
+REVIEW_STATE_PUT_ATTEMPTS = 3
 
-async def run_orchestration_agent(url: str, repo_name: str, issue_url: str):
+
+def compose_updated_comment(previous_body: str, update: str, base_sha: str, head_sha: str) -> str:
+    section = f"{UPDATE_MARKER}### Update: changes from `{base_sha[:7]}` to `{head_sha[:7]}`\n\n{update}"
+    body = previous_body + section
+    if len(body) > GITHUB_COMMENT_MAX_CHARS:
+        # Keep the original review and the newest update; older updates are dropped
+        original = previous_body.split(UPDATE_MARKER, 1)[0]
+        body = original + section
+    return body[:GITHUB_COMMENT_MAX_CHARS]
+
+
+async def run_orchestration_agent(url: str, repo_name: str, issue_url: str, full_repo: str | None = None,
+                                  pr_number: int | None = None, head_sha: str | None = None, trace_id: str | None = None):
+    # Every span and JSON log line of this review carries the same trace id
+    start_trace(trace_id)
+    with span("review_pr", repo=repo_name, pr=pr_number, head_sha=head_sha) as attributes:
+        return await _review_pull_request(url, repo_name, issue_url, full_repo, pr_number, head_sha, attributes)
+
+
+async def _review_pull_request(url: str, repo_name: str, issue_url: str, full_repo: str | None, pr_number: int | None,
+                               head_sha: str | None, attributes: dict):
     print("[PROCESS]: Starting code review and loading chunk store...")
     # 0. Initialize the chunk store
-    initialize_chunk_store()
+    with span("initialize_chunk_store"):
+        await initialize_chunk_store()
 
-    # 1. Get the full diff
-    print("[PROCESS]: Retrieving merged diff...")
-    diff = await get_diff(url)
+    # A PR reviewed before is reviewed incrementally: only what was pushed since its last reviewed head
+    pr_key = f"{full_repo}#{pr_number}" if full_repo and pr_number is not None else None
+    state = await run_blocking(review_state.get, pr_key) if pr_key and head_sha else None
+    base_sha = None
+    if state and state["head_sha"] != head_sha:
+        status = await get_compare_status(full_repo, state["head_sha"], head_sha)
+        if status in ("behind", "identical"):
+            # An older push (e.g. a retried job) arriving after a newer one was reviewed; the newer review stands
+            print(f"[PROCESS]: {head_sha[:7]} is not ahead of the last reviewed commit {state['head_sha'][:7]}, skipping")
+            return state["body"] or ""
+        # "ahead": review what was pushed since; diverged (a force push) or unknown: review the whole PR
+        if status == "ahead":
+            base_sha = state["head_sha"]
+
+    # 1. Get the diff: the compare diff since the last review, or the full PR diff
+    diff = None
+    if base_sha:
+        print(f"[PROCESS]: Retrieving diff since last reviewed commit {base_sha[:7]}...")
+        with span("get_compare_diff"):
+            diff = await get_compare_diff(full_repo, base_sha, head_sha)
+        if isinstance(diff, dict) and diff.get("error"):
+            # e.g. the reviewed commit was force-pushed away; fall back to reviewing the whole PR
+            print(f"[PROCESS]: {diff['error']}, reviewing the full diff instead")
+            base_sha = None
+    if not base_sha:
+        print("[PROCESS]: Retrieving merged diff...")
+        with span("get_diff"):
+            diff = await get_diff(url)
     if isinstance(diff, dict) and diff.get("error"):
         print(f"[ERROR]: Error getting diff: {diff['error']}")
         return
 
-    # 2. Split the diff by file
+    # 2. Parse the diff once; every later stage consumes the parsed file diffs
     print("[PROCESS]: Splitting diff into sections...")
-    file_diffs = split_diff_by_file(diff)
-
-    # 3. Create review tasks for each file
-    review_tasks = []
-    for file_path, file_diff in file_diffs.items():
-        # For each file, retrieve context and then run the review agent
-        async def review_task(path=file_path, diff_content=file_diff):
-            context = await retrieve_context_from_diff(repo_name, diff_content)
-            review = await run_review_agent(path, diff_content, context)
-            return f"[CREATION] Review for `{path}`:\n{review}"
-        
-        review_tasks.append(review_task())
+    with span("parse_diff", diff_chars=len(diff)):
+        file_diffs = list(parse_diff(diff))
+    # Binary files have no textual changes to review
+    reviewable_diffs = [file_diff for file_diff in file_diffs if not file_diff.is_binary]
 
-    print("[PROCESS]: Reviewing sections in parallel...")
-    # 4. Run review tasks in parallel
-    individual_reviews = await asyncio.gather(*review_tasks)
-
-    # 5. Aggregate and summarize the reviews
-    print("[PROCESS]: Finished reviewing. Merging into one chunk...")
-    full_review_text = "\n\n".join(individual_reviews)
-    
-    final_prompt = f"Here are the reviews for each file in the pull request:\n\n{full_review_text}\n\nPlease synthesize this into a single, cohesive pull request comment."
-    
-    print("[PROCESS]: Summarizing all reviews...")
-    final_review = await Runner.run(summarizer_agent, final_prompt)
+    # 3. Pack files into right-sized review requests: small files are merged, oversized ones split at hunk boundaries
+    with span("pack_file_diffs"):
+        review_units = pack_file_diffs(reviewable_diffs)
+    print(f"[PROCESS]: Packed {len(reviewable_diffs)} files into {len(review_units)} review requests...")
+    attributes.update(incremental=bool(base_sha), files=len(reviewable_diffs), review_requests=len(review_units))
+    if not review_units:
+        # Nothing reviewable (e.g. only binary files): no placeholder and no model call; an existing comment and state still hold
+        print("[PROCESS]: No reviewable changes" + (" since the last review" if base_sha else ""))
+        return (state["body"] or "") if base_sha else ""
+
+    # The review comment is created (or, for a later push, appended to) right away and filled in as reviews complete
+    if base_sha and state["comment_url"]:
+        comment = ProgressiveComment(issue_url, state["comment_url"],
+                                     lambda text: compose_updated_comment(state["body"] or "", text, base_sha, head_sha))
+    else:
+        comment = ProgressiveComment(issue_url, compose=lambda text: text[:GITHUB_COMMENT_MAX_CHARS])
+    print("[COMMENT]: Posting placeholder review comment...")
+    await comment.start(f"_Reviewing {len(reviewable_diffs)} files..._")
 
-    # 6. Post the final review to the issue URL
-    print("[COMMENT]: Commenting onto pull request...")
-    await post_comment(issue_url, final_review.final_output)
+    try:
+        final_review = await _write_review(review_units, repo_name, base_sha, comment)
+        # 6. Replace the placeholder with the final review
+        print("[COMMENT]: Posting final review comment...")
+        result = await comment.finish(final_review)
+    except BaseException:
+        # A retried job starts from a clean slate rather than a stale placeholder
+        try:
+            await comment.abandon(state["body"] if base_sha else None)
+        except Exception as e:
+            print(f"[ERROR]: Error removing placeholder comment: {e}")
+        raise
+    if pr_key and head_sha and result.get("url"):
+        await _record_review_state(pr_key, state, full_repo, head_sha, result["url"], result["body"])
 
     # 7. Update embeddings for the files in the diff
     print("[UPDATE]: Updating embedding store for new changes...")
-    await update_file_embeddings(repo_name, diff)
+    with span("update_file_embeddings", files=len(file_diffs)):
+        await update_file_embeddings(repo_name, file_diffs)
 
-    return final_review.final_output
+    return final_review
 
-    
+
+### CALLED BY: _review_pull_request
+### PURPOSE: Moves a PR's review state to the reviewed head, only forward
+# 1. Write the state only if it is still the version read at the start of the review
+# 2. If another review wrote it in between, retry only if this head is a descendant of the head it recorded
+# @param state: dict | None - The state read at the start of the review
+# @return: bool - Whether the state now records this review
+async def _record_review_state(pr_key: str, state: dict | None, full_repo: str, head_sha: str,
+                               comment_url: str, body: str) -> bool:
+    for _ in range(REVIEW_STATE_PUT_ATTEMPTS):
+        version = state["version"] if state else None
+        if await run_blocking(review_state.put, pr_key, head_sha, comment_url, body, version):
+            return True
+        state = await run_blocking(review_state.get, pr_key)
+        if state and state["head_sha"] == head_sha:
+            return False
+        if state and await get_compare_status(full_repo, state["head_sha"], head_sha) != "ahead":
+            print(f"[PROCESS]: Review state of {pr_key} moved to {state['head_sha'][:7]}, keeping it")
+            return False
+    print(f"[ERROR]: Could not record the review state of {pr_key}")
+    return False
+
+
+### CALLED BY: _review_pull_request
+### PURPOSE: Reviews every request in parallel, showing each review in the comment as it completes, then summarizes them
+# @param review_units: list[ReviewUnit] - The packed review requests
+# @param repo_name: str - The repository name, for context retrieval
+# @param base_sha: str | None - The last reviewed commit, for an incremental review
+# @param comment: ProgressiveComment - The comment being filled in
+# @return: str - The final review text
+async def _write_review(review_units: list, repo_name: str, base_sha: str | None, comment: ProgressiveComment) -> str:
+    # One retrieval memo per PR, so requests touching related files pay for each distinct lookup once
+    retrieval = create_retrieval_context(repo_name)
+    completed = {}
+
+    # Create review tasks for each request
+    async def review_task(position, unit):
+        # For each request, retrieve context and then run the review agent
+        with span("retrieve_context", files=len(unit.segments)):
+            context = await retrieve_context_from_diff(repo_name, unit.file_diffs, retrieval=retrieval)
+        with span("run_review_agent", files=len(unit.segments)):
+            review = await run_review_agent(unit.label, unit.text, context, multi_file=len(unit.segments) > 1)
+        completed[position] = f"#### {unit.label}\n\n{review}"
+        comment.update(f"_Reviewed {len(completed)} of {len(review_units)} requests..._\n\n" + "\n\n".join(completed[i] for i in sorted(completed)))
+        return f"[CREATION] Review for {unit.label}:\n{review}"
+
+    print("[PROCESS]: Reviewing sections in parallel...")
+    # 4. Run review tasks in parallel; the review scheduler paces model calls, and a failed file does not sink the rest
+    results = await asyncio.gather(*(review_task(i, unit) for i, unit in enumerate(review_units)), return_exceptions=True)
+    individual_reviews = []
+    for unit, result in zip(review_units, results):
+        if isinstance(result, Exception):
+            print(f"[ERROR]: Review failed for {unit.label}: {result}")
+            metrics.inc("review_failures_total", help="Review requests that failed after retries")
+            individual_reviews.append(f"[CREATION] Review for {unit.label} could not be completed ({type(result).__name__}).")
+        else:
+            individual_reviews.append(result)
+
+    # 5. Summarize the reviews; a single review is posted as is
+    if len(review_units) == 1 and not isinstance(results[0], Exception):
+        return completed[0]
+    if not completed:
+        # Every request failed: there is nothing to summarize, so the failures are posted as they are
+        print("[ERROR]: No review request completed, skipping the summary")
+        return "\n\n".join(review.replace("[CREATION] ", "", 1) for review in individual_reviews)
+    print("[PROCESS]: Summarizing all reviews...")
+    note = ""
+    if base_sha:
+        note = " These reviews only cover the changes pushed since the pull request was last reviewed; the comment will be appended to the earlier review."
+    return await summarize_reviews(individual_reviews, note, comment)
@@ -0,0 +1,273 @@
+# DETERMINISTIC LOCAL STAND-INS FOR OPENAI, THE AGENTS RUNNER, GITHUB, S3 AND SQS
+# Each fake has a configurable latency so the pipeline's concurrency is exercised as it would be in production
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from hashlib import sha256
+from urllib.parse import urlsplit
+import io
+import os
+import json
+import time
+import random
+import uuid
+import asyncio
+import threading
+import httpx
+import numpy as np
+
+from botocore.exceptions import ClientError
+
+
+class FakeEmbeddings:
+    """Stands in for AsyncOpenAI().embeddings: vectors derived from a hash of the text, so equal texts embed equally."""
+
+    def __init__(self, dimension: int = 256, latency: float = 0.05):
+        self.dimension = dimension
+        self.latency = latency
+        self.requests = 0
+        self.inputs = 0
+
+    def _vector(self, text: str) -> list[float]:
+        seed = int.from_bytes(sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32).tolist()
+
+    async def create(self, input: list[str], model: str):
+        self.requests += 1
+        self.inputs += len(input)
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=self._vector(text)) for i, text in enumerate(input)],
+            usage=SimpleNamespace(prompt_tokens=sum(len(text) // 4 + 1 for text in input))
+        )
+
+
+class FakeOpenAIClient:
+    def __init__(self, embeddings: FakeEmbeddings):
+        self.embeddings = embeddings
+
+
+class FakeRunner:
+    """Stands in for agents.Runner: sleeps for a latency drawn around the configured mean, then returns a canned review."""
+
+    latency = 0.5
+    jitter = 0.2
+    calls = 0
+
+    @classmethod
+    async def run(cls, agent, prompt: str):
+        cls.calls += 1
+        await asyncio.sleep(max(0.0, random.gauss(cls.latency, cls.latency * cls.jitter)))
+        usage = SimpleNamespace(input_tokens=len(prompt) // 4 + 1, output_tokens=400, requests=1)
+        return SimpleNamespace(
+            final_output=f"Review by {agent.name} of {len(prompt)} prompt characters.",
+            raw_responses=[SimpleNamespace(usage=usage)]
+        )
+
+    @classmethod
+    def run_streamed(cls, agent, prompt: str):
+        # Mirrors RunResultStreaming: text deltas as raw response events, then final_output and raw_responses
+        result = SimpleNamespace(final_output=None, raw_responses=[])
+
+        async def stream_events():
+            final = await cls.run(agent, prompt)
+            for word in final.final_output.split(" "):
+                yield SimpleNamespace(type="raw_response_event", data=SimpleNamespace(type="response.output_text.delta", delta=word + " "))
+            result.final_output = final.final_output
+            result.raw_responses = final.raw_responses
+
+        result.stream_events = stream_events
+        return result
+
+
+class FilesystemS3:
+    """Stands in for the boto3 S3 client calls made by s3_upload, storing objects as files under a directory."""
+
+    def __init__(self, root: str, latency: float = 0.02):
+        self.root = root
+        self.latency = latency
+        self.requests = 0
+        self._write_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, sha256(key.encode("utf-8")).hexdigest())
+
+    def _error(self, code: str, operation: str) -> ClientError:
+        return ClientError({"Error": {"Code": code}}, operation)
+
+    def get_object(self, Bucket: str, Key: str, IfNoneMatch: str | None = None):
+        self.requests += 1
+        time.sleep(self.latency)
+        path = self._path(Key)
+        if not os.path.exists(path):
+            raise self._error("NoSuchKey", "GetObject")
+        with open(path, "rb") as f:
+            body = f.read()
+        etag = f'"{sha256(body).hexdigest()[:32]}"'
+        if IfNoneMatch == etag:
+            raise self._error("304", "GetObject")
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, IfMatch: str | None = None, IfNoneMatch: str | None = None, **kwargs):
+        self.requests += 1
+        time.sleep(self.latency)
+        body = Body.encode("utf-8") if isinstance(Body, str) else Body
+        path = self._path(Key)
+        # Conditional writes are checked and applied atomically, as S3 does
+        with self._write_lock:
+            current = None
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    current = f'"{sha256(f.read()).hexdigest()[:32]}"'
+            if (IfNoneMatch == "*" and current is not None) or (IfMatch is not None and IfMatch != current):
+                raise self._error("PreconditionFailed", "PutObject")
+            with open(path, "wb") as f:
+                f.write(body)
+        return {"ETag": f'"{sha256(body).hexdigest()[:32]}"'}
+
+    def delete_object(self, Bucket: str, Key: str):
+        self.requests += 1
+        time.sleep(self.latency)
+        path = self._path(Key)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class MemorySQS:
+    """Stands in for the boto3 SQS client calls made by SQSJobQueue, keeping messages in memory."""
+
+    def __init__(self):
+        self.messages = {}
+
+    def send_message(self, QueueUrl: str, MessageBody: str, **kwargs):
+        message_id = uuid.uuid4().hex
+        self.messages[message_id] = {"messageId": message_id, "receiptHandle": message_id, "body": MessageBody,
+                                     "attributes": {"ApproximateReceiveCount": "1"}}
+        return {"MessageId": message_id}
+
+    def delete_message(self, QueueUrl: str, ReceiptHandle: str):
+        self.messages.pop(ReceiptHandle, None)
+
+    def change_message_visibility(self, QueueUrl: str, ReceiptHandle: str, VisibilityTimeout: int):
+        pass
+
+    ### PURPOSE: The messages as the event of an SQS-triggered Lambda, which removes them from the queue as SQS does
+    ###          for a batch without failures
+    def lambda_event(self) -> dict:
+        records = list(self.messages.values())
+        self.messages.clear()
+        return {"Records": records}
+
+
+class _GitHubHandler(BaseHTTPRequestHandler):
+    # Routed on the original host (sent by LocalGitHubTransport) and path
+    def _reply(self, status: int, body: bytes = b"", content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        github = self.server.github
+        time.sleep(github.latency)
+        host = self.headers.get("X-Original-Host", "")
+        if host == "raw.githubusercontent.com":
+            # /<owner>/<repo>/<branch>/<path>
+            path = self.path.split("/", 4)[-1]
+            content = github.files.get(path)
+            if content is None:
+                return self._reply(404)
+            return self._reply(200, content.encode("utf-8"), "text/plain")
+        if "/compare/" in self.path:
+            diff = github.compare_diffs.get(self.path.rsplit("/compare/", 1)[1])
+        else:
+            diff = github.diffs.get(self.path)
+        if diff is None:
+            return self._reply(404)
+        self._reply(200, diff.encode("utf-8"), "text/plain")
+
+    def do_POST(self):
+        github = self.server.github
+        time.sleep(github.latency)
+        body = self._body()
+        with github.lock:
+            github.comment_count += 1
+            comment_id = github.comment_count
+            github.comments[comment_id] = body.get("body", "")
+        url = f"https://api.github.com/repos/bench/comments/{comment_id}"
+        self._reply(201, json.dumps({"id": comment_id, "url": url}).encode("utf-8"))
+
+    def do_PATCH(self):
+        github = self.server.github
+        time.sleep(github.latency)
+        comment_id = int(self.path.rsplit("/", 1)[1])
+        github.comments[comment_id] = self._body().get("body", "")
+        self._reply(200, json.dumps({"id": comment_id}).encode("utf-8"))
+
+    def do_DELETE(self):
+        github = self.server.github
+        time.sleep(github.latency)
+        github.comments.pop(int(self.path.rsplit("/", 1)[1]), None)
+        self._reply(204)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalGitHub:
+    """A local HTTP server answering the GitHub requests the pipeline makes: diffs, raw files and comments."""
+
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        # request path -> diff text, "<base>...<head>" -> diff text, repo-relative path -> file content
+        self.diffs = {}
+        self.compare_diffs = {}
+        self.files = {}
+        self.comments = {}
+        self.comment_count = 0
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _GitHubHandler)
+        self._server.daemon_threads = True
+        self._server.github = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> "LocalGitHub":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_diff(self, name: str, diff: str) -> str:
+        path = f"/bench/pull/{name}.diff"
+        self.diffs[path] = diff
+        return f"https://github.com{path}"
+
+
+class LocalGitHubTransport(httpx.AsyncBaseTransport):
+    """Sends every request to the local GitHub server instead of its real host, keeping path and method."""
+
+    def __init__(self, base_url: str):
+        self._base = urlsplit(base_url)
+        self._transport = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        original_host = request.url.host
+        request.url = request.url.copy_with(scheme=self._base.scheme, host=self._base.hostname, port=self._base.port)
+        request.headers["Host"] = f"{self._base.hostname}:{self._base.port}"
+        request.headers["X-Original-Host"] = original_host
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self._transport.aclose()
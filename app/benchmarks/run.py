@@ -0,0 +1,307 @@
+# OFFLINE BENCHMARK SUITE FOR THE REVIEW PIPELINE
+# Runs the real pipeline code against the local stand-ins in benchmarks.fakes and reports p50/p99 latency,
+# throughput and peak memory per stage and diff size
+#
+# Usage (from app/):
+#   python -m benchmarks.run                                  # every suite, sizes xs s m
+#   python -m benchmarks.run --suite parser --sizes xs s m l xl
+#   python -m benchmarks.run --suite orchestration --runner-latency 1.0 --json results.json
+#   python -m benchmarks.run --suite startup --import-profile 15
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import logging
+
+SUITES = ("parser", "orchestration", "update", "bulk", "startup")
+REPO_NAME = "bench"
+
+
+### CALLED BY: main
+### PURPOSE: Points every backend at local state under workdir; must run before the app modules are imported
+# @param workdir: str - The scratch directory of this benchmark run
+def configure_environment(workdir: str):
+    os.environ.update({
+        "VECTOR_INDEX_BACKEND": "local",
+        "LOCAL_VECTOR_INDEX_PATH": os.path.join(workdir, "vector_index.npz"),
+        "S3_BUCKET_NAME": "bench",
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite3"),
+        "REVIEW_CACHE_PATH": os.path.join(workdir, "review_cache.sqlite3"),
+        "INDEX_CHECKPOINT_FILE": os.path.join(workdir, "index_checkpoint.json"),
+        "TELEMETRY_JSON_LOGS": "false",
+    })
+    # Placeholders only: nothing leaves the machine
+    for key in ("OPENAI_API_KEY", "PINECONE_API_KEY", "GITHUB_ACCESS_TOKEN"):
+        os.environ.setdefault(key, "offline-benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    # The fake runner is not rate limited; keep the scheduler out of the way unless explicitly configured
+    os.environ.setdefault("REVIEW_TOKENS_PER_MINUTE", "100000000")
+    os.environ.setdefault("REVIEW_REQUESTS_PER_MINUTE", "100000")
+
+
+class Bench:
+    """The fakes of one benchmark run, installed into the app modules."""
+
+    def __init__(self, workdir: str, args):
+        from benchmarks.fakes import FakeEmbeddings, FakeOpenAIClient, FakeRunner, FilesystemS3, LocalGitHub
+        from logic_functions.clients import set_client
+        from agent_workflow import review_agent, review_summarizer
+
+        self.workdir = workdir
+        self.s3 = FilesystemS3(os.path.join(workdir, "s3"), latency=args.s3_latency)
+        self.embeddings = FakeEmbeddings(latency=args.embedding_latency)
+        self.github = LocalGitHub(latency=args.github_latency).start()
+        FakeRunner.latency = args.runner_latency
+
+        set_client("s3", self.s3)
+        set_client("openai", FakeOpenAIClient(self.embeddings))
+        review_agent.Runner = FakeRunner
+        review_summarizer.Runner = FakeRunner
+        self._runs = 0
+
+    def fresh_caches(self):
+        # Every measured run starts cold, so repetitions measure the same work
+        from logic_functions import embedding_service
+        from logic_functions.embedding_cache import EmbeddingCache
+        self._runs += 1
+        embedding_service.embedding_cache = EmbeddingCache(path=os.path.join(self.workdir, f"embedding_cache_{self._runs}.sqlite3"))
+
+    def run(self, coroutine_function, *args, **kwargs):
+        # A new event loop per run, with the pooled GitHub client pointed at the local server
+        async def runner():
+            import httpx
+            from logic_functions import github_client
+            from benchmarks.fakes import LocalGitHubTransport
+            github_client._client = httpx.AsyncClient(transport=LocalGitHubTransport(self.github.base_url), follow_redirects=True)
+            github_client._client_loop = asyncio.get_running_loop()
+            try:
+                return await coroutine_function(*args, **kwargs)
+            finally:
+                await github_client.close_http_client()
+        return asyncio.run(runner())
+
+    def close(self):
+        self.github.stop()
+
+
+def _percentile(values: list[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(share * len(ordered))) - 1))]
+
+
+### CALLED BY: the suites
+### PURPOSE: Times repeated runs of a workload, then measures its peak memory in one extra traced run
+# 1. Run setup (untimed) and the workload repeat times, recording wall-clock latency
+# 2. Run once more under tracemalloc (which slows execution, so it is never timed)
+# @param name: str - The suite name
+# @param size: str - The size preset
+# @param setup: callable - Takes the repetition number and returns the workload's arguments
+# @param workload: callable - The measured call
+# @param units: float - Work per run (e.g. MB or files), for throughput
+# @param unit: str - The unit's name
+# @param repeat: int - The number of timed runs
+# @return: dict - The result row
+def measure(name: str, size: str, setup, workload, units: float, unit: str, repeat: int) -> dict:
+    timings = []
+    for repetition in range(repeat):
+        arguments = setup(repetition)
+        start = time.perf_counter()
+        workload(*arguments)
+        timings.append(time.perf_counter() - start)
+
+    arguments = setup(repeat)
+    tracemalloc.start()
+    workload(*arguments)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return _row(name, size, timings, units, unit, peak / 2 ** 20)
+
+
+def _row(name: str, size: str, timings: list[float], units: float, unit: str, peak_mb: float) -> dict:
+    p50 = _percentile(timings, 0.5)
+    return {
+        "suite": name,
+        "size": size,
+        "runs": len(timings),
+        "p50_ms": round(p50 * 1000, 2),
+        "p99_ms": round(_percentile(timings, 0.99) * 1000, 2),
+        "throughput": round(units / p50, 2) if p50 else None,
+        "unit": f"{unit}/s",
+        "peak_mb": round(peak_mb, 2),
+    }
+
+
+def bench_parser(bench: Bench, size: str, args) -> list[dict]:
+    from logic_functions.diff_parser import parse_diff
+    from logic_functions.diff_packing import pack_file_diffs
+    from benchmarks.synthetic import DIFF_PRESETS, generate_pull_request
+
+    files, lines = DIFF_PRESETS[size]
+    diff, _, _ = generate_pull_request(files, lines, seed=args.seed)
+    megabytes = len(diff.encode("utf-8")) / 2 ** 20
+    file_diffs = list(parse_diff(diff))
+    return [
+        measure("parse_diff", size, lambda _: (diff,), lambda d: list(parse_diff(d)), megabytes, "MB", args.repeat),
+        measure("pack_file_diffs", size, lambda _: (file_diffs,), pack_file_diffs, files, "files", args.repeat),
+    ]
+
+
+def _pull_requests(bench: Bench, size: str, args, count: int):
+    # One distinct PR per run, so no run is served from another run's caches
+    from benchmarks.synthetic import DIFF_PRESETS, generate_pull_request
+    files, lines = DIFF_PRESETS[size]
+    return [generate_pull_request(files, lines, seed=args.seed + i) for i in range(count)]
+
+
+def bench_orchestration(bench: Bench, size: str, args) -> list[dict]:
+    from agent_workflow.run_agent import run_orchestration_agent
+    from benchmarks.synthetic import DIFF_PRESETS
+
+    pull_requests = _pull_requests(bench, size, args, args.repeat + 1)
+    issue_url = "https://api.github.com/repos/bench/issues/1"
+
+    def setup(repetition):
+        diff, _, new_contents = pull_requests[repetition]
+        bench.github.files = new_contents
+        bench.fresh_caches()
+        return (bench.github.add_diff(f"{size}-{repetition}", diff),)
+
+    def workload(diff_url):
+        bench.run(run_orchestration_agent, diff_url, REPO_NAME, issue_url)
+
+    return [measure("run_orchestration_agent", size, setup, workload, DIFF_PRESETS[size][0], "files", args.repeat)]
+
+
+def bench_update(bench: Bench, size: str, args) -> list[dict]:
+    from logic_functions.diff_functions import update_file_embeddings, initialize_chunk_store
+    from logic_functions.diff_parser import parse_diff
+    from benchmarks.synthetic import DIFF_PRESETS
+
+    pull_requests = _pull_requests(bench, size, args, args.repeat + 1)
+
+    def setup(repetition):
+        diff, _, new_contents = pull_requests[repetition]
+        bench.github.files = new_contents
+        bench.fresh_caches()
+        return (list(parse_diff(diff)),)
+
+    def workload(file_diffs):
+        async def update():
+            await initialize_chunk_store()
+            await update_file_embeddings(REPO_NAME, file_diffs)
+        bench.run(update)
+
+    return [measure("update_file_embeddings", size, setup, workload, DIFF_PRESETS[size][0], "files", args.repeat)]
+
+
+def bench_bulk(bench: Bench, size: str, args) -> list[dict]:
+    from logic_functions.bulk_indexer import run_bulk_index
+    from logic_functions.local_vector_index import LocalVectorIndex
+    from benchmarks.synthetic import DIFF_PRESETS, generate_repo
+
+    files, lines = DIFF_PRESETS[size]
+    repo_path = os.path.join(bench.workdir, f"repo_{size}", REPO_NAME)
+    generate_repo(repo_path, files, lines, seed=args.seed)
+
+    def setup(repetition):
+        bench.fresh_caches()
+        index = LocalVectorIndex(path=os.path.join(bench.workdir, f"bulk_index_{size}_{repetition}.npz"),
+                                 key=f"bench/bulk_index_{size}_{repetition}.npz")
+        return (index, os.path.join(bench.workdir, f"bulk_checkpoint_{size}_{repetition}.json"))
+
+    def workload(index, checkpoint_path):
+        bench.run(run_bulk_index, [repo_path], index, checkpoint_path)
+
+    return [measure("run_bulk_index", size, setup, workload, files, "files", args.repeat)]
+
+
+def bench_startup(bench: Bench, size: str, args) -> list[dict]:
+    # Each sample is a fresh interpreter; peak_mb is its peak resident memory, not a traced allocation peak
+    from benchmarks.startup import cold_start_sample
+
+    samples = [cold_start_sample() for _ in range(args.repeat)]
+    peak_mb = max(sample["peak_mb"] for sample in samples)
+    steps = ("import main", "cold GET /", "cold ping", "import pipeline")
+    return [_row(step, "-", [sample[step] for sample in samples], 1, "starts", peak_mb) for step in steps]
+
+
+BENCHMARKS = {
+    "parser": bench_parser,
+    "orchestration": bench_orchestration,
+    "update": bench_update,
+    "bulk": bench_bulk,
+    "startup": bench_startup,
+}
+
+
+def print_table(rows: list[dict]):
+    headers = ("suite", "size", "runs", "p50_ms", "p99_ms", "throughput", "unit", "peak_mb")
+    widths = [max(len(h), *(len(str(row[h])) for row in rows)) for h in headers]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(row[h]).ljust(w) for h, w in zip(headers, widths)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the review pipeline")
+    parser.add_argument("--suite", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--sizes", nargs="+", default=["xs", "s", "m"], help="Presets from benchmarks.synthetic.DIFF_PRESETS")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runner-latency", type=float, default=0.5, help="Mean seconds per review/summary model call")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per embeddings request")
+    parser.add_argument("--github-latency", type=float, default=0.02, help="Seconds per GitHub request")
+    parser.add_argument("--s3-latency", type=float, default=0.01, help="Seconds per S3 request")
+    parser.add_argument("--json", help="Also write the result rows to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    parser.add_argument("--import-profile", type=int, default=0, metavar="N",
+                        help="Also print the N slowest imports (cumulative) of main, from -X importtime")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.disable(logging.INFO)
+    workdir = tempfile.mkdtemp(prefix="gitlint-bench-")
+    configure_environment(workdir)
+
+    # The pipeline prints progress for every stage; only the results table is wanted here
+    stdout = sys.stdout
+    bench = Bench(workdir, args)
+    rows = []
+    try:
+        for suite in args.suite:
+            # Cold start does not depend on the diff size
+            for size in args.sizes if suite != "startup" else ["-"]:
+                sys.stdout = open(os.devnull, "w")
+                try:
+                    rows.extend(BENCHMARKS[suite](bench, size, args))
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+                print(f"finished {suite} {size}", file=sys.stderr)
+    finally:
+        bench.close()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(rows)
+    if args.import_profile:
+        from benchmarks.startup import import_profile
+        print("\nslowest imports of main (ms):")
+        for module, self_ms, cumulative_ms in import_profile("main", args.import_profile):
+            print(f"  {cumulative_ms:9.1f}  {self_ms:8.1f} self  {module}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    return rows
+
+
+if __name__ == "__main__":
+    main()
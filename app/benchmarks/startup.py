@@ -0,0 +1,103 @@
+# COLD START PROBE FOR THE WEB HANDLER
+# Run as a fresh interpreter per sample (python -m benchmarks.startup), so every import is paid again as on a cold
+# Lambda container: times importing main, the first health check and GitHub ping through main.handler with API Gateway
+# events, as Lambda invokes it, then importing the review pipeline
+import os
+import sys
+import json
+import time
+import uuid
+import resource
+import subprocess
+from types import SimpleNamespace
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+### CALLED BY: _first_requests, tests
+### PURPOSE: An API Gateway HTTP API (payload v2.0) event, as Lambda passes it to main.handler;
+###          kept here, without the fakes' imports, so the probe times only what main itself imports
+def api_gateway_event(method: str, path: str, headers: dict | None = None, body: dict | None = None) -> dict:
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": path,
+        "rawQueryString": "",
+        "headers": {"host": "bench.execute-api.us-east-1.amazonaws.com", "content-type": "application/json",
+                    **{name.lower(): value for name, value in (headers or {}).items()}},
+        "requestContext": {
+            "accountId": "123456789012",
+            "apiId": "bench",
+            "domainName": "bench.execute-api.us-east-1.amazonaws.com",
+            "http": {"method": method, "path": path, "protocol": "HTTP/1.1", "sourceIp": "192.0.2.1", "userAgent": "GitHub-Hookshot"},
+            "requestId": uuid.uuid4().hex,
+            "stage": "$default",
+        },
+        "body": json.dumps(body) if body is not None else None,
+        "isBase64Encoded": False,
+    }
+
+
+def _first_requests(handler) -> tuple[float, float]:
+    context = SimpleNamespace(function_name="bench", aws_request_id="bench", get_remaining_time_in_millis=lambda: 30000)
+    start = time.perf_counter()
+    handler(api_gateway_event("GET", "/"), context)
+    health = time.perf_counter() - start
+    start = time.perf_counter()
+    handler(api_gateway_event("POST", "/review", {"X-GitHub-Event": "ping", "X-GitHub-Delivery": uuid.uuid4().hex}, {"zen": "bench"}), context)
+    ping = time.perf_counter() - start
+    return health, ping
+
+
+def probe() -> dict:
+    start = time.perf_counter()
+    import main
+    import_main = time.perf_counter() - start
+    health, ping = _first_requests(main.handler)
+    start = time.perf_counter()
+    import agent_workflow.run_agent  # noqa: F401
+    import_pipeline = time.perf_counter() - start
+    return {
+        "import main": import_main,
+        "cold GET /": health,
+        "cold ping": ping,
+        "import pipeline": import_pipeline,
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+### CALLED BY: benchmarks.run
+### PURPOSE: Runs the probe in a fresh interpreter
+# @return: dict - Seconds per step, and the interpreter's peak resident memory in MB
+def cold_start_sample() -> dict:
+    # The S3 delivery log, as deployed on Lambda: a ping must not pay for boto3 or an S3 request
+    env = {**os.environ, "REVIEW_STATE_BACKEND": "s3"}
+    result = subprocess.run([sys.executable, "-m", "benchmarks.startup"], cwd=APP_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+### CALLED BY: benchmarks.run
+### PURPOSE: Profiles the imports of a module with -X importtime in a fresh interpreter
+# @param module: str - The module to import
+# @param top: int - The number of entries to return
+# @return: list[tuple[str, float, float]] - (module, self ms, cumulative ms), slowest cumulative first
+def import_profile(module: str = "main", top: int = 20) -> list[tuple[str, float, float]]:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=APP_DIR, capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    entries.sort(key=lambda entry: entry[2], reverse=True)
+    return entries[:top]
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, APP_DIR)
+    # The pipeline's own output would corrupt the result line
+    sys.stdout = open(os.devnull, "w")
+    sample = probe()
+    sys.stdout = sys.__stdout__
+    print(json.dumps(sample))
@@ -0,0 +1,134 @@
+# SYNTHETIC SOURCE TREES AND PULL REQUEST DIFFS FOR THE BENCHMARKS
+# Deterministic for a given seed, from single-file KB diffs up to 500-file MB diffs
+import os
+import random
+import difflib
+
+# name -> (files, lines per file)
+DIFF_PRESETS = {
+    "xs": (1, 60),
+    "s": (10, 200),
+    "m": (50, 400),
+    "l": (200, 600),
+    "xl": (500, 800),
+}
+
+_WORDS = ["value", "index", "result", "config", "buffer", "request", "payload", "cache", "count", "items",
+          "record", "offset", "limit", "token", "session", "handler", "state", "batch", "score", "window"]
+
+
+def _function(rng: random.Random, name: str, lines: int) -> list[str]:
+    body = [f"def {name}({rng.choice(_WORDS)}, {rng.choice(_WORDS)}=None):",
+            f'    """Computes the {rng.choice(_WORDS)} of the {rng.choice(_WORDS)}."""']
+    for _ in range(max(lines - 3, 1)):
+        left, right = rng.choice(_WORDS), rng.choice(_WORDS)
+        body.append(f"    {left} = {right} + {rng.randint(0, 999)}  # {rng.choice(_WORDS)} {rng.choice(_WORDS)}")
+    body.append(f"    return {rng.choice(_WORDS)}")
+    return body
+
+
+### CALLED BY: generate_pull_request, generate_repo
+### PURPOSE: Generates a Python-like module of roughly the given number of lines
+# @param rng: random.Random - The seeded generator
+# @param lines: int - The approximate number of lines
+# @return: list[str] - The module's lines
+def generate_module(rng: random.Random, lines: int) -> list[str]:
+    module = [f"import {rng.choice(['os', 'json', 'time', 're'])}", ""]
+    function_index = 0
+    while len(module) < lines:
+        module.extend(_function(rng, f"{rng.choice(_WORDS)}_{function_index}", rng.randint(6, 30)))
+        module.append("")
+        function_index += 1
+    return module
+
+
+def _mutate(rng: random.Random, lines: list[str], change_ratio: float) -> list[str]:
+    mutated = list(lines)
+    for _ in range(max(1, int(len(lines) * change_ratio / 5))):
+        # Edit a small block: replace, insert or delete a few lines
+        position = rng.randrange(len(mutated))
+        size = rng.randint(1, 5)
+        action = rng.random()
+        new_lines = [f"    {rng.choice(_WORDS)} = {rng.choice(_WORDS)} * {rng.randint(0, 99)}" for _ in range(size)]
+        if action < 0.5:
+            mutated[position:position + size] = new_lines
+        elif action < 0.8:
+            mutated[position:position] = new_lines
+        else:
+            del mutated[position:position + size]
+    return mutated
+
+
+def _file_diff(path: str, old: list[str] | None, new: list[str] | None) -> str:
+    header = [f"diff --git a/{path} b/{path}"]
+    if old is None:
+        header.append("new file mode 100644")
+    elif new is None:
+        header.append("deleted file mode 100644")
+    header.append("index 0000000..1111111 100644")
+    body = difflib.unified_diff(
+        [line + "\n" for line in old or []],
+        [line + "\n" for line in new or []],
+        fromfile=f"a/{path}" if old is not None else "/dev/null",
+        tofile=f"b/{path}" if new is not None else "/dev/null",
+        n=3
+    )
+    return "\n".join(header) + "\n" + "".join(body)
+
+
+def file_path(i: int) -> str:
+    return f"pkg{i % 10}/sub{i % 3}/module_{i}.py"
+
+
+### CALLED BY: benchmarks.run
+### PURPOSE: Generates a pull request: a unified diff plus the new contents of every changed file
+# 1. A fifth of the files are new, a few are deleted, the rest are edited in scattered small blocks
+# @param files: int - The number of files changed
+# @param lines_per_file: int - The approximate length of each file
+# @param change_ratio: float - The share of lines touched in edited files
+# @param seed: int - The random seed
+# @return: tuple[str, dict[str, str], dict[str, str]] - The diff, and the old and new contents by path
+def generate_pull_request(files: int, lines_per_file: int, change_ratio: float = 0.1,
+                          seed: int = 0) -> tuple[str, dict[str, str], dict[str, str]]:
+    rng = random.Random(seed)
+    diffs = []
+    old_contents = {}
+    new_contents = {}
+    for i in range(files):
+        path = file_path(i)
+        kind = rng.random()
+        if kind < 0.2:
+            new = generate_module(rng, lines_per_file)
+            diffs.append(_file_diff(path, None, new))
+            new_contents[path] = "\n".join(new) + "\n"
+        elif kind < 0.25 and files > 1:
+            old = generate_module(rng, lines_per_file)
+            diffs.append(_file_diff(path, old, None))
+            old_contents[path] = "\n".join(old) + "\n"
+        else:
+            old = generate_module(rng, lines_per_file)
+            new = _mutate(rng, old, change_ratio)
+            diffs.append(_file_diff(path, old, new))
+            old_contents[path] = "\n".join(old) + "\n"
+            new_contents[path] = "\n".join(new) + "\n"
+    return "".join(diffs), old_contents, new_contents
+
+
+### CALLED BY: benchmarks.run
+### PURPOSE: Writes a synthetic repository to disk for the bulk indexer
+# @param root: str - The directory to be created (its basename is the repo name)
+# @param files: int - The number of source files
+# @param lines_per_file: int - The approximate length of each file
+# @param seed: int - The random seed
+# @return: int - The total number of bytes written
+def generate_repo(root: str, files: int, lines_per_file: int, seed: int = 0) -> int:
+    rng = random.Random(seed)
+    total = 0
+    for i in range(files):
+        path = os.path.join(root, file_path(i))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        content = "\n".join(generate_module(rng, lines_per_file)) + "\n"
+        with open(path, "w") as f:
+            f.write(content)
+        total += len(content)
+    return total
@@ -0,0 +1,22 @@
+# BOUNDED EXECUTOR FOR BLOCKING SDK CALLS (PINECONE, BOTO3) MADE FROM ASYNC CODE
+# Keeps the event loop free so per-file reviews actually overlap
+from concurrent.futures import ThreadPoolExecutor
+import os
+import asyncio
+import functools
+import dotenv
+
+dotenv.load_dotenv()
+
+BLOCKING_IO_MAX_WORKERS = int(os.getenv("BLOCKING_IO_MAX_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_IO_MAX_WORKERS, thread_name_prefix="blocking-io")
+
+
+### CALLED BY: retrieve_context_from_diff, update_file_embeddings, initialize_chunk_store, embed_texts
+### PURPOSE: Runs a blocking call on the shared executor and awaits its result
+# @param func: callable - The blocking function to be run
+# @return: The return value of func
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,281 @@
+# PARALLEL, RESUMABLE BULK INDEXER FOR THE REPOSITORIES WATCHED BY THE GIT LINT SERVICE
+# Walks each tree once, chunks files across a process pool, and streams chunks through concurrent
+# batched embedding and upsert stages; a checkpoint of finished files lets a restart resume where it stopped
+from logic_functions.s3_upload import save_chunk_store_locally, upload_chunk_store_to_s3
+from logic_functions.chunk_store import ChunkStore
+from logic_functions.embedding_service import embed_chunks_batched
+from logic_functions.code_chunker import build_chunks, ChunkStats, SUPPORTED_EXTENSIONS
+from logic_functions.async_utils import run_blocking
+from logic_functions.vector_index import flush_vector_index
+from logic_functions.vector_writer import VectorWriter
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import json
+import time
+import asyncio
+import dotenv
+
+dotenv.load_dotenv()
+
+EXCLUDED_DIRS = {"node_modules", "venv", ".git", "build", "dist", "__pycache__",
+                 "Dockerfile", "docker-compose.yml", "deploy.sh", "requirements.txt",
+                 ".env", "data", "README.md", "docs", "logs", "tests", "tmp", "utils", "lib"}
+
+INDEX_CHECKPOINT_FILE = os.getenv("INDEX_CHECKPOINT_FILE", "index_checkpoint.json")
+INDEX_CHUNK_WORKERS = int(os.getenv("INDEX_CHUNK_WORKERS", str(os.cpu_count() or 4)))
+# Chunks handed to one embed_chunks_batched call, and number of such calls in flight
+INDEX_EMBED_BATCH_CHUNKS = int(os.getenv("INDEX_EMBED_BATCH_CHUNKS", "512"))
+INDEX_EMBED_WORKERS = int(os.getenv("INDEX_EMBED_WORKERS", "2"))
+# Vectors per upsert request, and number of upserters in flight
+INDEX_UPSERT_BATCH_VECTORS = int(os.getenv("INDEX_UPSERT_BATCH_VECTORS", "100"))
+INDEX_UPSERT_WORKERS = int(os.getenv("INDEX_UPSERT_WORKERS", "4"))
+# Seconds between checkpoint commits (chunk store flush + checkpoint file)
+INDEX_CHECKPOINT_INTERVAL = float(os.getenv("INDEX_CHECKPOINT_INTERVAL", "30"))
+# Bounded queues keep memory flat regardless of repo size
+QUEUE_SIZE = 4
+
+
+### CALLED BY: run_bulk_index, chunk_code_files
+### PURPOSE: Walks a repository once, pruning excluded directories, and yields indexable files
+# @param repo_path: str - The local path of the repository
+# @return: Iterator[str] - Repo-relative paths of supported source files
+def walk_repo(repo_path: str):
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+        for name in files:
+            if name in EXCLUDED_DIRS or os.path.splitext(name)[1] not in SUPPORTED_EXTENSIONS:
+                continue
+            yield os.path.relpath(os.path.join(root, name), repo_path)
+
+
+### CALLED BY: run_bulk_index (in a worker process), chunk_code_files
+### PURPOSE: Reads and chunks one file; top-level so it can be sent to a process pool
+# @param repo_path: str - The local path of the repository
+# @param rel_path: str - The repo-relative file path
+# @return: list[dict] - The file's chunks, with ids built from the repo-relative path
+def chunk_file(repo_path: str, rel_path: str) -> list[dict]:
+    with open(os.path.join(repo_path, rel_path), encoding="utf-8", errors="ignore") as f:
+        code = f.read()
+
+    repo_name = os.path.basename(os.path.normpath(repo_path))
+    return build_chunks(repo_name, rel_path, code)
+
+
+def _file_signature(repo_path: str, rel_path: str) -> list:
+    stat = os.stat(os.path.join(repo_path, rel_path))
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+### CALLED BY: _chunk_producer (through run_blocking)
+### PURPOSE: Lists the stored chunk ids of a re-chunked file that its new chunks no longer use
+# Chunk ids carry a hash of their content, so an edited file gets new ids and its old ones must be deleted explicitly
+# @param store: ChunkStore - The chunk store of the run
+# @param repo_name: str - The name of the repository
+# @param rel_path: str - The repo-relative file path
+# @param chunks: list[dict] - The file's new chunks
+# @return: list[str] - The ids to delete
+def _stale_chunk_ids(store: ChunkStore, repo_name: str, rel_path: str, chunks: list[dict]) -> list[str]:
+    current = {chunk["id"] for chunk in chunks}
+    return [chunk_id for chunk_id in store.ids_for_path(repo_name, rel_path) if chunk_id not in current]
+
+
+### CALLED BY: _chunk_producer (through run_blocking)
+### PURPOSE: Removes chunks deleted from the index from the chunk store, (re)loading the file's shard first
+def _pop_chunks(store: ChunkStore, repo_name: str, rel_path: str, chunk_ids: list[str]):
+    store.ensure_loaded(repo_name, [rel_path])
+    for chunk_id in chunk_ids:
+        store.pop(chunk_id, None)
+
+
+def load_checkpoint(path: str = INDEX_CHECKPOINT_FILE) -> dict:
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_checkpoint(checkpoint: dict, path: str = INDEX_CHECKPOINT_FILE):
+    # Written to a temporary file first, so a crash mid-write never corrupts the checkpoint
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_path, path)
+
+
+class _IndexRun:
+    """State shared by the pipeline stages of one bulk index run."""
+
+    def __init__(self, index, store: ChunkStore, checkpoint: dict, checkpoint_path: str):
+        self.index = index
+        self.writer = VectorWriter(index, concurrency=INDEX_UPSERT_WORKERS)
+        self.store = store
+        self.checkpoint = checkpoint
+        self.checkpoint_path = checkpoint_path
+        # (repo_path, rel_path) -> [chunks still to upsert, file signature]
+        self.pending = {}
+        self.completed = []
+        self.last_commit = time.monotonic()
+        self.commit_lock = asyncio.Lock()
+        self.stats = {"files": 0, "skipped": 0, "chunks": 0, "upserted": 0, "failed": 0}
+        self.chunk_stats = ChunkStats()
+
+    def register(self, repo_path: str, rel_path: str, signature: list, chunks: list[dict]):
+        chunk_count = len(chunks)
+        self.stats["files"] += 1
+        self.stats["chunks"] += chunk_count
+        self.chunk_stats.add(chunks)
+        if chunk_count == 0:
+            self.completed.append((repo_path, rel_path, signature))
+        else:
+            self.pending[(repo_path, rel_path)] = [chunk_count, signature]
+
+    def upserted(self, chunks: list[dict]):
+        self.stats["upserted"] += len(chunks)
+        for chunk in chunks:
+            key = chunk["_file"]
+            entry = self.pending[key]
+            entry[0] -= 1
+            if entry[0] == 0:
+                del self.pending[key]
+                self.completed.append((*key, entry[1]))
+
+    ### CALLED BY: _upsert_worker, run_bulk_index
+    ### PURPOSE: Flushes the chunk store (and a local vector index), then records completed files in the checkpoint, in that order,
+    ###          so a file is only ever checkpointed once its chunks are durable
+    # Flushed shards are evicted (and a local index drops its flushed log), so memory does not grow with the number of files
+    async def commit(self, force: bool = False):
+        async with self.commit_lock:
+            if not force and time.monotonic() - self.last_commit < INDEX_CHECKPOINT_INTERVAL:
+                return
+            completed, self.completed = self.completed, []
+            await run_blocking(upload_chunk_store_to_s3, self.store)
+            await run_blocking(flush_vector_index, self.index)
+            await run_blocking(self.store.evict_flushed)
+            for repo_path, rel_path, signature in completed:
+                self.checkpoint.setdefault(repo_path, {})[rel_path] = signature
+            await run_blocking(save_checkpoint, self.checkpoint, self.checkpoint_path)
+            self.last_commit = time.monotonic()
+            print(f"Checkpoint: {self.stats['files']} files chunked, {self.stats['upserted']}/{self.stats['chunks']} chunks upserted")
+
+
+async def _chunk_producer(run: _IndexRun, repo_paths: list[str], pool: ProcessPoolExecutor, chunk_queue: asyncio.Queue):
+    loop = asyncio.get_running_loop()
+    in_flight = asyncio.Semaphore(INDEX_CHUNK_WORKERS * 2)
+
+    async def chunk_one(repo_path, rel_path, signature):
+        try:
+            chunks = await loop.run_in_executor(pool, chunk_file, repo_path, rel_path)
+        except Exception as e:
+            print(f"⚠️ Error reading {rel_path}: {e}")
+            run.stats["failed"] += 1
+            return
+        finally:
+            in_flight.release()
+        # A file chunked before (e.g. edited since its checkpoint) leaves behind the chunks its new version no longer has
+        repo_name = os.path.basename(os.path.normpath(repo_path))
+        stale = await run_blocking(_stale_chunk_ids, run.store, repo_name, rel_path, chunks)
+        if stale:
+            deleted = await run.writer.delete(stale)
+            await run_blocking(_pop_chunks, run.store, repo_name, rel_path, deleted)
+            if len(deleted) < len(stale):
+                # Left out of the checkpoint, so the next run retries the delete
+                print(f"⚠️ Could not delete {len(stale) - len(deleted)} stale chunks of {rel_path}")
+                run.stats["failed"] += 1
+                return
+        run.register(repo_path, rel_path, signature, chunks)
+        for chunk in chunks:
+            chunk["_file"] = (repo_path, rel_path)
+        if chunks:
+            await chunk_queue.put(chunks)
+
+    # Only unfinished tasks are kept, so memory does not grow with the number of files
+    tasks = set()
+    for repo_path in repo_paths:
+        done_files = run.checkpoint.get(repo_path, {})
+        for rel_path in walk_repo(repo_path):
+            signature = _file_signature(repo_path, rel_path)
+            if done_files.get(rel_path) == signature:
+                run.stats["skipped"] += 1
+                continue
+            await in_flight.acquire()
+            task = asyncio.create_task(chunk_one(repo_path, rel_path, signature))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+
+
+async def _embed_worker(chunk_queue: asyncio.Queue, upsert_queue: asyncio.Queue):
+    batch = []
+    while True:
+        chunks = await chunk_queue.get()
+        if chunks is not None:
+            batch.extend(chunks)
+        if batch and (chunks is None or len(batch) >= INDEX_EMBED_BATCH_CHUNKS):
+            embedded = await embed_chunks_batched(batch)
+            for start in range(0, len(embedded), INDEX_UPSERT_BATCH_VECTORS):
+                await upsert_queue.put(embedded[start:start + INDEX_UPSERT_BATCH_VECTORS])
+            batch = []
+        chunk_queue.task_done()
+        if chunks is None:
+            return
+
+
+async def _upsert_worker(run: _IndexRun, upsert_queue: asyncio.Queue):
+    while True:
+        chunks = await upsert_queue.get()
+        if chunks is None:
+            upsert_queue.task_done()
+            return
+        # Retried per batch; the files of a batch that still fails stay out of the checkpoint, so the next run retries them
+        written = await run.writer.upsert(chunks)
+        await run_blocking(save_chunk_store_locally, written, run.store)
+        run.upserted(written)
+        await run.commit()
+        upsert_queue.task_done()
+
+
+### CALLED BY: embeddings.py __main__
+### PURPOSE: Indexes whole repositories into the vector index and chunk store, resumably
+# 1. Walk each repository once, skipping files unchanged since they were checkpointed
+# 2. Chunk files in a process pool, streaming chunks into bounded queues
+# 3. Embed in batches (through the embedding cache) and upsert in batches, concurrently
+# 4. Periodically flush the chunk store and checkpoint the files whose chunks are all upserted
+# 5. Fold the chunk store segments written by those flushes into snapshots
+# @param repo_paths: list[str] - Local paths of the repositories to be indexed
+# @param index: The vector index to upsert into
+# @param checkpoint_path: str - Where progress is recorded between runs
+# @return: dict - Run statistics
+async def run_bulk_index(repo_paths: list[str], index, checkpoint_path: str = INDEX_CHECKPOINT_FILE) -> dict:
+    store = ChunkStore()
+    await run_blocking(store.load_manifest)
+    run = _IndexRun(index, store, load_checkpoint(checkpoint_path), checkpoint_path)
+
+    chunk_queue = asyncio.Queue(maxsize=QUEUE_SIZE * INDEX_EMBED_WORKERS)
+    upsert_queue = asyncio.Queue(maxsize=QUEUE_SIZE * INDEX_UPSERT_WORKERS)
+    embedders = [asyncio.create_task(_embed_worker(chunk_queue, upsert_queue)) for _ in range(INDEX_EMBED_WORKERS)]
+    upserters = [asyncio.create_task(_upsert_worker(run, upsert_queue)) for _ in range(INDEX_UPSERT_WORKERS)]
+
+    with ProcessPoolExecutor(max_workers=INDEX_CHUNK_WORKERS) as pool:
+        await _chunk_producer(run, repo_paths, pool, chunk_queue)
+
+    # Drain the stages in order: one stop marker per worker
+    for _ in embedders:
+        await chunk_queue.put(None)
+    await asyncio.gather(*embedders)
+    for _ in upserters:
+        await upsert_queue.put(None)
+    await asyncio.gather(*upserters)
+
+    await run.commit(force=True)
+    # Periodic commits each append a segment per shard; fold them into snapshots before readers replay them
+    await run_blocking(store.compact, 1)
+    run.stats["incomplete"] = len(run.pending)
+    run.stats["chunk_sizes"] = run.chunk_stats.summary()
+    print(f"\nFinished indexing.")
+    print(f"--Files chunked: {run.stats['files']}")
+    print(f"--Files unchanged since checkpoint: {run.stats['skipped']}")
+    print(f"--Chunks upserted: {run.stats['upserted']}/{run.stats['chunks']}")
+    print(f"--Chunk sizes: {run.chunk_stats}")
+    print(f"--Files left for the next run: {run.stats['incomplete'] + run.stats['failed']}")
+    return run.stats
@@ -0,0 +1,542 @@
+# SHARDED CHUNK STORE: FULL CHUNK TEXTS FOR EVERY INDEXED FILE, SPLIT BY REPO AND PATH PREFIX
+# A small manifest lists the shards; only the shards a review touches are downloaded and parsed.
+# Each shard is a base snapshot plus an append-only log of gzipped delta segments (the adds and deletes of one flush),
+# replayed in order on load. A flush writes only its own segments, then publishes the manifest with a conditional
+# write, so concurrent reviews append to the log instead of overwriting each other; compaction folds a shard's
+# segments back into a new snapshot.
+# Loaded shards stay in memory across warm invocations and are revalidated through the manifest ETag.
+from logic_functions.s3_upload import get_s3_object, put_s3_object, delete_s3_object, CHUNK_STORE_PREFIX, CHUNK_STORE_MANIFEST_KEY, LEGACY_CHUNK_STORE_KEY
+from logic_functions.telemetry import span, metrics
+
+from urllib.parse import quote
+import os
+import copy
+import gzip
+import json
+import time
+import uuid
+import logging
+import threading
+import dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+
+# Number of leading directories of a path that pick its shard, e.g. "app/logic_functions" for depth 2
+CHUNK_STORE_SHARD_DEPTH = int(os.getenv("CHUNK_STORE_SHARD_DEPTH", "2"))
+ROOT_SHARD = "_root"
+# A shard whose log reaches this many segments is folded into a new snapshot by the next compaction
+CHUNK_STORE_COMPACT_SEGMENTS = int(os.getenv("CHUNK_STORE_COMPACT_SEGMENTS", "16"))
+# Attempts at publishing the manifest when other writers keep changing it underneath
+CHUNK_STORE_PUBLISH_ATTEMPTS = int(os.getenv("CHUNK_STORE_PUBLISH_ATTEMPTS", "10"))
+# Repo of legacy chunk_s3.json records whose vector cannot be found in the index; records are skipped if unset
+LEGACY_CHUNK_STORE_REPO = os.getenv("LEGACY_CHUNK_STORE_REPO")
+# Ids per vector index fetch when looking up the repo of legacy records
+LEGACY_FETCH_BATCH_IDS = 100
+
+MANIFEST_VERSION = 2
+
+
+### CALLED BY: ChunkStore
+### PURPOSE: Maps a file path to the name of the shard holding its chunks
+# @param path: str - The repo-relative file path
+# @return: str - The leading directories of the path, or ROOT_SHARD for top-level files
+def shard_for_path(path: str) -> str:
+    directories = path.strip("/").split("/")[:-1]
+    return "/".join(directories[:CHUNK_STORE_SHARD_DEPTH]) or ROOT_SHARD
+
+
+def _object_key(repo: str, shard: str, kind: str) -> str:
+    # Versioned keys: every snapshot and segment is a new object, never overwritten
+    version = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+    return f"{CHUNK_STORE_PREFIX}/{quote(repo, safe='')}/{quote(shard, safe='')}/{kind}-{version}.json.gz"
+
+
+def _encode(data) -> bytes:
+    return gzip.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), compresslevel=6)
+
+
+def _decode(body: bytes):
+    # Shards written before the delta log are plain JSON snapshots
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+def _empty_manifest() -> dict:
+    return {"version": MANIFEST_VERSION, "repos": {}}
+
+
+def _entry_state(entry: dict | None) -> tuple:
+    # What a shard's content is built from; older manifests list a single snapshot under "key"
+    if entry is None:
+        return None, ()
+    return entry.get("base", entry.get("key")), tuple(entry.get("segments", ()))
+
+
+def _apply_segment(records: dict, segment: dict):
+    for chunk_id in segment.get("delete", ()):
+        records.pop(chunk_id, None)
+    records.update(segment.get("put", {}))
+
+
+def _legacy_repos(chunk_ids: list[str]) -> dict:
+    # chunk id -> repo, from the metadata every indexed vector carries
+    if not chunk_ids:
+        return {}
+    from logic_functions.clients import get_client
+    index = get_client("vector_index")
+    if not hasattr(index, "fetch"):
+        return {}
+    repos = {}
+    for start in range(0, len(chunk_ids), LEGACY_FETCH_BATCH_IDS):
+        try:
+            response = index.fetch(ids=chunk_ids[start:start + LEGACY_FETCH_BATCH_IDS])
+        except Exception as e:
+            logger.warning(f"Could not look up the repo of legacy chunks: {e}")
+            continue
+        vectors = response["vectors"] if isinstance(response, dict) else response.vectors
+        for chunk_id, vector in vectors.items():
+            metadata = vector["metadata"] if isinstance(vector, dict) else vector.metadata
+            if metadata and metadata.get("repo"):
+                repos[chunk_id] = metadata["repo"]
+    return repos
+
+
+class _MissingObject(Exception):
+    """A snapshot or segment listed in the manifest is gone, e.g. removed by a compaction after the manifest was read."""
+
+
+class ChunkStore:
+    """Chunk id -> {"text", "path", "chunk_id", "repo"} records, lazily loaded per (repo, shard)."""
+
+    def __init__(self):
+        self.manifest = _empty_manifest()
+        self.manifest_etag = None
+        self._shards = {}
+        self._locations = {}
+        # Secondary index: (repo, path) -> chunk ids, covering loaded shards
+        self._by_path = {}
+        # (repo, shard) -> the (base, segments) a loaded shard was built from
+        self._applied = {}
+        # (repo, shard) -> {"put": {chunk id: record}, "delete": set of chunk ids} not yet flushed
+        self._pending = {}
+        # The pending changes taken by the flush in progress, until its manifest is published
+        self._flushing = {}
+        # Shards are loaded from executor threads by concurrent reviews; the lock is never held across S3 calls
+        self._lock = threading.RLock()
+        # One flush at a time, so the changes in flight are a single snapshot
+        self._flush_lock = threading.Lock()
+
+    ### CALLED BY: initialize_chunk_store, run_bulk_index
+    ### PURPOSE: Fetches the manifest with a conditional GET and evicts loaded shards whose log changed
+    # 1. Skip everything if the manifest is unchanged since the last load or upload
+    # 2. Otherwise keep loaded shards built from the current snapshot and segments, and drop the rest
+    # @return: bool - Whether a new manifest was loaded
+    def load_manifest(self) -> bool:
+        body, etag = get_s3_object(CHUNK_STORE_MANIFEST_KEY, if_none_match=self.manifest_etag)
+        if body is None and etag is not None:
+            return False
+
+        if body is None:
+            if self.manifest_etag is None and self._import_legacy_store():
+                return True
+            logger.warning("No chunk store manifest found in S3, starting with an empty store")
+            manifest = _empty_manifest()
+        else:
+            manifest = json.loads(body)
+
+        with self._lock:
+            self._adopt_manifest(manifest, etag)
+        return True
+
+    ### CALLED BY: load_manifest
+    ### PURPOSE: One-time migration of the pre-sharding chunk_s3.json into shards, so its vectors stay matched and deletable
+    # 1. Records written before "repo" was stored take it from their vector's metadata (or LEGACY_CHUNK_STORE_REPO)
+    # 2. Write the records as segments and publish the first manifest; chunk_s3.json itself is left in place
+    # @return: bool - Whether a legacy store was found and imported
+    def _import_legacy_store(self) -> bool:
+        body, _ = get_s3_object(LEGACY_CHUNK_STORE_KEY)
+        if body is None:
+            return False
+        records = json.loads(body)
+        print(f"[PROCESS]: No chunk store manifest; importing {len(records)} chunks from legacy {LEGACY_CHUNK_STORE_KEY}")
+
+        repos = _legacy_repos([chunk_id for chunk_id, record in records.items() if not record.get("repo")])
+        skipped = 0
+        for chunk_id, record in records.items():
+            repo = record.get("repo") or repos.get(chunk_id) or LEGACY_CHUNK_STORE_REPO
+            if not repo or not record.get("path"):
+                skipped += 1
+                continue
+            self.put(repo, chunk_id, {**record, "repo": repo})
+
+        # Publishes the manifest even if nothing could be imported, so the migration runs once
+        if not self.flush():
+            self._publish(lambda manifest: None)
+        if skipped:
+            logger.warning(f"Skipped {skipped} legacy chunks with no known repo; set LEGACY_CHUNK_STORE_REPO or re-index them")
+        print(f"[PROCESS]: Imported {len(records) - skipped} legacy chunks into the sharded chunk store")
+        return True
+
+    def _adopt_manifest(self, manifest: dict, etag: str | None):
+        # Unflushed changes survive eviction: they are re-applied when the shard is loaded again
+        for repo, shard in list(self._shards):
+            entry = manifest["repos"].get(repo, {}).get(shard)
+            if _entry_state(entry) != self._applied.get((repo, shard)):
+                self._evict_shard(repo, shard)
+        self.manifest = manifest
+        self.manifest_etag = etag
+
+    def _evict_shard(self, repo: str, shard: str):
+        self._applied.pop((repo, shard), None)
+        # Locations go first, so an unlocked get() never finds a chunk whose shard is already gone
+        for chunk_id, record in self._shards.get((repo, shard), {}).items():
+            self._locations.pop(chunk_id, None)
+            self._unindex(repo, chunk_id, record)
+        self._shards.pop((repo, shard), None)
+
+    def _index(self, repo: str, chunk_id: str, record: dict):
+        self._by_path.setdefault((repo, record["path"]), set()).add(chunk_id)
+
+    def _unindex(self, repo: str, chunk_id: str, record: dict):
+        ids = self._by_path.get((repo, record["path"]))
+        if ids is not None:
+            ids.discard(chunk_id)
+            if not ids:
+                del self._by_path[(repo, record["path"])]
+
+    def _read_object(self, key: str):
+        body, _ = get_s3_object(key)
+        if body is None:
+            raise _MissingObject(key)
+        return _decode(body)
+
+    ### CALLED BY: _load_shard, compact
+    ### PURPOSE: Rebuilds a shard from S3: its base snapshot, then every segment in order
+    # @param state: tuple - (base key or None, segment keys)
+    # @return: dict - The shard's records
+    def _read_shard(self, state: tuple) -> dict:
+        base, segments = state
+        records = self._read_object(base) if base else {}
+        for key in segments:
+            _apply_segment(records, self._read_object(key))
+        return records
+
+    def _load_shard(self, repo: str, shard: str) -> dict:
+        key = (repo, shard)
+        for attempt in range(3):
+            with self._lock:
+                if key in self._shards:
+                    return self._shards[key]
+                state = _entry_state(self.manifest["repos"].get(repo, {}).get(shard))
+
+            # Download outside the lock so concurrent reviews can fetch different shards in parallel
+            try:
+                records = self._read_shard(state)
+            except _MissingObject as e:
+                logger.warning(f"Chunk store object {e} listed in manifest but missing from S3, reloading manifest")
+                if attempt < 2:
+                    self.load_manifest()
+                    continue
+                records = {}
+
+            with self._lock:
+                if key in self._shards:
+                    return self._shards[key]
+                if attempt < 2 and _entry_state(self.manifest["repos"].get(repo, {}).get(shard)) != state:
+                    # A flush published a newer log for this shard while it was downloading
+                    continue
+                # Changes in flight may or may not be in the log read; replaying them again is harmless
+                for pending in (self._flushing.get(key), self._pending.get(key)):
+                    if pending:
+                        _apply_segment(records, pending)
+                self._shards[key] = records
+                self._applied[key] = state
+                for chunk_id, record in records.items():
+                    self._locations[chunk_id] = key
+                    # The shard's repo is authoritative, including for records written before "repo" was stored
+                    self._index(repo, chunk_id, record)
+                return records
+
+    ### CALLED BY: retrieve_context_from_diff, update_file_embeddings
+    ### PURPOSE: Loads the shards covering the given paths of a repo (or every shard of the repo if paths is None)
+    # @param repo: str - The name of the repository
+    # @param paths: list[str] | None - The repo-relative file paths that will be read or written
+    def ensure_loaded(self, repo: str, paths: list[str] | None = None):
+        if paths is None:
+            shards = list(self.manifest["repos"].get(repo, {}))
+        else:
+            shards = {shard_for_path(path) for path in paths}
+        self.ensure_shards_loaded(repo, shards)
+
+    def ensure_shards_loaded(self, repo: str, shards):
+        for shard in shards:
+            self._load_shard(repo, shard)
+
+    def get(self, chunk_id: str, default=None):
+        key = self._locations.get(chunk_id)
+        if key is None:
+            return default
+        return self._shards.get(key, {}).get(chunk_id, default)
+
+    def __getitem__(self, chunk_id: str) -> dict:
+        record = self.get(chunk_id)
+        if record is None:
+            raise KeyError(chunk_id)
+        return record
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._locations
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def items(self):
+        """Iterates over the chunks of loaded shards only."""
+        for records in list(self._shards.values()):
+            yield from list(records.items())
+
+    ### CALLED BY: update_file_embeddings, run_bulk_index
+    ### PURPOSE: Lists the chunk ids of one file through the (repo, path) index, loading its shard if needed
+    # @param repo: str - The name of the repository
+    # @param path: str - The repo-relative file path
+    # @return: list[str] - The ids of the file's chunks
+    def ids_for_path(self, repo: str, path: str) -> list[str]:
+        self._load_shard(repo, shard_for_path(path))
+        with self._lock:
+            return list(self._by_path.get((repo, path), ()))
+
+    def _pending_for(self, key: tuple) -> dict:
+        return self._pending.setdefault(key, {"put": {}, "delete": set()})
+
+    ### CALLED BY: update_file_embeddings, save_chunk_store_locally
+    ### PURPOSE: Adds or replaces a chunk, and records the change for the next flush
+    # @param repo: str - The name of the repository the chunk belongs to
+    # @param chunk_id: str - The id of the chunk (same as its vector id)
+    # @param record: dict - The chunk record, which must contain "path"
+    def put(self, repo: str, chunk_id: str, record: dict):
+        shard = shard_for_path(record["path"])
+        key = (repo, shard)
+        while True:
+            records = self._load_shard(repo, shard)
+            with self._lock:
+                if self._shards.get(key) is not records:
+                    # Evicted by a manifest adopted since it was loaded; writing to it would orphan the record
+                    continue
+                if chunk_id in self._locations:
+                    self.pop(chunk_id)
+                records[chunk_id] = record
+                self._locations[chunk_id] = key
+                self._index(repo, chunk_id, record)
+                pending = self._pending_for(key)
+                pending["delete"].discard(chunk_id)
+                pending["put"][chunk_id] = record
+                return
+
+    def pop(self, chunk_id: str, default=None):
+        with self._lock:
+            key = self._locations.pop(chunk_id, None)
+            if key is None:
+                return default
+            record = self._shards.get(key, {}).pop(chunk_id, None)
+            if record is None:
+                return default
+            self._unindex(key[0], chunk_id, record)
+            pending = self._pending_for(key)
+            pending["put"].pop(chunk_id, None)
+            pending["delete"].add(chunk_id)
+            return record
+
+    ### CALLED BY: _flush, compact
+    ### PURPOSE: Applies a change to the manifest and publishes it with a conditional write, retrying on conflicts
+    # 1. Apply the change to a copy of the manifest this store last saw, and write it only if S3 still holds that version
+    # 2. If another writer got there first, adopt its manifest (evicting shards its segments changed) and go again
+    # @param change: callable - Mutates a manifest in place; returns False to give up (e.g. it no longer applies)
+    # @return: bool - Whether the change was published
+    def _publish(self, change) -> bool:
+        for attempt in range(CHUNK_STORE_PUBLISH_ATTEMPTS):
+            with self._lock:
+                manifest = copy.deepcopy(self.manifest)
+                base_etag = self.manifest_etag
+            manifest["version"] = MANIFEST_VERSION
+            if change(manifest) is False:
+                return False
+            body = json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+            if base_etag:
+                etag = put_s3_object(CHUNK_STORE_MANIFEST_KEY, body, if_match=base_etag)
+            else:
+                etag = put_s3_object(CHUNK_STORE_MANIFEST_KEY, body, if_none_match="*")
+            if etag is not None:
+                with self._lock:
+                    # Kept, so the next revalidation in this container is a 304 (unless a newer one was adopted meanwhile)
+                    if self.manifest_etag == base_etag:
+                        self.manifest = manifest
+                        self.manifest_etag = etag
+                return True
+
+            metrics.inc("chunk_store_manifest_conflicts_total", help="Chunk store manifest writes retried after a concurrent update")
+            logger.info(f"Chunk store manifest changed concurrently, merging (attempt {attempt + 1})")
+            latest, latest_etag = get_s3_object(CHUNK_STORE_MANIFEST_KEY)
+            with self._lock:
+                self._adopt_manifest(json.loads(latest) if latest is not None else _empty_manifest(), latest_etag)
+        raise RuntimeError(f"Could not publish the chunk store manifest after {CHUNK_STORE_PUBLISH_ATTEMPTS} attempts")
+
+    ### CALLED BY: upload_chunk_store_to_s3, _import_legacy_store
+    ### PURPOSE: Appends one delta segment per modified shard, then publishes them in the manifest
+    # 1. Take the pending changes under the lock; changes made from here on go to the next flush
+    # 2. Write the segments and publish the manifest without holding the lock, so readers and writers carry on
+    # 3. If anything failed, put the taken changes back under the ones made since
+    # @return: int - The number of segments written
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                self._flushing = {key: pending for key, pending in self._pending.items() if pending["put"] or pending["delete"]}
+                self._pending = {}
+            published = {}
+            done = False
+            try:
+                written = self._flush(self._flushing, published)
+                done = True
+                return written
+            finally:
+                with self._lock:
+                    if done:
+                        self._mark_published(published)
+                    else:
+                        self._restore_pending(self._flushing)
+                    self._flushing = {}
+
+    def _flush(self, flushing: dict, published: dict) -> int:
+        segments = {}
+        with span("chunk_store.flush", shards=len(flushing)) as attributes:
+            for (repo, shard), pending in sorted(flushing.items()):
+                key = _object_key(repo, shard, "segment")
+                body = _encode({"put": pending["put"], "delete": sorted(pending["delete"])})
+                put_s3_object(key, body)
+                segments[(repo, shard)] = key
+                metrics.inc("chunk_store_bytes_written_total", len(body), help="Compressed bytes written to the chunk store", kind="segment")
+            attributes["segments"] = len(segments)
+            if not segments:
+                return 0
+
+            def append_segments(manifest: dict):
+                for (repo, shard), key in segments.items():
+                    base, log = _entry_state(manifest["repos"].get(repo, {}).get(shard))
+                    entry = {"base": base, "segments": [*log, key]}
+                    records = self._shards.get((repo, shard))
+                    if records is not None:
+                        # Informational: exact unless another writer changed the shard concurrently
+                        entry["count"] = len(records)
+                    manifest["repos"].setdefault(repo, {})[shard] = entry
+                    # Overwritten on each attempt, so what remains is what was published
+                    published[(repo, shard)] = entry
+
+            self._publish(append_segments)
+
+        metrics.inc("chunk_store_segments_written_total", len(segments), help="Chunk store delta segments appended")
+        return len(segments)
+
+    def _mark_published(self, published: dict):
+        # A loaded shard built from the log just before this flush's segment now holds exactly the published log
+        for key, entry in published.items():
+            state = _entry_state(entry)
+            if key in self._shards and self._applied.get(key) == (state[0], state[1][:-1]):
+                self._applied[key] = state
+
+    ### CALLED BY: _IndexRun.commit
+    ### PURPOSE: Drops the loaded shards holding no unflushed changes, so a long bulk run keeps only the shards it is writing
+    # A shard dropped here is reloaded from its published log the next time it is read or written
+    # @return: int - The number of shards evicted
+    def evict_flushed(self) -> int:
+        with self._lock:
+            flushed = [key for key in self._shards
+                       if not any(changes.get(key) and (changes[key]["put"] or changes[key]["delete"])
+                                  for changes in (self._pending, self._flushing))]
+            for repo, shard in flushed:
+                self._evict_shard(repo, shard)
+            return len(flushed)
+
+    def _restore_pending(self, flushing: dict):
+        # Changes made during the failed flush are newer, so they win over the ones put back
+        for key, old in flushing.items():
+            new = self._pending.get(key)
+            if new is None:
+                self._pending[key] = old
+                continue
+            put = {chunk_id: record for chunk_id, record in old["put"].items() if chunk_id not in new["delete"]}
+            put.update(new["put"])
+            self._pending[key] = {"put": put, "delete": (old["delete"] - set(new["put"])) | new["delete"]}
+
+    ### CALLED BY: update_file_embeddings, run_bulk_index
+    ### PURPOSE: Lists the shards whose log is long enough to be compacted
+    # @param min_segments: int - The number of segments from which a shard is compacted
+    # @return: list[tuple[str, str]] - (repo, shard) pairs
+    def compaction_candidates(self, min_segments: int = CHUNK_STORE_COMPACT_SEGMENTS) -> list[tuple[str, str]]:
+        with self._lock:
+            return [(repo, shard) for repo, shards in self.manifest["repos"].items()
+                    for shard, entry in shards.items() if len(_entry_state(entry)[1]) >= min_segments]
+
+    ### CALLED BY: update_file_embeddings (in the background), run_bulk_index
+    ### PURPOSE: Folds the segments of long logs into new base snapshots
+    # 1. Rebuild each candidate shard from S3 and write it as a new snapshot
+    # 2. Publish it in place of the old base and the folded segments; segments appended meanwhile stay in the log
+    # 3. Delete the superseded objects (a reader still holding the old manifest reloads it when they are gone)
+    # @param min_segments: int - The number of segments from which a shard is compacted
+    # @param deadline: float | None - time.monotonic() after which no further shard is started
+    # @return: int - The number of shards compacted
+    def compact(self, min_segments: int = CHUNK_STORE_COMPACT_SEGMENTS, deadline: float | None = None) -> int:
+        compacted = 0
+        for repo, shard in self.compaction_candidates(min_segments):
+            if deadline is not None and time.monotonic() > deadline:
+                logger.info(f"Compaction time box reached; {repo}/{shard} and later shards are left for the next one")
+                break
+            with self._lock:
+                state = _entry_state(self.manifest["repos"].get(repo, {}).get(shard))
+            base, folded = state
+            with span("chunk_store.compact", repo=repo, shard=shard, segments=len(folded)):
+                try:
+                    records = self._read_shard(state)
+                except _MissingObject as e:
+                    # Another process compacted this shard first
+                    logger.info(f"Skipping compaction of {repo}/{shard}: {e} is gone")
+                    continue
+                new_base = _object_key(repo, shard, "base") if records else None
+                if new_base:
+                    body = _encode(records)
+                    put_s3_object(new_base, body)
+                    metrics.inc("chunk_store_bytes_written_total", len(body), help="Compressed bytes written to the chunk store", kind="base")
+
+                def replace_log(manifest: dict):
+                    entry = manifest["repos"].get(repo, {}).get(shard)
+                    current_base, log = _entry_state(entry)
+                    if current_base != base or log[:len(folded)] != folded:
+                        return False
+                    remaining = list(log[len(folded):])
+                    if new_base is None and not remaining:
+                        # Drop emptied shards instead of keeping empty logs around
+                        del manifest["repos"][repo][shard]
+                        if not manifest["repos"][repo]:
+                            del manifest["repos"][repo]
+                    else:
+                        manifest["repos"][repo][shard] = {"base": new_base, "segments": remaining, "count": len(records)}
+
+                published = self._publish(replace_log)
+                with self._lock:
+                    if published and (repo, shard) in self._shards and self._applied.get((repo, shard)) == state:
+                        # The loaded copy holds exactly the folded log; it now stands for the new snapshot
+                        self._applied[(repo, shard)] = (new_base, ())
+
+            if not published:
+                logger.info(f"Skipping compaction of {repo}/{shard}: its log was compacted concurrently")
+                if new_base:
+                    delete_s3_object(new_base)
+                continue
+            for key in ([base] if base else []) + list(folded):
+                delete_s3_object(key)
+            compacted += 1
+            metrics.inc("chunk_store_compactions_total", help="Chunk store shards compacted into a new snapshot")
+            print(f"✅ Compacted {len(folded)} segment(s) of {repo}/{shard} into a snapshot of {len(records)} chunks")
+        return compacted
@@ -0,0 +1,80 @@
+# LAZILY CONSTRUCTED CLIENTS SHARED BY THE WHOLE PROCESS
+# Nothing is imported or connected until a client is first used, so a cold start that only answers a health
+# check or a GitHub ping never pays for boto3, the OpenAI SDK or the vector index
+import os
+import threading
+import dotenv
+
+dotenv.load_dotenv()
+
+_factories = {}
+_clients = {}
+# Reentrant: building the local vector index reads its snapshot through the "s3" client
+_lock = threading.RLock()
+
+
+### CALLED BY: this module, and anything that needs another shared client
+### PURPOSE: Registers how to build a client; it is built on the first get_client
+# @param name: str - The client name
+# @param factory: callable - Zero-argument function returning the client
+def register_client(name: str, factory):
+    _factories[name] = factory
+
+
+### CALLED BY: s3_upload, embedding_service, diff_functions, job_queue
+### PURPOSE: Returns the named client, building it on first use (once, even under concurrent first calls)
+# @param name: str - The client name ("s3", "sqs", "openai" or "vector_index")
+# @return: The shared client
+def get_client(name: str):
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _lock:
+        if name not in _clients:
+            if name not in _factories:
+                raise KeyError(f"Unknown client: {name}")
+            _clients[name] = _factories[name]()
+        return _clients[name]
+
+
+### CALLED BY: benchmarks, tests
+### PURPOSE: Installs a client (e.g. a local stand-in) in place of the one the factory would build
+def set_client(name: str, client):
+    with _lock:
+        _clients[name] = client
+
+
+### CALLED BY: benchmarks, tests
+### PURPOSE: Drops built clients, so the next get_client rebuilds them
+# @param names: str - The clients to drop; all of them if none are given
+def reset_clients(*names: str):
+    with _lock:
+        for name in names or list(_clients):
+            _clients.pop(name, None)
+
+
+def _s3():
+    import boto3
+    return boto3.client("s3")
+
+
+def _sqs():
+    import boto3
+    return boto3.client("sqs")
+
+
+def _openai():
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+def _vector_index():
+    from logic_functions.vector_index import open_vector_index
+    return open_vector_index()
+
+
+register_client("s3", _s3)
+register_client("sqs", _sqs)
+register_client("openai", _openai)
+# Pinecone, or the in-process index when VECTOR_INDEX_BACKEND=local
+register_client("vector_index", _vector_index)
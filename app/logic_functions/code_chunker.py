@@ -0,0 +1,287 @@
+# LANGUAGE-AWARE SOURCE CHUNKER SHARED BY INCREMENTAL RE-INDEXING AND THE BULK INDEXER
+# Splits source into whole definitions (Python via ast; JavaScript and Java via a brace tokenizer that skips strings
+# and comments), then merges small neighbours up to a target size and splits oversized definitions at their members
+# (a class's methods keep the class header as a prefix) or, failing that, at line boundaries
+from logic_functions.embedding_service import estimate_tokens
+from logic_functions.embedding_cache import hash_content
+
+import os
+import ast
+import dotenv
+
+dotenv.load_dotenv()
+
+# File extension -> language; also the files the indexers consider
+SUPPORTED_EXTENSIONS = {
+    ".py": "python",
+    ".js": "javascript",
+    ".java": "java",
+}
+
+# Chunks are packed up to the target; a single definition may run to the maximum before it is split,
+# and a chunk under the minimum is folded into its neighbour when they fit together
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "64"))
+CHUNK_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", "400"))
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "800"))
+# Chunks shorter than this (e.g. an empty __init__.py) carry nothing worth retrieving
+CHUNK_MIN_CHARS = 50
+
+
+class _Unit:
+    """A piece of source, plus the enclosing header (e.g. its class line) repeated in front of it."""
+    __slots__ = ("prefix", "body")
+
+    def __init__(self, prefix: str, body: str):
+        self.prefix = prefix
+        self.body = body
+
+    @property
+    def text(self) -> str:
+        return self.prefix + self.body
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+def _split_lines(prefix: str, text: str) -> list[_Unit]:
+    # Last resort for a definition with no smaller parts: consecutive lines up to the target size
+    units = []
+    current = []
+    current_tokens = estimate_tokens(prefix)
+    for line in text.splitlines(keepends=True):
+        tokens = estimate_tokens(line)
+        if current and current_tokens + tokens > CHUNK_TARGET_TOKENS:
+            units.append(_Unit(prefix, "".join(current)))
+            current = []
+            current_tokens = estimate_tokens(prefix)
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        units.append(_Unit(prefix, "".join(current)))
+    return units
+
+
+##### PYTHON #####
+
+def _node_start(node: ast.AST) -> int:
+    # 0-based first line, including decorators
+    decorators = getattr(node, "decorator_list", [])
+    return min([node.lineno] + [decorator.lineno for decorator in decorators]) - 1
+
+
+def _python_units(nodes: list, lines: list[str], start: int, end: int, prefix: str) -> list[_Unit]:
+    # Each node owns the lines from the end of the previous one, so leading comments stay with their definition
+    units = []
+    cursor = start
+    for node in nodes:
+        node_end = node.end_lineno
+        unit = _Unit(prefix, "".join(lines[cursor:node_end]))
+        if unit.tokens > CHUNK_MAX_TOKENS:
+            if isinstance(node, ast.ClassDef) and node.body:
+                # The class is split into its members, each carrying the class header
+                body_start = _node_start(node.body[0])
+                header = prefix + "".join(lines[cursor:body_start])
+                units.extend(_python_units(node.body, lines, body_start, node_end, header))
+            else:
+                units.extend(_split_lines(prefix, unit.body))
+        else:
+            units.append(unit)
+        cursor = node_end
+    # Trailing comments belong to the last unit
+    if cursor < end:
+        tail = "".join(lines[cursor:end])
+        if units and units[-1].prefix == prefix:
+            units[-1].body += tail
+        else:
+            units.append(_Unit(prefix, tail))
+    return units
+
+
+def _python(source: str) -> list[_Unit] | None:
+    try:
+        module = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    lines = source.splitlines(keepends=True)
+    return _python_units(module.body, lines, 0, len(lines), "")
+
+
+##### JAVASCRIPT / JAVA #####
+
+def _structure(source: str, start: int, end: int):
+    # Yields (position, character) for braces, parentheses and semicolons outside strings and comments
+    i = start
+    while i < end:
+        char = source[i]
+        if char == "/" and i + 1 < end and source[i + 1] == "/":
+            newline = source.find("\n", i, end)
+            i = end if newline == -1 else newline
+            continue
+        if char == "/" and i + 1 < end and source[i + 1] == "*":
+            close = source.find("*/", i + 2, end)
+            i = end if close == -1 else close + 2
+            continue
+        if char in "\"'`":
+            i += 1
+            while i < end and source[i] != char:
+                if source[i] == "\\":
+                    i += 1
+                elif source[i] == "\n" and char != "`":
+                    # Unterminated string: resume at the line end rather than swallowing the file
+                    break
+                i += 1
+            i += 1
+            continue
+        if char in "{}();":
+            yield i, char
+        i += 1
+
+
+def _line_end(source: str, position: int, end: int) -> int:
+    newline = source.find("\n", position, end)
+    return end if newline == -1 else newline + 1
+
+
+def _brace_units(source: str, start: int, end: int, prefix: str) -> list[_Unit]:
+    # A statement ends at the line holding a top-level ';' or the '}' that closes its top-level block
+    units = []
+    cursor = start
+    braces = parens = 0
+    opening = None
+    for position, char in _structure(source, start, end):
+        if char == "(":
+            parens += 1
+        elif char == ")":
+            parens = max(parens - 1, 0)
+        elif char == "{":
+            if braces == 0 and opening is None:
+                opening = position
+            braces += 1
+        elif char == "}":
+            braces = max(braces - 1, 0)
+        if braces or parens or char not in "};" or position < cursor:
+            continue
+        statement_end = _line_end(source, position, end)
+        units.extend(_brace_unit(source, cursor, statement_end, opening, position, prefix))
+        cursor = statement_end
+        opening = None
+    if cursor < end:
+        tail = source[cursor:end]
+        if units and units[-1].prefix == prefix and not tail.strip():
+            units[-1].body += tail
+        else:
+            units.extend(_brace_unit(source, cursor, end, opening, None, prefix))
+    return units
+
+
+def _brace_unit(source: str, start: int, end: int, opening: int | None, closing: int | None, prefix: str) -> list[_Unit]:
+    unit = _Unit(prefix, source[start:end])
+    if unit.tokens <= CHUNK_MAX_TOKENS:
+        return [unit]
+    if opening is not None and closing is not None and closing > opening:
+        # Split a block (a class, or a function) into its members, each carrying the block's header line(s)
+        header = prefix + source[start:opening + 1] + "\n"
+        inner = _brace_units(source, opening + 1, closing, header)
+        if len(inner) > 1:
+            return inner
+    return _split_lines(prefix, unit.body)
+
+
+def _braces(source: str) -> list[_Unit]:
+    return _brace_units(source, 0, len(source), "")
+
+
+##### PACKING #####
+
+def _pack(units: list[_Unit]) -> list[str]:
+    # Neighbours under the same header are merged up to the target; an undersized chunk may reach the maximum
+    packed = []
+    for unit in units:
+        if not unit.body.strip():
+            continue
+        if packed and packed[-1].prefix == unit.prefix:
+            previous = packed[-1]
+            merged = estimate_tokens(previous.prefix + previous.body + unit.body)
+            if merged <= CHUNK_TARGET_TOKENS or (min(previous.tokens, unit.tokens) < CHUNK_MIN_TOKENS and merged <= CHUNK_MAX_TOKENS):
+                previous.body += unit.body
+                continue
+        packed.append(_Unit(unit.prefix, unit.body))
+    return [unit.text.strip() for unit in packed]
+
+
+### CALLED BY: build_chunks
+### PURPOSE: Splits source into chunks of whole definitions, sized between CHUNK_MIN_TOKENS and CHUNK_MAX_TOKENS
+# 1. Parse into top-level definitions (ast for Python, brace tokenizer for JS/Java; lines if parsing fails)
+# 2. Split oversized definitions at their members, or at line boundaries
+# 3. Merge neighbours up to CHUNK_TARGET_TOKENS
+# @param source: str - The file content
+# @param path: str - The file path, whose extension selects the language
+# @return: list[str] - The chunk texts, in file order
+def chunk_source(source: str, path: str) -> list[str]:
+    language = SUPPORTED_EXTENSIONS.get(os.path.splitext(path)[1])
+    units = None
+    if language == "python":
+        units = _python(source)
+    elif language in ("javascript", "java"):
+        units = _braces(source)
+    if units is None:
+        units = _split_lines("", source)
+    return [text for text in _pack(units) if len(text) > CHUNK_MIN_CHARS]
+
+
+### CALLED BY: chunk_file, update_file_embeddings
+### PURPOSE: Chunks one file into the records embedded, upserted and kept in the chunk store
+# @param repo_name: str - The repository name
+# @param path: str - The repo-relative file path
+# @param source: str - The file content
+# @return: list[dict] - The chunks, with ids built from the path, position and content hash
+def build_chunks(repo_name: str, path: str, source: str) -> list[dict]:
+    chunks = []
+    for i, text in enumerate(chunk_source(source, path)):
+        content_hash = hash_content(text)
+        chunks.append({
+            "id": f"{path}-{i}-{content_hash}",
+            "text": text,
+            "metadata": {
+                "path": path,
+                "chunk_id": i,
+                "hash": content_hash,
+                "repo": repo_name,
+                "preview": text[:200]
+            }
+        })
+    return chunks
+
+
+class ChunkStats:
+    """Running size statistics of the chunks produced by an indexing run."""
+
+    def __init__(self):
+        self.sizes = []
+
+    def add(self, chunks: list[dict]):
+        self.sizes.extend(estimate_tokens(chunk["text"]) for chunk in chunks)
+
+    def summary(self) -> dict:
+        if not self.sizes:
+            return {"chunks": 0, "tokens": 0}
+        ordered = sorted(self.sizes)
+        return {
+            "chunks": len(ordered),
+            "tokens": sum(ordered),
+            "min": ordered[0],
+            "p50": ordered[len(ordered) // 2],
+            "p90": ordered[min(len(ordered) - 1, len(ordered) * 9 // 10)],
+            "max": ordered[-1],
+            "under_min": sum(1 for size in ordered if size < CHUNK_MIN_TOKENS),
+            "over_max": sum(1 for size in ordered if size > CHUNK_MAX_TOKENS),
+        }
+
+    def __str__(self) -> str:
+        summary = self.summary()
+        if not summary["chunks"]:
+            return "no chunks"
+        return (f"{summary['chunks']} chunks, {summary['tokens']} tokens "
+                f"(min {summary['min']}, p50 {summary['p50']}, p90 {summary['p90']}, max {summary['max']}; "
+                f"{summary['under_min']} under {CHUNK_MIN_TOKENS}, {summary['over_max']} over {CHUNK_MAX_TOKENS})")
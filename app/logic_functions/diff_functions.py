@@ -1,30 +1,33 @@
-from logic_functions.s3_upload import download_chunk_store_from_s3, load_chunk_store, get_full_chunk_by_id, save_chunk_store_locally, upload_chunk_store_to_s3
-from logic_functions.embeddings import upsert_to_pinecone, hash_content
+from logic_functions.s3_upload import upload_chunk_store_to_s3
+from logic_functions.chunk_store import ChunkStore, CHUNK_STORE_COMPACT_SEGMENTS
+from logic_functions.vector_writer import VectorWriter, VECTOR_DELETE_BY_FILTER
+from logic_functions.code_chunker import build_chunks, ChunkStats, SUPPORTED_EXTENSIONS
+from logic_functions.embedding_service import embed_chunks_batched, estimate_tokens
+from logic_functions.async_utils import run_blocking
+from logic_functions.github_client import github_request, GITHUB_MAX_CONCURRENCY
+from logic_functions.diff_parser import FileDiff
+from logic_functions.vector_index import flush_vector_index, revalidate_vector_index
+from logic_functions.clients import get_client
+from logic_functions.retrieval_context import RetrievalContext
 
-from pinecone import Pinecone
-from openai import OpenAI
 import os
+import time
 import dotenv
-import httpx
+import asyncio
 import logging
-import re
-import boto3
-import json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 dotenv.load_dotenv()
 
-openAIClient = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 githubKey = os.getenv("GITHUB_ACCESS_TOKEN")
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
 
-S3_BUCKET = os.getenv("S3_BUCKET_NAME")
-S3_OBJECT_KEY = "chunk_s3.json"
-s3 = boto3.client("s3")
-
-index = pc.Index("git-lint")
+# Context tokens per review request, and how scores of a chunk matched by several diff chunks combine ("max" or "sum")
+RETRIEVAL_CONTEXT_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_CONTEXT_TOKEN_BUDGET", "4000"))
+RETRIEVAL_RERANK = os.getenv("RETRIEVAL_RERANK", "max").lower()
+# Seconds a review may spend compacting the chunk store after its flush; shards not reached are left to a later review
+CHUNK_STORE_COMPACT_SECONDS = float(os.getenv("CHUNK_STORE_COMPACT_SECONDS", "20"))
 
 # Global variable to store the chunk store
 chunk_store = None
@@ -34,13 +37,28 @@ chunk_store = None
 
 ### CALLED BY: run_orchestration_agent
 ### PURPOSE: Gets S3 chunks of codebase to be used, which sets the global variable correctly
-def initialize_chunk_store():
-    """Initializes the global chunk_store by downloading it from S3."""
+# The store is kept across warm invocations, and only refreshed when the manifest ETag changed
+async def initialize_chunk_store():
+    """Initializes or revalidates the global chunk_store against the S3 manifest; shards are fetched on demand."""
     global chunk_store
-    print("[PROCESS]: Downloading chunk store from S3")
-    store_path = download_chunk_store_from_s3()
-    chunk_store = load_chunk_store(store_path)
-    print("[PROCESS]: Chunk store initialized")
+    if chunk_store is None:
+        chunk_store = ChunkStore()
+    # Opened on the first review rather than on import, and off the event loop (a local index is read from S3)
+    index = await run_blocking(get_client, "vector_index")
+    await run_blocking(revalidate_vector_index, index)
+    print("[PROCESS]: Revalidating chunk store manifest against S3")
+    if await run_blocking(chunk_store.load_manifest):
+        print("[PROCESS]: Chunk store initialized from new manifest")
+    else:
+        print("[PROCESS]: Chunk store unchanged, reusing warm copy")
+
+
+### CALLED BY: run_orchestration_agent
+### PURPOSE: Creates the retrieval memo shared by the review requests of one pull request
+# @param repo_name: str - The name of the repository under review
+# @return: RetrievalContext - The memo, bound to the current index and chunk store
+def create_retrieval_context(repo_name: str) -> RetrievalContext:
+    return RetrievalContext(repo_name, get_client("vector_index"), chunk_store)
 
 ### CALLED BY: run_orchestration_agent
 ### PURPOSE: Retrieves the diff from the redirect URL to be used as the input for the review
@@ -49,136 +67,147 @@ def initialize_chunk_store():
 # @param url: str - The URL of the diff
 # @return: str - The diff as text
 async def get_diff(url: str) -> str:
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        response = await client.get(url)
-        # Code 200 -> Success, 302 -> Redirect
-        if response.status_code == 200 or response.status_code == 302:
-            print(f"Diff retrieved successfully: {response.text[:50]}...")
-            return response.text
-        else:
-            return {"error": "Failed to get pull request diff"}
-    
+    response = await github_request("GET", url)
+    # Code 200 -> Success, 302 -> Redirect
+    if response.status_code == 200 or response.status_code == 302:
+        print(f"Diff retrieved successfully: {response.text[:50]}...")
+        return response.text
+    else:
+        return {"error": "Failed to get pull request diff"}
+
+
+### CALLED BY: run_orchestration_agent
+### PURPOSE: Retrieves only the changes pushed to a pull request since a previously reviewed commit
+# @param full_repo: str - The "<owner>/<repo>" name of the repository
+# @param base_sha: str - The last reviewed head commit
+# @param head_sha: str - The new head commit
+# @return: str - The diff between the two commits as text, or an error dict (e.g. base_sha was force-pushed away)
+async def get_compare_diff(full_repo: str, base_sha: str, head_sha: str) -> str:
+    url = f"https://api.github.com/repos/{full_repo}/compare/{base_sha}...{head_sha}"
+    response = await github_request("GET", url, headers={
+        "Authorization": f"Bearer {githubKey}",
+        "Accept": "application/vnd.github.v3.diff"
+    })
+    if response.status_code == 200:
+        print(f"Compare diff retrieved successfully: {base_sha[:7]}...{head_sha[:7]}")
+        return response.text
+    else:
+        return {"error": f"Failed to get compare diff ({response.status_code})"}
+
+
+### CALLED BY: run_orchestration_agent
+### PURPOSE: Tells how a head commit relates to the last reviewed one, so a review never moves a PR's state backwards
+# @param full_repo: str - The "<owner>/<repo>" name of the repository
+# @param base_sha: str - The last reviewed head commit
+# @param head_sha: str - The head commit of the review
+# @return: str | None - GitHub's compare status ("ahead", "behind", "identical" or "diverged"), or None if the
+#                       comparison failed (e.g. base_sha was force-pushed away)
+async def get_compare_status(full_repo: str, base_sha: str, head_sha: str) -> str | None:
+    url = f"https://api.github.com/repos/{full_repo}/compare/{base_sha}...{head_sha}"
+    # One commit is enough for the status; the files and commit lists are not needed
+    response = await github_request("GET", url, headers={
+        "Authorization": f"Bearer {githubKey}",
+        "Accept": "application/vnd.github+json"
+    }, params={"per_page": 1})
+    if response.status_code == 200:
+        return response.json()["status"]
+    logger.warning(f"Failed to compare {base_sha[:7]}...{head_sha[:7]}: {response.status_code}")
+    return None
+
 
 ### CALLED BY: review_agent
 ### PURPOSE: Retrieves the context from the diff by searching the vector database for the most relevant chunks
-# 1. Retrieve the file paths from the diff
-# 2. Embed sizable chunks of the diff from chunk_diff()
-# 3. Query the vector database for the most relevant chunks to the diff
-# 4. Concatenate the most relevant chunks and return them
+# 1. Retrieve the file paths from the parsed file diffs
+# 2. Embed sizable chunks of the diff from chunk_diff() in batched requests
+# 3. Query the vector database for every chunk concurrently
+# 4. Merge the matches by id, rerank them globally and keep the best within the token budget
 # @param repo_name: str - The name of the repository to be searched for context
-# @param diff: str - The diff of the pull request
-# @param top_k: int - The number of chunks to concatenate and return
-# @return: str - concatenated string of context from the codebase
-async def retrieve_context_from_diff(repo_name: str, diff: str, top_k: int = 2) -> str:
+# @param file_diffs: list[FileDiff] - The parsed diffs of the files under review
+# @param top_k: int - The number of matches requested per diff chunk
+# @param token_budget: int - The maximum estimated tokens of context returned
+# @param retrieval: RetrievalContext | None - The PR's retrieval memo, shared with its other review requests
+# @return: str - concatenated string of context from the codebase, or "" if retrieval failed
+async def retrieve_context_from_diff(repo_name: str, file_diffs: list[FileDiff], top_k: int = 2,
+                                     token_budget: int = RETRIEVAL_CONTEXT_TOKEN_BUDGET,
+                                     retrieval: RetrievalContext | None = None) -> str:
     try:
-        global chunk_store
-        # 1. Retrieve the file paths from the diff
-        file_paths = extract_file_paths_from_diff(diff)
+        if retrieval is None:
+            retrieval = create_retrieval_context(repo_name)
+        # 1. Retrieve the file paths from the parsed file diffs
+        file_paths = [file_diff.path for file_diff in file_diffs]
+        # Only the shards holding these paths can contain matches
+        await retrieval.ensure_loaded(file_paths)
 
         # 2. Embed sizable chunks of the diff from chunk_diff()
-        chunks = chunk_diff(diff)
-        all_matches = []
-
-        # 3. Embed each chunk and query the vector database for the most relevant chunks to the diff
-        for chunk in chunks:
-            response = openAIClient.embeddings.create(
-                input=chunk,
-                model="text-embedding-3-small"
-            )
-            vector = response.data[0].embedding
-
-            result = index.query(
-                vector=vector,
-                top_k=top_k,
-                include_metadata=True,
-                filter={"repo": {"$eq": repo_name},
-                        "path": {"$in": list(file_paths)}}  
-            )
-
-            # 4. Append the most relevant chunks to the list
+        chunks = chunk_diff(file_diffs)
+
+        # 3. Embed all chunks in one batched call, then issue the queries concurrently;
+        #    lookups already made for this PR are reused rather than repeated
+        vectors = await retrieval.embed(chunks)
+        results = await asyncio.gather(*(
+            retrieval.query(chunk, vector, top_k, file_paths)
+            for chunk, vector in zip(chunks, vectors) if vector is not None
+        ), return_exceptions=True)
+
+        # 4. Merge the matches by id; a chunk matched by several diff chunks is scored once
+        scores = {}
+        metadata = {}
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Context query failed: {result}")
+                continue
             for match in result.get("matches", []):
                 chunk_id = match["id"]
-                full_chunk = get_full_chunk_by_id(chunk_id, chunk_store)
-
-                if full_chunk:
-                    # Log the location of the context match
-                    print(f"✅ Context match from {match['metadata']['path']} (chunk {match['metadata']['chunk_id']})")
-                    all_matches.append(full_chunk)
+                score = match.get("score", 0.0)
+                if chunk_id not in scores:
+                    scores[chunk_id] = score
+                    metadata[chunk_id] = match.get("metadata", {})
+                elif RETRIEVAL_RERANK == "sum":
+                    scores[chunk_id] += score
                 else:
-                    logger.warning(f"⚠️ Chunk ID {chunk_id} not found in chunk store")
+                    scores[chunk_id] = max(scores[chunk_id], score)
 
-        return "\n\n".join(all_matches)
-    
-    except Exception as e:
-        print(f"Error occurred during retrieval of context from diff: {e}")
-        return {"error": str(e)}
+        all_matches = []
+        used_tokens = 0
+        for chunk_id in sorted(scores, key=scores.get, reverse=True):
+            full_chunk = retrieval.chunk_text(chunk_id)
+            if not full_chunk:
+                logger.warning(f"⚠️ Chunk ID {chunk_id} not found in chunk store")
+                continue
 
+            tokens = estimate_tokens(full_chunk)
+            if used_tokens + tokens > token_budget:
+                # Smaller lower-ranked chunks may still fit
+                continue
+            used_tokens += tokens
+            # Log the location of the context match
+            print(f"✅ Context match from {metadata[chunk_id].get('path')} (chunk {metadata[chunk_id].get('chunk_id')}, score {scores[chunk_id]:.3f})")
+            all_matches.append(full_chunk)
 
-### CALLED BY: retrieve_context_from_diff
-### PURPOSE: Extracts the file paths from the diff to be used as a filter for the context search
-# 1. Extract the file paths from the diff
-# 2. Append the file paths into a set, and return the set
-# @param diff: str - The diff of the pull request
-# @return: set[str] - The file paths from the diff
-def extract_file_paths_from_diff(diff: str) -> list[str]:
-    paths = set()
-
-    for line in diff.splitlines():
-        if line.startswith("diff --git"):
-            match = re.search(r"diff --git a/(.*?) b/(.*)", line)
-            if match:
-                paths.add(match.group(2))  # destination path
-        elif line.startswith("+++ b/"):
-            paths.add(line.replace("+++ b/", "").strip())
-    
-    return list(paths)
-
-# Function to split file for parallel processing reviews
-def split_diff_by_file(diff_text: str) -> dict[str, str]:
-    """
-    Splits a diff string into a dictionary where keys are file paths
-    and values are the diff content for each file.
-    """
-    files_diff = {}
-    # Split the diff by the file delimiter 'diff --git'
-    diff_parts = diff_text.split('diff --git ')[1:]
+        return "\n\n".join(all_matches)
     
-    for part in diff_parts:
-        # The first line contains the file paths
-        lines = part.split('\n')
-        header_line = lines[0]
-        
-        # Extract the 'b' path as the identifier
-        try:
-            file_path = header_line.split(' b/')[1].strip()
-        except IndexError:
-            # Handle cases where the split doesn't work as expected
-            continue
-            
-        # Reconstruct the diff for this file
-        file_diff_content = 'diff --git ' + part
-        files_diff[file_path] = file_diff_content
-        
-    return files_diff
+    except Exception as e:
+        # Reviewing without context beats failing the review: a vector index or embedding outage only costs the context
+        logger.error(f"Error occurred during retrieval of context from diff: {e}")
+        return ""
 
 
 ### CALLED BY: retrieve_context_from_diff
-### PURPOSE: Splits the entire diff into chunks, which, if longer than min_len, are added to the vector database
-# 1. Chunk the diff
-# 2. Measure the length of each chunk to check usefulness as an embedding
-# 3. Append the chunks into a list, and return the list
-# @param diff: str - The diff of the pull request
+### PURPOSE: Collects the hunks of the parsed diff which, if longer than min_len, are embedded as search queries
+# 1. Take each hunk (header and body) from the parser's output
+# 2. Measure the length of each hunk to check usefulness as an embedding
+# 3. Append the hunks into a list, and return the list
+# @param file_diffs: list[FileDiff] - The parsed diffs of the files under review
 # @param min_len: int - The minimum length of a chunk
 # @return: list[str] - The chunks of the diff
-def chunk_diff(diff: str, min_len: int = 50) -> list[str]:
+def chunk_diff(file_diffs: list[FileDiff], min_len: int = 50) -> list[str]:
 
     chunks = []
-    raw_chunks = re.split(r"^diff --git.+?^(@@.+?@@)", diff, flags=re.MULTILINE | re.DOTALL)
-
-    for chunk in raw_chunks:
-        cleaned = chunk.strip()
-        if len(cleaned) >= min_len:
-            chunks.append(cleaned)
+    for file_diff in file_diffs:
+        for hunk in file_diff.hunks:
+            cleaned = hunk.text.strip()
+            if len(cleaned) >= min_len:
+                chunks.append(cleaned)
     return chunks
 
 
@@ -190,147 +219,250 @@ def chunk_diff(diff: str, min_len: int = 50) -> list[str]:
 # @param comment: str - The comment to be posted
 # @return: dict - The response from the API
 async def post_comment(issue_url: str, comment: str) -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.post(issue_url+"/comments", json={"body": comment}, 
-            headers={
-                "Authorization": f"Bearer {githubKey}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-        )
-        if response.status_code == 200 or response.status_code == 201:
-            return {"message": "Comment posted successfully"}
-        else:
-            return {"message": "Failed to post comment"}
+    response = await github_request("POST", issue_url+"/comments", json={"body": comment}, 
+        headers={
+            "Authorization": f"Bearer {githubKey}",
+            "Accept": "application/vnd.github.v3+json"
+        }
+    )
+    if response.status_code == 200 or response.status_code == 201:
+        # The comment's API URL lets later pushes update this comment instead of posting another
+        return {"message": "Comment posted successfully", "url": response.json().get("url")}
+    else:
+        return {"message": "Failed to post comment"}
+
+
+### CALLED BY: run_orchestration_agent
+### PURPOSE: Replaces the body of an existing comment (the review comment of an incrementally reviewed PR)
+# @param comment_url: str - The API URL of the comment, as returned by post_comment
+# @param comment: str - The new body of the comment
+# @return: dict - The response from the API
+async def update_comment(comment_url: str, comment: str) -> dict:
+    response = await github_request("PATCH", comment_url, json={"body": comment},
+        headers={
+            "Authorization": f"Bearer {githubKey}",
+            "Accept": "application/vnd.github.v3+json"
+        }
+    )
+    if response.status_code == 200:
+        return {"message": "Comment updated successfully", "url": comment_url}
+    else:
+        return {"message": "Failed to update comment"}
+
+
+### CALLED BY: ProgressiveComment.abandon
+### PURPOSE: Deletes a comment (the placeholder of a review that could not be completed)
+# @param comment_url: str - The API URL of the comment, as returned by post_comment
+# @return: dict - The response from the API
+async def delete_comment(comment_url: str) -> dict:
+    response = await github_request("DELETE", comment_url,
+        headers={
+            "Authorization": f"Bearer {githubKey}",
+            "Accept": "application/vnd.github.v3+json"
+        }
+    )
+    if response.status_code == 204:
+        return {"message": "Comment deleted successfully"}
+    else:
+        return {"message": "Failed to delete comment"}
 
 async def get_file_content(repo_name: str, file_path: str) -> str:
     try:
         url = f"https://raw.githubusercontent.com/kylehton/{repo_name}/main/{file_path}"
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            if response.status_code == 200:
-                return response.text
-            else:
-                logger.warning(f"Failed to get file from {url}: {response.status_code}")
-                return None
+        response = await github_request("GET", url)
+        if response.status_code == 200:
+            return response.text
+        else:
+            logger.warning(f"Failed to get file from {url}: {response.status_code}")
+            return None
     except Exception as e:
         print(f"Error getting file content: {e}")
         return None
 
-async def update_file_embeddings(repo_name: str, diff: str):
+### CALLED BY: update_file_embeddings
+### PURPOSE: Diffs a file's new chunk set against its stored chunks by content hash
+# 1. Match each new chunk to an unused existing chunk with the same hash (ids end with "-{hash}")
+# 2. Matched chunks are kept; if their position changed, they are renumbered in place
+# 3. Unmatched new chunks are returned for embedding, unmatched existing ids for deletion
+# @param existing_ids: list[str] - The ids of the file's chunks in the chunk store
+# @param chunks: list[dict] - The file's freshly created chunks
+# @return: tuple - (chunks to embed and upsert, [(kept id, new position)], ids to delete)
+def plan_chunk_changes(existing_ids: list[str], chunks: list[dict]) -> tuple[list[dict], list[tuple[str, int]], list[str]]:
+    existing_by_hash = {}
+    for chunk_id in sorted(existing_ids):
+        existing_by_hash.setdefault(chunk_id.rsplit("-", 1)[-1], []).append(chunk_id)
+
+    new_chunks = []
+    renumbered = []
+    for chunk in chunks:
+        matches = existing_by_hash.get(chunk["metadata"]["hash"])
+        if not matches:
+            new_chunks.append(chunk)
+            continue
+        chunk_id = matches.pop(0)
+        if chunk_store.get(chunk_id, {}).get("chunk_id") != chunk["metadata"]["chunk_id"]:
+            renumbered.append((chunk_id, chunk["metadata"]["chunk_id"]))
+
+    stale_ids = [chunk_id for ids in existing_by_hash.values() for chunk_id in ids]
+    return new_chunks, renumbered, stale_ids
+
+### CALLED BY: update_file_embeddings
+### PURPOSE: Compacts the chunk store's long delta logs right after the flush that grew them, within a time box
+# Awaited rather than left in the background: a Lambda container is frozen once the invocation returns, so a
+# background compaction would rarely finish. A compaction cut short leaves the log intact; a later review picks it up
+# @return: int - The number of shards compacted
+async def compact_chunk_store() -> int:
+    if chunk_store is None or not chunk_store.compaction_candidates(CHUNK_STORE_COMPACT_SEGMENTS):
+        return 0
+    try:
+        return await run_blocking(chunk_store.compact, CHUNK_STORE_COMPACT_SEGMENTS, time.monotonic() + CHUNK_STORE_COMPACT_SECONDS)
+    except Exception as e:
+        # The review is done and its changes are published; only the compaction is retried later
+        logger.error(f"Chunk store compaction failed: {e}")
+        return 0
+
+
+### CALLED BY: update_file_embeddings (through run_blocking)
+### PURPOSE: Lists the stored chunk ids of each file, loading the shards that hold them
+# @param repo_name: str - The name of the repository
+# @param paths: list[str] - The repo-relative file paths
+# @return: dict[str, list[str]] - The chunk ids of each path
+def _ids_by_path(repo_name: str, paths: list[str]) -> dict[str, list[str]]:
+    chunk_store.ensure_loaded(repo_name, paths)
+    return {path: chunk_store.ids_for_path(repo_name, path) for path in paths}
+
+
+### CALLED BY: update_file_embeddings (through run_blocking)
+### PURPOSE: Applies the index writes that succeeded to the chunk store
+# Shards are (re)loaded first: a concurrent revalidation may have evicted them, and a delete is only recorded on a loaded shard
+# @param repo_name: str - The name of the repository
+# @param paths: list[str] - The paths whose shards are written
+# @param deleted_ids: list[str] - Ids deleted from the index
+# @param renumbered: list[tuple[str, int]] - (kept id, new position) of chunks whose position metadata was updated
+# @param upserted_chunks: list[dict] - The chunks upserted into the index
+def _apply_to_chunk_store(repo_name: str, paths: list[str], deleted_ids: list[str], renumbered: list[tuple[str, int]], upserted_chunks: list[dict]):
+    chunk_store.ensure_loaded(repo_name, paths)
+    for chunk_id in deleted_ids:
+        chunk_store.pop(chunk_id, None)
+    for chunk_id, position in renumbered:
+        record = chunk_store.get(chunk_id)
+        if record is None:
+            logger.warning(f"Renumbered chunk {chunk_id} is missing from the chunk store")
+            continue
+        chunk_store.put(repo_name, chunk_id, dict(record, chunk_id=position))
+    for chunk in upserted_chunks:
+        try:
+            chunk_store.put(repo_name, chunk["id"], {
+                "text": chunk["text"],
+                "path": chunk["metadata"]["path"],
+                "chunk_id": chunk["metadata"]["chunk_id"],
+                "repo": repo_name
+            })
+        except Exception as e:
+            print(f"Error updating store for chunk {chunk['id']}: {e}")
+            continue
+
+
+async def update_file_embeddings(repo_name: str, file_diffs: list[FileDiff]):
     global chunk_store
+    index = await run_blocking(get_client, "vector_index")
+    writer = VectorWriter(index)
 
     try:
-        # Get modified file paths from diff
-        file_paths = extract_file_paths_from_diff(diff)
-        if not file_paths:
+        # Deleted files and the old side of renames only lose their chunks
+        removed_paths = [file_diff.old_path for file_diff in file_diffs if file_diff.is_deleted or file_diff.is_rename]
+        # Get modified file paths from the parsed diff
+        file_paths = [file_diff.new_path for file_diff in file_diffs if not file_diff.is_deleted and not file_diff.is_binary]
+        if not file_paths and not removed_paths:
             print("No files to update")
             return
 
-        # Track all embedded chunks for saving
-        all_embedded_chunks = []
+        # Writes of every file are collected first, then sent as a few batched calls for the whole PR
+        pending_chunks = []
+        stale_ids = []
+        renumbered = []
+        chunk_stats = ChunkStats()
+
+        # Load only the shards holding the modified files; shard loads are S3 GETs, so they stay off the event loop
+        removed_ids = [chunk_id for ids in (await run_blocking(_ids_by_path, repo_name, removed_paths)).values() for chunk_id in ids]
+
+        # Fetch all file contents from GitHub concurrently, bounded by GITHUB_MAX_CONCURRENCY
+        semaphore = asyncio.Semaphore(GITHUB_MAX_CONCURRENCY)
+
+        async def fetch(path):
+            async with semaphore:
+                return await get_file_content(repo_name, path)
+
+        contents = await asyncio.gather(*(fetch(path) for path in file_paths))
+        existing_by_path = await run_blocking(_ids_by_path, repo_name, file_paths)
 
         # Process each modified file
-        for file_path in file_paths:
-            # Get file content from GitHub
-            content = await get_file_content(repo_name, file_path)
+        for file_path, content in zip(file_paths, contents):
             if not content:
                 logger.warning(f"Could not get content for {file_path}")
                 continue
 
-            # Find and delete existing chunks for this file
-            chunks_to_delete = [chunk_id for chunk_id, chunk_data in chunk_store.items() if chunk_data.get("path") == file_path]
-            if chunks_to_delete:
-                try:
-                    # Delete from Pinecone
-                    index.delete(ids=chunks_to_delete)
-                    print(f"Deleted {len(chunks_to_delete)} chunks from Pinecone for {file_path}: {chunks_to_delete}")
-                    # Remove from local chunk store
-                    for chunk_id in chunks_to_delete:
-                        chunk_store.pop(chunk_id, None)
-                    print(f"Deleted {len(chunks_to_delete)} chunks from chunk_store for {file_path}")
-                except Exception as e:
-                    print(f"Error deleting chunks for {file_path}: {e}")
-
-            # Create new chunks from file content
-            chunks = []
-            patterns = {
-                ".py": r"(?=def |class )",
-                ".js": r"(?=function |class |const |let |var )",
-                ".java": r"(?=public |private |protected |class )",
-            }
-            ext = os.path.splitext(file_path)[1]
-            if ext in patterns:
-                split_chunks = re.split(patterns[ext], content)
-                for i, chunk in enumerate(split_chunks):
-                    cleaned = chunk.strip()
-                    if len(cleaned) > 50:
-                        content_hash = hash_content(cleaned)
-                        chunk_id = f"{file_path}-{i}-{content_hash}"
-                        chunks.append({
-                            "id": chunk_id,
-                            "text": cleaned,
-                            "metadata": {
-                                "path": file_path,
-                                "chunk_id": i,
-                                "hash": content_hash,
-                                "repo": repo_name,
-                                "preview": cleaned[:200]
-                            }
-                        })
-
+            # Create new chunks from file content: whole definitions, sized for embedding
+            chunks = build_chunks(repo_name, file_path, content) if os.path.splitext(file_path)[1] in SUPPORTED_EXTENSIONS else []
+            chunk_stats.add(chunks)
             if not chunks:
                 logger.warning(f"No chunks created for {file_path}")
-                continue
 
-            # Embed and upsert new chunks
-            embedded_chunks = []
-            for chunk in chunks:
-                try:
-                    response = openAIClient.embeddings.create(
-                        input=chunk["text"],
-                        model="text-embedding-3-small"
-                    )
-                    chunk["embedding"] = response.data[0].embedding
-                    embedded_chunks.append(chunk)
-                    print(f"Embedded: {chunk['metadata']['path']} [chunk {chunk['metadata']['chunk_id']}]")
-                except Exception as e:
-                    print(f"Error embedding chunk {chunk['id']}: {e}")
-                    continue
-
-            if not embedded_chunks:
-                logger.warning(f"No chunks were successfully embedded for {file_path}")
-                continue
+            # Compare against the existing chunks of this file by content hash
+            existing_ids = existing_by_path[file_path]
+            new_chunks, file_renumbered, file_stale_ids = plan_chunk_changes(existing_ids, chunks)
+            print(f"{file_path}: {len(new_chunks)} new, {len(existing_ids) - len(file_stale_ids)} unchanged, {len(file_stale_ids)} removed chunks")
 
-            # Upsert to Pinecone
-            try:
-                upsert_to_pinecone(embedded_chunks, index)
-                print(f"Upserted {len(embedded_chunks)} chunks to Pinecone for {file_path}")
-            except Exception as e:
-                print(f"Error upserting to Pinecone: {e}")
-                continue
+            pending_chunks.extend(new_chunks)
+            stale_ids.extend(file_stale_ids)
+            renumbered.extend(file_renumbered)
+
+        print(f"Chunked {len(file_paths)} files: {chunk_stats}")
 
-            # Add to local chunk store
+        # Delete the chunks of removed files (one filtered call, where the index supports it) and those whose content vanished
+        async def delete_chunks():
+            deleted = []
+            ids = list(stale_ids)
+            if removed_ids and VECTOR_DELETE_BY_FILTER:
+                if await writer.delete_paths(repo_name, removed_paths):
+                    deleted.extend(removed_ids)
+            else:
+                ids.extend(removed_ids)
+            deleted.extend(await writer.delete(ids))
+            return deleted
+
+        # Embed the chunks of all files in batched requests, then upsert them in batches
+        async def write_new_chunks():
+            embedded_chunks = await embed_chunks_batched(pending_chunks)
             for chunk in embedded_chunks:
-                try:
-                    chunk_store[chunk["id"]] = {
-                        "text": chunk["text"],
-                        "path": chunk["metadata"]["path"],
-                        "chunk_id": chunk["metadata"]["chunk_id"]
-                    }
-                except Exception as e:
-                    print(f"Error updating store for chunk {chunk['id']}: {e}")
-                    continue
-
-            all_embedded_chunks.extend(embedded_chunks)
+                print(f"Embedded: {chunk['metadata']['path']} [chunk {chunk['metadata']['chunk_id']}]")
+            if pending_chunks and not embedded_chunks:
+                logger.warning("No chunks were successfully embedded")
+            return await writer.upsert(embedded_chunks)
+
+        # Unchanged chunks whose position shifted keep their vector; only the position metadata moves.
+        # The three sets of ids are disjoint, so the writes run concurrently
+        deleted_ids, renumbered_ids, upserted_chunks = await asyncio.gather(
+            delete_chunks(),
+            writer.update_metadata([(chunk_id, {"chunk_id": position}) for chunk_id, position in renumbered]),
+            write_new_chunks()
+        )
+        print(f"Deleted {len(deleted_ids)}/{len(stale_ids) + len(removed_ids)}, renumbered {len(renumbered_ids)}/{len(renumbered)}, "
+              f"upserted {len(upserted_chunks)}/{len(pending_chunks)} chunks")
+
+        # Apply to the local chunk store only what reached the index; failed writes are retried by the next push
+        positions = dict(renumbered)
+        await run_blocking(_apply_to_chunk_store, repo_name, file_paths + removed_paths, deleted_ids,
+                           [(chunk_id, positions[chunk_id]) for chunk_id in renumbered_ids], upserted_chunks)
 
         # Save updated store and upload to S3
         try:
-            # Save the entire chunk_store to S3
-            with open("/tmp/chunk_s3.json", "w") as f:
-                json.dump(chunk_store, f, indent=2)
-            upload_chunk_store_to_s3()
+            # Upload only the shards touched by this diff, plus the manifest
+            await run_blocking(upload_chunk_store_to_s3, chunk_store)
+            await run_blocking(flush_vector_index, index)
             print(f"Successfully updated embeddings for {len(file_paths)} files")
+            await compact_chunk_store()
         except Exception as e:
             print(f"Error saving store: {e}")
             raise
@@ -0,0 +1,230 @@
+# PACKS PARSED FILE DIFFS INTO RIGHT-SIZED REVIEW REQUESTS
+# Small files are merged into one request up to a token budget; oversized files are split at hunk
+# boundaries (or line boundaries for a single huge hunk) with overlap, keeping per-file attribution
+from logic_functions.diff_parser import FileDiff, Hunk
+from logic_functions.embedding_service import estimate_tokens
+
+import os
+import dotenv
+
+dotenv.load_dotenv()
+
+# Diff tokens per review request, well inside the review model's context once context and instructions are added
+REVIEW_REQUEST_TOKEN_BUDGET = int(os.getenv("REVIEW_REQUEST_TOKEN_BUDGET", "12000"))
+# More files per request makes per-file attribution less reliable
+REVIEW_MAX_FILES_PER_REQUEST = int(os.getenv("REVIEW_MAX_FILES_PER_REQUEST", "8"))
+# A part repeats the previous part's last hunk when that hunk is at most this share of the budget
+OVERLAP_BUDGET_SHARE = 0.25
+
+
+class DiffSegment:
+    """A whole file diff, or one part of an oversized one, as a FileDiff view over a subset of its hunks."""
+    __slots__ = ("file_diff", "part", "parts")
+
+    def __init__(self, file_diff: FileDiff, part: int = 1, parts: int = 1):
+        self.file_diff = file_diff
+        self.part = part
+        self.parts = parts
+
+    @property
+    def path(self) -> str:
+        return self.file_diff.path
+
+    @property
+    def label(self) -> str:
+        if self.parts == 1:
+            return f"`{self.path}`"
+        return f"`{self.path}` (part {self.part}/{self.parts})"
+
+    @property
+    def text(self) -> str:
+        if self.parts == 1:
+            return self.file_diff.text
+        return _header(self.file_diff) + "".join(hunk.text for hunk in self.file_diff.hunks)
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+class ReviewUnit:
+    """The segments reviewed together in one request."""
+    __slots__ = ("segments",)
+
+    def __init__(self, segments: list[DiffSegment]):
+        self.segments = segments
+
+    @property
+    def file_diffs(self) -> list[FileDiff]:
+        return [segment.file_diff for segment in self.segments]
+
+    @property
+    def paths(self) -> list[str]:
+        return [segment.path for segment in self.segments]
+
+    @property
+    def label(self) -> str:
+        return ", ".join(segment.label for segment in self.segments)
+
+    @property
+    def text(self) -> str:
+        return "".join(segment.text for segment in self.segments)
+
+
+def _header(file_diff: FileDiff) -> str:
+    # The lines before the first hunk; found in the source, since a view's first hunk may be a later one
+    first_hunk = file_diff.source.find("\n@@ ", file_diff.start, file_diff.end)
+    end = file_diff.end if first_hunk == -1 else first_hunk + 1
+    return file_diff.source[file_diff.start:end]
+
+
+def _view(file_diff: FileDiff, hunks: list[Hunk]) -> FileDiff:
+    # Shares the source string; only the hunk list differs
+    view = FileDiff(file_diff.source, file_diff.start, file_diff.old_path, file_diff.new_path)
+    view.end = file_diff.end
+    view.is_new = file_diff.is_new
+    view.is_deleted = file_diff.is_deleted
+    view.is_rename = file_diff.is_rename
+    view.is_binary = file_diff.is_binary
+    view.hunks = hunks
+    return view
+
+
+class HunkWindow(Hunk):
+    """A line window of an oversized hunk, under its own '@@' header giving the window's line ranges."""
+    __slots__ = ("section",)
+
+    def __init__(self, source: str, start: int, old_start: int, new_start: int, section: str):
+        super().__init__(source, start, old_start, 0, new_start, 0)
+        # Text after the closing "@@" of the original header (e.g. the enclosing function), repeated on every window
+        self.section = section
+
+    @property
+    def text(self) -> str:
+        header = f"@@ -{self.old_start},{self.old_count} +{self.new_start},{self.new_count} @@{self.section}\n"
+        return header + self.source[self.start:self.end]
+
+
+def _close_window(window: HunkWindow) -> HunkWindow:
+    # A side without lines is numbered by the line before it, as in git's "@@ -0,0 +1,3 @@"
+    if window.old_count == 0:
+        window.old_start -= 1
+    if window.new_count == 0:
+        window.new_start -= 1
+    return window
+
+
+### CALLED BY: _split_file
+### PURPOSE: Splits a hunk that alone exceeds the budget into line windows (e.g. a generated file added in one hunk)
+# 1. Walk the hunk's lines, tracking the next old and new line numbers (context advances both, "-" old, "+" new)
+# 2. Start a new window whenever the current one would exceed the budget
+# 3. Give each window a header with its own ranges, so every window locates its lines in the file
+# @param hunk: Hunk - The oversized hunk
+# @param budget: int - The token budget per window
+# @return: list[HunkWindow] - Hunks covering consecutive line ranges of the original
+def _split_hunk(hunk: Hunk, budget: int) -> list[HunkWindow]:
+    source = hunk.source
+    max_chars = budget * 4
+    header_end = source.find("\n", hunk.start, hunk.end)
+    body_start = hunk.end if header_end == -1 else header_end + 1
+    header = source[hunk.start:body_start].rstrip("\r\n")
+    closing = header.find("@@", 2)
+    section = header[closing + 2:] if closing != -1 else ""
+
+    # Line numbers of the next old and new lines (a side without lines is numbered by the line before it)
+    old_line = hunk.old_start if hunk.old_count else hunk.old_start + 1
+    new_line = hunk.new_start if hunk.new_count else hunk.new_start + 1
+    windows = []
+    window = HunkWindow(source, body_start, old_line, new_line, section)
+    pos = body_start
+    while pos < hunk.end:
+        newline = source.find("\n", pos, hunk.end)
+        line_end = hunk.end if newline == -1 else newline + 1
+        if window.end > window.start and line_end - window.start > max_chars:
+            windows.append(_close_window(window))
+            window = HunkWindow(source, pos, old_line, new_line, section)
+        marker = source[pos]
+        if marker == "+":
+            window.added += 1
+            window.new_count += 1
+            new_line += 1
+        elif marker == "-":
+            window.removed += 1
+            window.old_count += 1
+            old_line += 1
+        elif marker != "\\":
+            window.old_count += 1
+            window.new_count += 1
+            old_line += 1
+            new_line += 1
+        window.end = line_end
+        pos = line_end
+    windows.append(_close_window(window))
+    return windows
+
+
+### CALLED BY: pack_file_diffs
+### PURPOSE: Splits an oversized file diff into parts at hunk boundaries, overlapping by one small hunk
+# @param file_diff: FileDiff - The file diff exceeding the budget
+# @param budget: int - The token budget per part
+# @return: list[DiffSegment] - The parts, labelled i/n
+def _split_file(file_diff: FileDiff, budget: int) -> list[DiffSegment]:
+    header_tokens = estimate_tokens(_header(file_diff))
+    hunk_budget = max(budget - header_tokens, 1)
+
+    hunks = []
+    for hunk in file_diff.hunks:
+        hunks.extend(_split_hunk(hunk, hunk_budget) if estimate_tokens(hunk.text) > hunk_budget else [hunk])
+
+    groups = []
+    current = []
+    current_tokens = 0
+    for hunk in hunks:
+        tokens = estimate_tokens(hunk.text)
+        if current and current_tokens + tokens > hunk_budget:
+            groups.append(current)
+            # Carry the last hunk over as overlap when it is small enough to leave room for new hunks
+            previous = current[-1]
+            previous_tokens = estimate_tokens(previous.text)
+            if previous_tokens <= hunk_budget * OVERLAP_BUDGET_SHARE and previous_tokens + tokens <= hunk_budget:
+                current, current_tokens = [previous], previous_tokens
+            else:
+                current, current_tokens = [], 0
+        current.append(hunk)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+
+    return [DiffSegment(_view(file_diff, group), part=i + 1, parts=len(groups)) for i, group in enumerate(groups)]
+
+
+### CALLED BY: run_orchestration_agent
+### PURPOSE: Packs parsed file diffs into review units that each fit the token budget
+# 1. Split every file diff over the budget into overlapping parts
+# 2. Greedily merge consecutive segments into one unit while it stays under the budget and file cap
+# @param file_diffs: list[FileDiff] - The parsed diffs to be reviewed
+# @param budget: int - The diff token budget per review request
+# @param max_files: int - The maximum number of segments per review request
+# @return: list[ReviewUnit] - The review requests, in diff order
+def pack_file_diffs(file_diffs: list[FileDiff], budget: int = REVIEW_REQUEST_TOKEN_BUDGET,
+                    max_files: int = REVIEW_MAX_FILES_PER_REQUEST) -> list[ReviewUnit]:
+    segments = []
+    for file_diff in file_diffs:
+        if estimate_tokens(file_diff.text) > budget and file_diff.hunks:
+            segments.extend(_split_file(file_diff, budget))
+        else:
+            segments.append(DiffSegment(file_diff))
+
+    units = []
+    current = []
+    current_tokens = 0
+    for segment in segments:
+        tokens = segment.tokens
+        if current and (current_tokens + tokens > budget or len(current) >= max_files):
+            units.append(ReviewUnit(current))
+            current, current_tokens = [], 0
+        current.append(segment)
+        current_tokens += tokens
+    if current:
+        units.append(ReviewUnit(current))
+    return units
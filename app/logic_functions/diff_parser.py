@@ -0,0 +1,182 @@
+# SINGLE-PASS PARSER FOR GIT UNIFIED DIFFS
+# Walks the diff once and yields compact FileDiff/Hunk objects that hold offsets into the original
+# string instead of copies, so multi-megabyte diffs are parsed quickly with bounded memory
+from typing import Iterator
+import re
+
+HUNK_HEADER = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+DEV_NULL = "/dev/null"
+
+
+class Hunk:
+    """One '@@' hunk of a file diff; text is sliced from the source diff on demand."""
+    __slots__ = ("source", "start", "end", "old_start", "old_count", "new_start", "new_count", "added", "removed")
+
+    def __init__(self, source: str, start: int, old_start: int, old_count: int, new_start: int, new_count: int):
+        self.source = source
+        self.start = start
+        self.end = start
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.added = 0
+        self.removed = 0
+
+    @property
+    def text(self) -> str:
+        return self.source[self.start:self.end]
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return f"Hunk(-{self.old_start},{self.old_count} +{self.new_start},{self.new_count}, +{self.added}/-{self.removed})"
+
+
+class FileDiff:
+    """All of one file's diff, from its 'diff --git' line to the next one."""
+    __slots__ = ("source", "start", "end", "old_path", "new_path", "is_new", "is_deleted", "is_rename", "is_binary", "hunks")
+
+    def __init__(self, source: str, start: int, old_path: str, new_path: str):
+        self.source = source
+        self.start = start
+        self.end = start
+        self.old_path = old_path
+        self.new_path = new_path
+        self.is_new = False
+        self.is_deleted = False
+        self.is_rename = False
+        self.is_binary = False
+        self.hunks = []
+
+    @property
+    def path(self) -> str:
+        """The path identifying the file: the new path, or the old one if the file was deleted."""
+        return self.old_path if self.is_deleted else self.new_path
+
+    @property
+    def text(self) -> str:
+        return self.source[self.start:self.end]
+
+    @property
+    def added(self) -> int:
+        return sum(hunk.added for hunk in self.hunks)
+
+    @property
+    def removed(self) -> int:
+        return sum(hunk.removed for hunk in self.hunks)
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return f"FileDiff({self.path!r}, hunks={len(self.hunks)}, +{self.added}/-{self.removed})"
+
+
+def _split_git_header(rest: str) -> tuple[str, str]:
+    # "a/<old> b/<new>"; refined later by ---/+++ and rename lines, which are unambiguous
+    separator = rest.find(" b/")
+    if not rest.startswith("a/") or separator == -1:
+        return rest, rest
+    return rest[2:separator], rest[separator + 3:]
+
+
+def _strip_prefix(path: str, prefix: str) -> str:
+    path = path.split("\t", 1)[0]
+    return path[len(prefix):] if path.startswith(prefix) else path
+
+
+### CALLED BY: run_orchestration_agent, update_file_embeddings
+### PURPOSE: Parses a git diff in one pass, yielding one FileDiff per file
+# 1. Walk the diff line by line using offsets (no splitlines copy)
+# 2. In a file header, record paths and new/deleted/rename/binary flags
+# 3. In a hunk, count added/removed lines until the hunk's line ranges are used up, or a line that cannot be hunk content
+# @param diff: str - The diff of the pull request
+# @return: Iterator[FileDiff] - The parsed file diffs, in diff order
+def parse_diff(diff: str) -> Iterator[FileDiff]:
+    current = None
+    hunk = None
+    old_remaining = new_remaining = 0
+    pos = 0
+    length = len(diff)
+
+    while pos < length:
+        newline = diff.find("\n", pos)
+        line_end = length if newline == -1 else newline + 1
+
+        if hunk is not None and (old_remaining > 0 or new_remaining > 0):
+            # Inside a hunk, lines are content even if they look like headers (e.g. a removed "-- comment").
+            # Only the first character is inspected, so hunk bodies are never copied
+            marker = diff[pos]
+            if marker in "+- \\\r\n":
+                if marker == "+":
+                    hunk.added += 1
+                    new_remaining -= 1
+                elif marker == "-":
+                    hunk.removed += 1
+                    old_remaining -= 1
+                elif marker != "\\":
+                    old_remaining -= 1
+                    new_remaining -= 1
+                hunk.end = line_end
+                current.end = line_end
+                pos = line_end
+                continue
+            # A line no hunk body can hold (e.g. the next "diff --git" or "@@" header): the header's counts were wrong,
+            # so the hunk ends here and the line is parsed as a header
+            old_remaining = new_remaining = 0
+
+        line = diff[pos:line_end].rstrip("\r\n")
+        if line.startswith("diff --git "):
+            if current is not None:
+                yield current
+            old_path, new_path = _split_git_header(line[len("diff --git "):])
+            current = FileDiff(diff, pos, old_path, new_path)
+            hunk = None
+        elif current is None:
+            # Preamble before the first file (e.g. an email header)
+            pos = line_end
+            continue
+        elif line.startswith("@@"):
+            match = HUNK_HEADER.match(line)
+            if match:
+                old_start, old_count, new_start, new_count = match.groups()
+                old_remaining = 1 if old_count is None else int(old_count)
+                new_remaining = 1 if new_count is None else int(new_count)
+                hunk = Hunk(diff, pos, int(old_start), old_remaining, int(new_start), new_remaining)
+                current.hunks.append(hunk)
+        elif line.startswith("\\") and hunk is not None:
+            # "\ No newline at end of file" belongs to the preceding hunk
+            pass
+        elif line.startswith("new file mode"):
+            current.is_new = True
+        elif line.startswith("deleted file mode"):
+            current.is_deleted = True
+        elif line.startswith("rename from ") or line.startswith("copy from "):
+            current.is_rename = line.startswith("rename")
+            current.old_path = line.split(" from ", 1)[1]
+        elif line.startswith("rename to ") or line.startswith("copy to "):
+            current.new_path = line.split(" to ", 1)[1]
+        elif line.startswith("--- "):
+            path = line[4:]
+            if path == DEV_NULL:
+                current.is_new = True
+            else:
+                current.old_path = _strip_prefix(path, "a/")
+        elif line.startswith("+++ "):
+            path = line[4:]
+            if path == DEV_NULL:
+                current.is_deleted = True
+            else:
+                current.new_path = _strip_prefix(path, "b/")
+        elif line.startswith("Binary files ") or line.startswith("GIT binary patch"):
+            current.is_binary = True
+
+        if hunk is not None:
+            hunk.end = line_end
+        current.end = line_end
+        pos = line_end
+
+    if current is not None:
+        yield current
@@ -0,0 +1,160 @@
+# CONTENT-ADDRESSED EMBEDDING CACHE KEYED BY (MODEL, SHA256 OF CHUNK TEXT)
+# In-process LRU tier in front of a SQLite tier under /tmp, which survives warm Lambda invocations
+from logic_functions.telemetry import record_cache
+
+from collections import OrderedDict
+from hashlib import sha256
+from array import array
+import os
+import time
+import sqlite3
+import threading
+import dotenv
+
+dotenv.load_dotenv()
+
+# Serverless/containerized only allows writing to '/tmp' directory
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "/tmp/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "10000"))
+# Rows kept in the SQLite tier; past this, the least recently used rows are pruned on write so /tmp does not fill up
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "50000"))
+# A prune goes down to this fraction of the cap, so it does not run again on every write
+PRUNE_TO_FRACTION = 0.9
+
+
+def hash_content(text):
+    return sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pack(vector: list[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache: a bounded in-memory LRU backed by a SQLite file."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+                 max_rows: int = EMBEDDING_CACHE_MAX_ROWS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        # Upper bound on the SQLite row count (replaced rows are counted as new), recounted when it passes the cap
+        self._rows = 0
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        # Opened on first use so importing the module never touches the filesystem
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash))"
+            )
+            # Files written before the row cap have no access time; their rows are pruned first
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")]
+            if "last_used" not in columns:
+                self._conn.execute("ALTER TABLE embeddings ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._conn.commit()
+            self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self._conn
+
+    def _remember(self, key: tuple[str, str], vector: list[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    ### CALLED BY: embed_texts
+    ### PURPOSE: Looks up many content hashes at once, promoting persistent hits into the LRU tier
+    # @param model: str - The embedding model the vectors were produced by
+    # @param hashes: list[str] - The content hashes to be looked up
+    # @return: dict[str, list[float]] - The cached vectors, keyed by content hash
+    def get_many(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            missing = []
+            for content_hash in unique_hashes:
+                key = (model, content_hash)
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[content_hash] = self._memory[key]
+                else:
+                    missing.append(content_hash)
+
+            if missing:
+                conn = self._connection()
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(missing), 500):
+                    batch = missing[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = conn.execute(
+                        f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                        [model, *batch]
+                    ).fetchall()
+                    for content_hash, blob in rows:
+                        vector = _unpack(blob)
+                        found[content_hash] = vector
+                        self._remember((model, content_hash), vector)
+                    if rows:
+                        conn.execute(
+                            f"UPDATE embeddings SET last_used = ? WHERE model = ? AND hash IN ({','.join('?' * len(rows))})",
+                            [time.time(), model, *(content_hash for content_hash, _ in rows)]
+                        )
+                conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(unique_hashes) - len(found)
+        record_cache("embedding", len(found), len(unique_hashes) - len(found))
+        return found
+
+    ### CALLED BY: embed_texts
+    ### PURPOSE: Stores freshly embedded vectors in both tiers, pruning the SQLite tier once it passes its row cap
+    # @param model: str - The embedding model the vectors were produced by
+    # @param vectors: dict[str, list[float]] - The vectors to be stored, keyed by content hash
+    def put_many(self, model: str, vectors: dict[str, list[float]]):
+        if not vectors:
+            return
+        with self._lock:
+            for content_hash, vector in vectors.items():
+                self._remember((model, content_hash), vector)
+            conn = self._connection()
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, content_hash, _pack(vector), now) for content_hash, vector in vectors.items()]
+            )
+            self._rows += len(vectors)
+            if self._rows > self.max_rows:
+                self._prune(conn)
+            conn.commit()
+
+    def _prune(self, conn: sqlite3.Connection):
+        # Hits served by the LRU tier do not refresh last_used, but those vectors stay in memory while they are hot
+        self._rows = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self._rows <= self.max_rows:
+            return
+        excess = self._rows - int(self.max_rows * PRUNE_TO_FRACTION)
+        conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._rows -= excess
+
+
+# Shared cache for the whole process, so warm invocations reuse it
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,183 @@
+# SHARED EMBEDDING SERVICE USED BY RETRIEVAL, RE-INDEXING AND INITIAL INDEXING
+# Packs many inputs into each embeddings request and runs a bounded number of requests concurrently
+from logic_functions.embedding_cache import embedding_cache, hash_content
+from logic_functions.telemetry import span, record_usage
+from logic_functions.clients import get_client
+from logic_functions.async_utils import run_blocking
+
+import os
+import asyncio
+import logging
+import dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# OpenAI limits: 2048 inputs and 300k tokens per request, 8191 tokens per input
+MAX_BATCH_ITEMS = int(os.getenv("EMBEDDING_MAX_BATCH_ITEMS", "2048"))
+MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "250000"))
+MAX_INPUT_TOKENS = 8191
+MAX_CONCURRENT_BATCHES = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+
+
+### CALLED BY: diff packing, chunking, the review scheduler and summarizer
+### PURPOSE: Cheap token estimate (~4 characters per token) used to size prompts and chunks without a tokenizer
+# Not a bound: it undercounts code, minified and non-ASCII text, so the embedding API limits use count_tokens
+# @param text: str - The text to be measured
+# @return: int - The estimated number of tokens
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+_encoder = None
+
+
+def _tokenizer():
+    # tiktoken is optional; without it count_tokens falls back to a conservative estimate
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoder = False
+    return _encoder
+
+
+### CALLED BY: build_batches, _truncate
+### PURPOSE: Counts tokens as the embedding models do (cl100k_base), or over-estimates them when tiktoken is missing
+# The fallback assumes 3 ASCII characters per token and one token per byte of non-ASCII text
+# @param text: str - The text to be measured
+# @return: int - The number of tokens, or an upper estimate of it
+def count_tokens(text: str) -> int:
+    encoder = _tokenizer()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // 3 + len(text.encode("utf-8")) - ascii_chars + 1
+
+
+### CALLED BY: embed_texts
+### PURPOSE: Groups input indices into batches that respect the per-request item and token limits
+# 1. Truncate any single input that would exceed the per-input token limit
+# 2. Start a new batch whenever adding the next input would exceed either limit
+# @param texts: list[str] - The texts to be embedded
+# @return: list[list[int]] - The indices of texts, grouped per request
+def build_batches(texts: list[str]) -> list[list[int]]:
+    batches = []
+    current = []
+    current_tokens = 0
+
+    for i, text in enumerate(texts):
+        tokens = min(count_tokens(text), MAX_INPUT_TOKENS)
+        if current and (len(current) >= MAX_BATCH_ITEMS or current_tokens + tokens > MAX_BATCH_TOKENS):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _truncate(text: str) -> str:
+    # Keep inputs under the per-input limit, using the same count as build_batches
+    tokens = count_tokens(text)
+    if tokens <= MAX_INPUT_TOKENS:
+        return text
+    encoder = _tokenizer()
+    if encoder:
+        return encoder.decode(encoder.encode(text, disallowed_special=())[:MAX_INPUT_TOKENS])
+    while tokens > MAX_INPUT_TOKENS:
+        text = text[:int(len(text) * MAX_INPUT_TOKENS / tokens * 0.95)]
+        tokens = count_tokens(text)
+    return text
+
+
+### CALLED BY: retrieve_context_from_diff, update_file_embeddings, embed_chunks
+### PURPOSE: Embeds a list of texts in as few requests as possible, mapping vectors back to input order
+# 1. Serve texts whose (model, content hash) is already cached, and collapse duplicate texts
+# 2. Group the remaining texts into size-bounded batches
+# 3. Send the batches concurrently, bounded by MAX_CONCURRENT_BATCHES, and cache the results
+# 4. Place each vector at the index of its input
+# @param texts: list[str] - The texts to be embedded
+# @param model: str - The embedding model to be used
+# @return: list[list[float] | None] - One vector per input, None where it could not be embedded
+async def embed_texts(texts: list[str], model: str = EMBEDDING_MODEL) -> list[list[float] | None]:
+    if not texts:
+        return []
+
+    hashes = [hash_content(text) for text in texts]
+    # The SQLite tier is read and written off the event loop, like every other store
+    vectors_by_hash = await run_blocking(embedding_cache.get_many, model, hashes)
+
+    # Only distinct, uncached texts are sent to the API
+    pending = {}
+    for text, content_hash in zip(texts, hashes):
+        if content_hash not in vectors_by_hash and content_hash not in pending:
+            pending[content_hash] = text
+    pending_hashes = list(pending)
+    pending_texts = list(pending.values())
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_BATCHES)
+    new_vectors = {}
+
+    async def embed_batch(batch: list[int]):
+        async with semaphore:
+            try:
+                with span("openai.embeddings", inputs=len(batch)):
+                    response = await get_client("openai").embeddings.create(
+                        input=[_truncate(pending_texts[i]) for i in batch],
+                        model=model
+                    )
+                error = None
+            except Exception as e:
+                error = e
+        if error is not None:
+            # A rejected request (e.g. over a token limit the count missed) is split in half rather than dropped whole,
+            # so only an input that fails on its own goes without a vector
+            if getattr(error, "status_code", None) == 400 and len(batch) > 1:
+                print(f"Embedding batch of {len(batch)} inputs rejected ({error}), retrying as two halves")
+                half = len(batch) // 2
+                await asyncio.gather(embed_batch(batch[:half]), embed_batch(batch[half:]))
+            else:
+                print(f"Error embedding batch of {len(batch)} inputs: {error}")
+            return
+        usage = getattr(response, "usage", None)
+        record_usage(model, getattr(usage, "prompt_tokens", 0) or 0)
+        # Results carry the position of their input within the request
+        for item in response.data:
+            new_vectors[pending_hashes[batch[item.index]]] = item.embedding
+
+    if pending_texts:
+        batches = build_batches(pending_texts)
+        await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        await run_blocking(embedding_cache.put_many, model, new_vectors)
+        print(f"Embedded {len(pending_texts)} inputs in {len(batches)} request(s), {len(texts) - len(pending_texts)} reused from cache or duplicates")
+
+    vectors_by_hash.update(new_vectors)
+    return [vectors_by_hash.get(content_hash) for content_hash in hashes]
+
+
+### CALLED BY: update_file_embeddings, embed_chunks
+### PURPOSE: Embeds chunk dictionaries in place, returning only the chunks that received an embedding
+# @param chunks: list[dict] - Chunks with "text" and "metadata" keys
+# @param model: str - The embedding model to be used
+# @return: list[dict] - The chunks with an "embedding" key set
+async def embed_chunks_batched(chunks: list[dict], model: str = EMBEDDING_MODEL) -> list[dict]:
+    vectors = await embed_texts([chunk["text"] for chunk in chunks], model=model)
+
+    embedded_chunks = []
+    for chunk, vector in zip(chunks, vectors):
+        if vector is None:
+            logger.warning(f"No embedding returned for chunk {chunk['id']}")
+            continue
+        chunk["embedding"] = vector
+        embedded_chunks.append(chunk)
+    return embedded_chunks
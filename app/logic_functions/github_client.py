@@ -0,0 +1,93 @@
+# SHARED, POOLED HTTP CLIENT FOR ALL GITHUB TRAFFIC (DIFFS, COMMENTS, RAW FILE CONTENT)
+# One long-lived client per event loop, so connections and TLS sessions are reused across calls
+import os
+import random
+import asyncio
+import logging
+import importlib.util
+import httpx
+import dotenv
+
+from logic_functions.telemetry import span, metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+
+GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", "4"))
+GITHUB_MAX_CONCURRENCY = int(os.getenv("GITHUB_MAX_CONCURRENCY", "8"))
+GITHUB_TIMEOUT_SECONDS = float(os.getenv("GITHUB_TIMEOUT_SECONDS", "30"))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# A 5xx or dropped connection on a POST may still have created the comment, so only retry those on 429 / connect errors
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "PATCH"}
+
+# HTTP/2 needs the optional 'h2' package; fall back to HTTP/1.1 keep-alive without it
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_client = None
+_client_loop = None
+
+
+### CALLED BY: github_request
+### PURPOSE: Returns the shared client, creating it on first use (or if the event loop changed)
+# @return: httpx.AsyncClient - The pooled client
+def get_http_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    # Pooled connections belong to the loop that opened them
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            follow_redirects=True,
+            timeout=GITHUB_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=GITHUB_MAX_CONCURRENCY * 2, max_keepalive_connections=GITHUB_MAX_CONCURRENCY)
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def _retry_delay(response: httpx.Response | None, attempt: int) -> float:
+    # Honour Retry-After from GitHub's secondary rate limits, otherwise back off exponentially with jitter
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return min(2 ** attempt, 30) + random.uniform(0, 0.5)
+
+
+### CALLED BY: get_diff, get_compare_diff, post_comment, update_comment, get_file_content
+### PURPOSE: Sends a request through the shared client, retrying on 429/5xx and transport errors
+# @param method: str - The HTTP method
+# @param url: str - The URL to be requested
+# @return: httpx.Response - The final response (which may still be an error status)
+async def github_request(method: str, url: str, **kwargs) -> httpx.Response:
+    client = get_http_client()
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    retry_statuses = RETRY_STATUS_CODES if idempotent else {429}
+    for attempt in range(GITHUB_MAX_RETRIES + 1):
+        try:
+            with span("github.request", method=method.upper(), attempt=attempt) as attributes:
+                response = await client.request(method, url, **kwargs)
+                attributes["http_status"] = response.status_code
+            metrics.inc("github_responses_total", help="GitHub responses by status", method=method.upper(), status=response.status_code)
+        except httpx.TransportError as e:
+            if attempt == GITHUB_MAX_RETRIES or not (idempotent or isinstance(e, httpx.ConnectError)):
+                raise
+            delay = _retry_delay(None, attempt)
+            logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        if response.status_code not in retry_statuses or attempt == GITHUB_MAX_RETRIES:
+            return response
+        delay = _retry_delay(response, attempt)
+        logger.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
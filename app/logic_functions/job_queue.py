@@ -0,0 +1,236 @@
+# DURABLE JOB QUEUE BETWEEN THE /review WEBHOOK AND THE REVIEW WORKERS
+# The webhook only enqueues; workers lease jobs for a visibility timeout, so a job whose worker dies is
+# redelivered. SQLite backs local runs and tests; SQS (a FIFO queue, one message group per pull request) backs production
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+import dotenv
+
+from logic_functions.clients import get_client
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+
+# Lambda containers are frozen between invocations and do not share /tmp, so there the queue is SQS by default
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "sqs" if os.getenv("AWS_LAMBDA_FUNCTION_NAME") else "sqlite").lower()
+# Serverless/containerized only allows writing to '/tmp' directory
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "/tmp/review_jobs.sqlite3")
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL")
+# A leased job becomes visible again after this long without an ack or a lease extension
+JOB_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "900"))
+# How long an SQS receive waits for messages (long polling)
+JOB_RECEIVE_WAIT_SECONDS = int(os.getenv("JOB_RECEIVE_WAIT_SECONDS", "20"))
+
+
+class Job:
+    """One leased job; receipt identifies the lease, so a stale worker cannot ack a redelivered job."""
+    __slots__ = ("id", "group", "payload", "attempts", "receipt")
+
+    def __init__(self, id: str, group: str, payload: dict, attempts: int, receipt: str):
+        self.id = id
+        self.group = group
+        self.payload = payload
+        self.attempts = attempts
+        self.receipt = receipt
+
+    def __repr__(self) -> str:
+        return f"Job({self.id!r}, group={self.group!r}, attempts={self.attempts})"
+
+
+class SQLiteJobQueue:
+    """Jobs in a SQLite file; leases are row updates made inside an immediate transaction."""
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        # Opened on first use so importing the module never touches the filesystem
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit mode, so transactions are explicit; the timeout lets several processes share the file
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, grp TEXT NOT NULL, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0, "
+                "visible_at REAL NOT NULL, receipt TEXT, error TEXT, created REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_visible ON jobs (status, visible_at)")
+        return self._conn
+
+    def enqueue(self, payload: dict, group: str, deduplication_id: str | None = None) -> str:
+        # Duplicate deliveries are already dropped by the delivery log before anything is enqueued
+        now = time.time()
+        with self._lock:
+            cursor = self._connection().execute(
+                "INSERT INTO jobs (grp, payload, visible_at, created) VALUES (?, ?, ?, ?)",
+                (group, json.dumps(payload), now, now)
+            )
+        return str(cursor.lastrowid)
+
+    ### CALLED BY: ReviewWorkerPool.run
+    ### PURPOSE: Leases up to max_jobs visible jobs, round-robin across groups (pull requests)
+    # 1. Count the jobs each group already has leased
+    # 2. Order visible jobs so every group's oldest job comes before any group's next one, skipping full groups
+    # 3. Lease the chosen jobs for the visibility timeout
+    # @param max_jobs: int - The maximum number of jobs to lease
+    # @param visibility_timeout: int - Seconds before an unacknowledged job is redelivered
+    # @param max_per_group: int | None - The maximum leased jobs per group, across all workers
+    # @return: list[Job] - The leased jobs
+    def receive(self, max_jobs: int, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT_SECONDS,
+                max_per_group: int | None = None) -> list[Job]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                leased = dict(conn.execute(
+                    "SELECT grp, COUNT(*) FROM jobs WHERE status = 'queued' AND receipt IS NOT NULL AND visible_at > ? GROUP BY grp",
+                    (now,)
+                ).fetchall())
+                candidates = conn.execute(
+                    "SELECT id, grp, payload, attempts FROM jobs WHERE status = 'queued' AND visible_at <= ? ORDER BY id LIMIT ?",
+                    (now, max_jobs * 50)
+                ).fetchall()
+
+                ranked = []
+                queued = {}
+                for row in candidates:
+                    group = row[1]
+                    rank = leased.get(group, 0) + queued.get(group, 0)
+                    queued[group] = queued.get(group, 0) + 1
+                    if max_per_group is None or rank < max_per_group:
+                        ranked.append((rank, row))
+                ranked.sort(key=lambda item: (item[0], item[1][0]))
+
+                jobs = []
+                for _, (job_id, group, payload, attempts) in ranked[:max_jobs]:
+                    receipt = uuid.uuid4().hex
+                    conn.execute(
+                        "UPDATE jobs SET attempts = attempts + 1, visible_at = ?, receipt = ? WHERE id = ?",
+                        (now + visibility_timeout, receipt, job_id)
+                    )
+                    jobs.append(Job(str(job_id), group, json.loads(payload), attempts + 1, receipt))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return jobs
+
+    def extend(self, job: Job, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT_SECONDS):
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET visible_at = ? WHERE id = ? AND receipt = ?",
+                (time.time() + visibility_timeout, int(job.id), job.receipt)
+            )
+
+    def ack(self, job: Job):
+        with self._lock:
+            self._connection().execute("DELETE FROM jobs WHERE id = ? AND receipt = ?", (int(job.id), job.receipt))
+
+    def retry(self, job: Job, delay: float):
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET visible_at = ?, receipt = NULL WHERE id = ? AND receipt = ?",
+                (time.time() + delay, int(job.id), job.receipt)
+            )
+
+    def dead_letter(self, job: Job, error: str):
+        # Kept for inspection rather than deleted
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET status = 'dead', error = ?, receipt = NULL WHERE id = ? AND receipt = ?",
+                (error, int(job.id), job.receipt)
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+
+class SQSJobQueue:
+    """Jobs as SQS messages. With a FIFO queue each pull request is a message group, which SQS serves one message at a time."""
+
+    def __init__(self, queue_url: str | None = JOB_QUEUE_URL):
+        if not queue_url:
+            raise ValueError("JOB_QUEUE_BACKEND is sqs but JOB_QUEUE_URL is not set")
+        self.queue_url = queue_url
+        self.fifo = queue_url.endswith(".fifo")
+        self.sqs = get_client("sqs")
+
+    def enqueue(self, payload: dict, group: str, deduplication_id: str | None = None) -> str:
+        kwargs = {"QueueUrl": self.queue_url, "MessageBody": json.dumps({"group": group, "payload": payload})}
+        if self.fifo:
+            kwargs["MessageGroupId"] = group
+            kwargs["MessageDeduplicationId"] = deduplication_id or uuid.uuid4().hex
+        return self.sqs.send_message(**kwargs)["MessageId"]
+
+    ### CALLED BY: ReviewWorkerPool.run
+    ### PURPOSE: Long-polls for up to max_jobs messages; per-group limits are left to FIFO message groups
+    def receive(self, max_jobs: int, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT_SECONDS,
+                max_per_group: int | None = None) -> list[Job]:
+        response = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=max(1, min(max_jobs, 10)),
+            VisibilityTimeout=visibility_timeout,
+            WaitTimeSeconds=JOB_RECEIVE_WAIT_SECONDS,
+            AttributeNames=["ApproximateReceiveCount"]
+        )
+        return [job_from_sqs_record(message) for message in response.get("Messages", [])]
+
+    def extend(self, job: Job, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT_SECONDS):
+        self.sqs.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=job.receipt, VisibilityTimeout=visibility_timeout)
+
+    def ack(self, job: Job):
+        self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=job.receipt)
+
+    def retry(self, job: Job, delay: float):
+        self.sqs.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=job.receipt, VisibilityTimeout=int(delay))
+
+    def dead_letter(self, job: Job, error: str):
+        # A redrive policy on the queue keeps failed messages; without one, the message is dropped here
+        logger.error(f"Dropping job {job.id} after {job.attempts} attempts: {error}")
+        self.ack(job)
+
+
+### CALLED BY: SQSJobQueue.receive, sqs_handler
+### PURPOSE: Builds a Job from an SQS message, as returned by ReceiveMessage or delivered to a Lambda SQS trigger
+# @param message: dict - The message (keys are capitalized from ReceiveMessage, lower camel case in Lambda events)
+# @return: Job - The job, with attempts taken from the message's receive count
+def job_from_sqs_record(message: dict) -> Job:
+    body = json.loads(message.get("Body") or message.get("body"))
+    attributes = message.get("Attributes") or message.get("attributes") or {}
+    return Job(
+        message.get("MessageId") or message.get("messageId"),
+        body["group"],
+        body["payload"],
+        int(attributes.get("ApproximateReceiveCount", 1)),
+        message.get("ReceiptHandle") or message.get("receiptHandle")
+    )
+
+
+_queue = None
+
+
+### CALLED BY: webhook, review_worker
+### PURPOSE: Returns the process-wide queue selected by JOB_QUEUE_BACKEND ("sqlite" or "sqs")
+def get_job_queue():
+    global _queue
+    if _queue is None:
+        if JOB_QUEUE_BACKEND == "sqs":
+            _queue = SQSJobQueue()
+        elif JOB_QUEUE_BACKEND == "sqlite":
+            _queue = SQLiteJobQueue()
+        else:
+            raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {JOB_QUEUE_BACKEND}")
+    return _queue
@@ -0,0 +1,367 @@
+# IN-PROCESS VECTOR INDEX WITH THE SAME query / upsert / delete / update SURFACE AS THE PINECONE INDEX
+# Brute-force cosine search over one contiguous float32 (or int8-quantized) matrix, with an inverted
+# index on metadata for the filters the pipeline uses; persisted next to the chunk store.
+# The S3 copy is published with a conditional write: a writer that lost the race replays its own writes onto the
+# winner's copy and tries again, so concurrent indexers no longer overwrite each other
+from logic_functions.s3_upload import get_s3_object, put_s3_object, S3_BUCKET, CHUNK_STORE_PREFIX
+
+import io
+import os
+import json
+import logging
+import threading
+import numpy as np
+import dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+
+LOCAL_VECTOR_INDEX_PATH = os.getenv("LOCAL_VECTOR_INDEX_PATH", "/tmp/vector_index.npz")
+LOCAL_VECTOR_INDEX_KEY = f"{CHUNK_STORE_PREFIX}/vector_index.npz"
+# int8 storage cuts memory 4x for a small loss of ranking precision
+LOCAL_VECTOR_INDEX_QUANTIZE = os.getenv("LOCAL_VECTOR_INDEX_QUANTIZE", "false").lower() == "true"
+# Attempts at publishing the S3 copy when other writers keep changing it underneath
+LOCAL_VECTOR_INDEX_PUBLISH_ATTEMPTS = int(os.getenv("LOCAL_VECTOR_INDEX_PUBLISH_ATTEMPTS", "10"))
+# Metadata fields with an inverted index, so "$eq" / "$in" filters never scan every row
+INDEXED_FIELDS = ("repo", "path")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def _matches(value, condition) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "$eq" and value != operand:
+            return False
+        if op == "$ne" and value == operand:
+            return False
+        if op == "$in" and value not in operand:
+            return False
+        if op == "$nin" and value in operand:
+            return False
+    return True
+
+
+class LocalVectorIndex:
+    """Drop-in for pinecone.Index covering the calls made by the review pipeline and the indexers."""
+
+    def __init__(self, dimension: int | None = None, quantize: bool = LOCAL_VECTOR_INDEX_QUANTIZE, path: str = LOCAL_VECTOR_INDEX_PATH,
+                 key: str = LOCAL_VECTOR_INDEX_KEY):
+        self.path = path
+        self.key = key
+        # ETag of the S3 copy this index was loaded from or last published
+        self.etag = None
+        self.quantize = quantize
+        self.dimension = dimension
+        self._ids = []
+        self._rows = {}
+        self._metadata = []
+        self._matrix = None
+        self._scales = None
+        self._count = 0
+        # (field, value) -> ids, for INDEXED_FIELDS
+        self._postings = {}
+        self._dirty = False
+        # Writes since the last publish, replayed onto a newer S3 copy when a publish conflicts
+        self._log = []
+        self._lock = threading.RLock()
+
+    # ----------------------------
+    # Storage
+    # ----------------------------
+
+    def _ensure_capacity(self, needed: int):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        dtype = np.int8 if self.quantize else np.float32
+        matrix = np.zeros((new_capacity, self.dimension), dtype=dtype)
+        scales = np.zeros(new_capacity, dtype=np.float32)
+        if self._matrix is not None:
+            matrix[:self._count] = self._matrix[:self._count]
+            scales[:self._count] = self._scales[:self._count]
+        self._matrix = matrix
+        self._scales = scales
+
+    def _encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        vectors = _normalize(vectors.astype(np.float32))
+        if not self.quantize:
+            return vectors, np.ones(len(vectors), dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _post(self, chunk_id: str, metadata: dict):
+        for field in INDEXED_FIELDS:
+            if field in metadata:
+                self._postings.setdefault((field, metadata[field]), set()).add(chunk_id)
+
+    def _unpost(self, chunk_id: str, metadata: dict):
+        for field in INDEXED_FIELDS:
+            ids = self._postings.get((field, metadata.get(field)))
+            if ids is not None:
+                ids.discard(chunk_id)
+                if not ids:
+                    del self._postings[(field, metadata.get(field))]
+
+    def _remove_row(self, chunk_id: str):
+        row = self._rows.pop(chunk_id)
+        self._unpost(chunk_id, self._metadata[row])
+        last = self._count - 1
+        if row != last:
+            # Swap the last row into the hole, keeping the matrix contiguous
+            moved_id = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._scales[row] = self._scales[last]
+            self._ids[row] = moved_id
+            self._metadata[row] = self._metadata[last]
+            self._rows[moved_id] = row
+        self._ids.pop()
+        self._metadata.pop()
+        self._count -= 1
+
+    # ----------------------------
+    # Pinecone-compatible surface
+    # ----------------------------
+
+    def upsert(self, vectors: list[dict], **kwargs) -> dict:
+        if not vectors:
+            return {"upserted_count": 0}
+        with self._lock:
+            self._log.append(("upsert", {"vectors": vectors}))
+            values = np.asarray([vector["values"] for vector in vectors], dtype=np.float32)
+            if self.dimension is None:
+                self.dimension = values.shape[1]
+            encoded, scales = self._encode(values)
+            for vector, row_values, scale in zip(vectors, encoded, scales):
+                chunk_id = vector["id"]
+                metadata = vector.get("metadata") or {}
+                if chunk_id in self._rows:
+                    row = self._rows[chunk_id]
+                    self._unpost(chunk_id, self._metadata[row])
+                else:
+                    self._ensure_capacity(self._count + 1)
+                    row = self._count
+                    self._count += 1
+                    self._ids.append(chunk_id)
+                    self._metadata.append(None)
+                    self._rows[chunk_id] = row
+                self._matrix[row] = row_values
+                self._scales[row] = scale
+                self._metadata[row] = metadata
+                self._post(chunk_id, metadata)
+            self._dirty = True
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids: list[str] | None = None, filter: dict | None = None, delete_all: bool = False, **kwargs) -> dict:
+        with self._lock:
+            self._log.append(("delete", {"ids": ids, "filter": filter, "delete_all": delete_all}))
+            if delete_all:
+                targets = list(self._ids)
+            elif filter is not None:
+                targets = [self._ids[row] for row in self._filter_rows(filter)]
+            else:
+                targets = [chunk_id for chunk_id in ids or [] if chunk_id in self._rows]
+            for chunk_id in targets:
+                self._remove_row(chunk_id)
+            self._dirty = self._dirty or bool(targets)
+        return {}
+
+    def update(self, id: str, set_metadata: dict | None = None, values: list[float] | None = None, **kwargs) -> dict:
+        with self._lock:
+            self._log.append(("update", {"id": id, "set_metadata": set_metadata, "values": values}))
+            if id not in self._rows:
+                return {}
+            row = self._rows[id]
+            if set_metadata:
+                self._unpost(id, self._metadata[row])
+                self._metadata[row] = {**self._metadata[row], **set_metadata}
+                self._post(id, self._metadata[row])
+            if values is not None:
+                encoded, scales = self._encode(np.asarray([values], dtype=np.float32))
+                self._matrix[row] = encoded[0]
+                self._scales[row] = scales[0]
+            self._dirty = True
+        return {}
+
+    def _filter_rows(self, filter: dict | None) -> np.ndarray:
+        if not filter:
+            return np.arange(self._count)
+
+        candidates = None
+        remaining = {}
+        for field, condition in filter.items():
+            operand = condition.get("$eq", condition.get("$in")) if isinstance(condition, dict) else condition
+            if field in INDEXED_FIELDS and operand is not None and (not isinstance(condition, dict) or condition.keys() <= {"$eq", "$in"}):
+                values = operand if isinstance(operand, (list, tuple, set)) else [operand]
+                ids = set().union(*(self._postings.get((field, value), ()) for value in values))
+                candidates = ids if candidates is None else candidates & ids
+            else:
+                remaining[field] = condition
+
+        rows = range(self._count) if candidates is None else (self._rows[chunk_id] for chunk_id in candidates)
+        if remaining:
+            rows = (row for row in rows if all(_matches(self._metadata[row].get(field), condition) for field, condition in remaining.items()))
+        return np.fromiter(rows, dtype=np.int64)
+
+    def query(self, vector: list[float], top_k: int = 10, include_metadata: bool = False, filter: dict | None = None, **kwargs) -> dict:
+        with self._lock:
+            if self._count == 0:
+                return {"matches": []}
+            rows = self._filter_rows(filter)
+            if len(rows) == 0:
+                return {"matches": []}
+
+            query = _normalize(np.asarray([vector], dtype=np.float32))[0]
+            candidates = self._matrix[rows]
+            scores = (candidates.astype(np.float32, copy=False) @ query) * self._scales[rows]
+
+            k = min(top_k, len(rows))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+
+            matches = []
+            for position in best:
+                row = rows[position]
+                match = {"id": self._ids[row], "score": float(scores[position])}
+                if include_metadata:
+                    match["metadata"] = self._metadata[row]
+                matches.append(match)
+        return {"matches": matches}
+
+    def describe_index_stats(self, **kwargs) -> dict:
+        return {"dimension": self.dimension, "total_vector_count": self._count}
+
+    # ----------------------------
+    # Persistence (locally, and next to the chunk store in S3 when a bucket is configured)
+    # ----------------------------
+
+    def _serialize(self) -> bytes:
+        buffer = io.BytesIO()
+        state = json.dumps({"ids": self._ids, "metadata": self._metadata, "quantize": self.quantize}).encode("utf-8")
+        np.savez(
+            buffer,
+            matrix=self._matrix[:self._count] if self._matrix is not None else np.zeros((0, 0), dtype=np.float32),
+            scales=self._scales[:self._count] if self._scales is not None else np.zeros(0, dtype=np.float32),
+            state=np.frombuffer(state, dtype=np.uint8)
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def _deserialize(cls, body: bytes, path: str, key: str = LOCAL_VECTOR_INDEX_KEY) -> "LocalVectorIndex":
+        data = np.load(io.BytesIO(body))
+        state = json.loads(data["state"].tobytes())
+        matrix = data["matrix"]
+        index = cls(dimension=matrix.shape[1] if matrix.size else None, quantize=state["quantize"], path=path, key=key)
+        index._ids = state["ids"]
+        index._metadata = state["metadata"]
+        index._count = len(index._ids)
+        index._rows = {chunk_id: row for row, chunk_id in enumerate(index._ids)}
+        if index._count:
+            index._matrix = np.ascontiguousarray(matrix)
+            index._scales = data["scales"]
+        for chunk_id, metadata in zip(index._ids, index._metadata):
+            index._post(chunk_id, metadata)
+        return index
+
+    def _save_local(self, body: bytes, etag: str | None):
+        # The local copy records the ETag it matches, so load can revalidate it against S3
+        with open(self.path, "wb") as f:
+            f.write(body)
+        with open(self.path + ".etag", "w") as f:
+            f.write(etag or "")
+
+    def _adopt(self, body: bytes | None, etag: str | None):
+        # Replaces the contents with an S3 copy plus the writes not yet published in it; caller holds the lock
+        fresh = LocalVectorIndex._deserialize(body, self.path, self.key) if body is not None else LocalVectorIndex(quantize=self.quantize, path=self.path, key=self.key)
+        for operation, kwargs in self._log:
+            getattr(fresh, operation)(**kwargs)
+        for field in ("dimension", "quantize", "_ids", "_rows", "_metadata", "_matrix", "_scales", "_count", "_postings"):
+            setattr(self, field, getattr(fresh, field))
+        self._dirty = bool(self._log)
+        self.etag = etag
+
+    ### CALLED BY: flush_vector_index
+    ### PURPOSE: Persists the index if it changed since the last flush
+    # 1. Publish the S3 copy only if it is still the version this index was built on (or create it if there is none)
+    # 2. On a conflict, rebuild from the newer copy, replay this index's unpublished writes onto it, and try again
+    def flush(self):
+        for attempt in range(LOCAL_VECTOR_INDEX_PUBLISH_ATTEMPTS):
+            with self._lock:
+                if not self._dirty:
+                    return
+                body = self._serialize()
+                published = len(self._log)
+                etag = self.etag
+            new_etag = None
+            if S3_BUCKET:
+                if etag:
+                    new_etag = put_s3_object(self.key, body, if_match=etag)
+                else:
+                    new_etag = put_s3_object(self.key, body, if_none_match="*")
+                if new_etag is None:
+                    logger.info(f"Vector index {self.key} changed concurrently, merging (attempt {attempt + 1})")
+                    latest, latest_etag = get_s3_object(self.key)
+                    with self._lock:
+                        self._adopt(latest, latest_etag)
+                    continue
+            with self._lock:
+                # Writes made while uploading stay in the log for the next flush
+                del self._log[:published]
+                self._dirty = bool(self._log)
+                self.etag = new_etag
+            self._save_local(body, new_etag)
+            return
+        raise RuntimeError(f"Could not publish the vector index after {LOCAL_VECTOR_INDEX_PUBLISH_ATTEMPTS} attempts")
+
+    ### CALLED BY: revalidate_vector_index
+    ### PURPOSE: Picks up a newer S3 copy published by another process, keeping this index's unpublished writes
+    # @return: bool - Whether a newer copy was loaded
+    def revalidate(self) -> bool:
+        if not S3_BUCKET:
+            return False
+        body, etag = get_s3_object(self.key, if_none_match=self.etag)
+        if body is None:
+            return False
+        with self._lock:
+            self._adopt(body, etag)
+        self._save_local(body, etag)
+        return True
+
+    ### CALLED BY: open_vector_index
+    ### PURPOSE: Loads the persisted index, using the local copy only while S3 still holds the same version
+    @classmethod
+    def load(cls, path: str = LOCAL_VECTOR_INDEX_PATH, key: str = LOCAL_VECTOR_INDEX_KEY) -> "LocalVectorIndex":
+        body = local_etag = None
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                body = f.read()
+            if os.path.exists(path + ".etag"):
+                with open(path + ".etag") as f:
+                    local_etag = f.read().strip() or None
+        etag = local_etag
+        if S3_BUCKET:
+            remote, etag = get_s3_object(key, if_none_match=local_etag if body is not None else None)
+            if remote is not None:
+                body = remote
+                with open(path, "wb") as f:
+                    f.write(body)
+                with open(path + ".etag", "w") as f:
+                    f.write(etag)
+            elif etag is None and body is not None:
+                # Never published: the local copy is all there is, and the first flush creates the S3 copy
+                logger.info(f"No S3 copy of the vector index at {key}, using the local copy")
+        if body is None:
+            logger.info("No persisted local vector index found, starting empty")
+            return cls(path=path, key=key)
+        index = cls._deserialize(body, path, key)
+        index.etag = etag
+        return index
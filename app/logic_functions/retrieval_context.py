@@ -0,0 +1,104 @@
+# PER-PULL-REQUEST MEMO FOR CONTEXT RETRIEVAL
+# The review requests of one PR look up overlapping shards, diff chunks and codebase chunks; this object
+# remembers each lookup and lets concurrent identical lookups share one in-flight call (single-flight)
+from logic_functions.s3_upload import get_full_chunk_by_id
+from logic_functions.chunk_store import ChunkStore, shard_for_path
+from logic_functions.embedding_service import embed_texts
+from logic_functions.async_utils import run_blocking
+from logic_functions.telemetry import span, record_cache
+
+import asyncio
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class RetrievalContext:
+    """Memoized, single-flight retrieval lookups for the review requests of one pull request."""
+
+    def __init__(self, repo_name: str, index, store: ChunkStore):
+        self.repo_name = repo_name
+        self.index = index
+        self.store = store
+        # key -> future of the lookup; failed lookups are forgotten so a later request retries them
+        self._shards = {}
+        self._embeddings = {}
+        self._queries = {}
+        self._chunk_texts = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, cache: dict, key, future: asyncio.Future):
+        def forget_failure(done: asyncio.Future):
+            if done.cancelled() or done.exception() is not None or done.result() is None:
+                if cache.get(key) is done:
+                    del cache[key]
+        cache[key] = future
+        future.add_done_callback(forget_failure)
+
+    ### CALLED BY: ensure_loaded, embed
+    ### PURPOSE: Resolves many keys at once, starting one batched fetch for the keys nobody has requested yet
+    # @param cache: dict - The memo of futures for this kind of lookup
+    # @param keys: list - The keys to be resolved
+    # @param fetch_many: callable - Coroutine function taking the missing keys and returning their results in order
+    # @return: list - The results, in the order of keys
+    async def _batched(self, cache: dict, keys: list, fetch_many) -> list:
+        missing = [key for key in dict.fromkeys(keys) if key not in cache]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        record_cache("retrieval", len(keys) - len(missing), len(missing))
+        if missing:
+            batch = asyncio.ensure_future(fetch_many(missing))
+
+            async def pick(position: int):
+                return (await batch)[position]
+
+            for position, key in enumerate(missing):
+                self._remember(cache, key, asyncio.ensure_future(pick(position)))
+        # Shielded, so one cancelled review request does not cancel a lookup other requests wait on
+        return await asyncio.gather(*(asyncio.shield(cache[key]) for key in keys))
+
+    async def ensure_loaded(self, paths: list[str]):
+        async def load(shards):
+            await run_blocking(self.store.ensure_shards_loaded, self.repo_name, shards)
+            return [True] * len(shards)
+        await self._batched(self._shards, [shard_for_path(path) for path in paths], load)
+
+    async def embed(self, texts: list[str]) -> list[list[float] | None]:
+        return await self._batched(self._embeddings, texts, embed_texts)
+
+    ### CALLED BY: retrieve_context_from_diff
+    ### PURPOSE: Queries the vector index for one diff chunk, once per PR for a given chunk, top_k and path filter
+    # @param text: str - The diff chunk, identifying the query
+    # @param vector: list[float] - The diff chunk's embedding
+    # @param top_k: int - The number of matches requested
+    # @param paths: list[str] - The paths the matches are restricted to
+    # @return: dict - The index's query result
+    async def query(self, text: str, vector: list[float], top_k: int, paths: list[str]) -> dict:
+        key = (text, top_k, frozenset(paths))
+        hit = key in self._queries
+        self.hits += hit
+        self.misses += not hit
+        record_cache("retrieval", int(hit), int(not hit))
+        if not hit:
+            self._remember(self._queries, key, asyncio.ensure_future(self._query(vector, top_k, paths)))
+        return await asyncio.shield(self._queries[key])
+
+    async def _query(self, vector: list[float], top_k: int, paths: list[str]) -> dict:
+        with span("vector_index.query", top_k=top_k):
+            return await run_blocking(
+                self.index.query,
+                vector=vector,
+                top_k=top_k,
+                include_metadata=True,
+                filter={"repo": {"$eq": self.repo_name}, "path": {"$in": list(paths)}}
+            )
+
+    def chunk_text(self, chunk_id: str) -> str:
+        if chunk_id not in self._chunk_texts:
+            text = get_full_chunk_by_id(chunk_id, self.store)
+            if not text:
+                return text
+            self._chunk_texts[chunk_id] = text
+        return self._chunk_texts[chunk_id]
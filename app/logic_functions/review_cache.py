@@ -0,0 +1,238 @@
+# PERSISTENT REVIEW OUTPUT CACHE, WEBHOOK DELIVERY LOG AND PER-PR REVIEW STATE
+# Reviews are keyed by a hash of everything that determines them (diff, context, model, prompt version),
+# so an unchanged file reuses its earlier review; the delivery log drops redundant webhook deliveries,
+# and the review state lets a push to an open PR be reviewed from the last reviewed commit.
+# The SQLite tables live in one container's /tmp; on Lambda the delivery log and review state are kept in S3 instead,
+# so every container sees them. The review cache stays per container: a miss only costs a model call
+from hashlib import sha256
+import os
+import json
+import time
+import sqlite3
+import threading
+import dotenv
+
+dotenv.load_dotenv()
+
+# Serverless/containerized only allows writing to '/tmp' directory
+REVIEW_CACHE_PATH = os.getenv("REVIEW_CACHE_PATH", "/tmp/review_cache.sqlite3")
+# Reviews older than this are regenerated, so model improvements eventually reach unchanged files
+REVIEW_CACHE_TTL_SECONDS = int(os.getenv("REVIEW_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# GitHub redelivers within hours; claims older than this are pruned
+DELIVERY_DEDUPE_TTL_SECONDS = int(os.getenv("DELIVERY_DEDUPE_TTL_SECONDS", str(24 * 3600)))
+# "s3" shares claims and review state across containers and workers; "sqlite" keeps them in this container's /tmp
+REVIEW_STATE_BACKEND = os.getenv("REVIEW_STATE_BACKEND", "s3" if os.getenv("AWS_LAMBDA_FUNCTION_NAME") else "sqlite").lower()
+# Claims are small objects under this prefix; an S3 lifecycle rule expiring them after a few days keeps it bounded
+REVIEW_STATE_PREFIX = "review_state"
+
+
+### CALLED BY: run_review_agent
+### PURPOSE: Builds the cache key of one review request
+# @param parts: str - Everything the review depends on (e.g. model, prompt version, label, diff, context)
+# @return: str - The sha256 of the parts, length-prefixed so different splits never collide
+def review_cache_key(*parts: str) -> str:
+    digest = sha256()
+    for part in parts:
+        encoded = part.encode("utf-8")
+        digest.update(f"{len(encoded)}:".encode("utf-8"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class _SqliteTable:
+    """One SQLite table under /tmp, opened on first use and shared across threads."""
+
+    schema = ""
+
+    def __init__(self, path: str = REVIEW_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        # Opened on first use so importing the module never touches the filesystem
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(self.schema)
+            self._conn.commit()
+        return self._conn
+
+
+class ReviewCache(_SqliteTable):
+    """Review outputs keyed by review_cache_key."""
+
+    schema = "CREATE TABLE IF NOT EXISTS reviews (key TEXT PRIMARY KEY, review TEXT NOT NULL, created REAL NOT NULL)"
+
+    def __init__(self, path: str = REVIEW_CACHE_PATH, ttl: int = REVIEW_CACHE_TTL_SECONDS):
+        super().__init__(path)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT review FROM reviews WHERE key = ? AND created > ?", (key, time.time() - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, review: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO reviews (key, review, created) VALUES (?, ?, ?)", (key, review, time.time()))
+            conn.commit()
+
+
+class DeliveryLog(_SqliteTable):
+    """Claims on webhook deliveries and PR head commits; only the first claim of a key proceeds."""
+
+    schema = "CREATE TABLE IF NOT EXISTS deliveries (key TEXT PRIMARY KEY, created REAL NOT NULL)"
+
+    def __init__(self, path: str = REVIEW_CACHE_PATH, ttl: int = DELIVERY_DEDUPE_TTL_SECONDS):
+        super().__init__(path)
+        self.ttl = ttl
+
+    ### CALLED BY: webhook
+    ### PURPOSE: Atomically records a key, reporting whether this caller is the first to see it
+    # @param key: str - e.g. "delivery:<X-GitHub-Delivery>" or "head:<repo>#<pr>@<sha>"
+    # @return: bool - True if the key was not claimed yet (within the TTL)
+    def claim(self, key: str) -> bool:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM deliveries WHERE created <= ?", (now - self.ttl,))
+            claimed = conn.execute("INSERT OR IGNORE INTO deliveries (key, created) VALUES (?, ?)", (key, now)).rowcount == 1
+            conn.commit()
+            return claimed
+
+    ### CALLED BY: webhook
+    ### PURPOSE: Releases a claim whose review did not complete, so a redelivery or re-trigger can run it
+    def release(self, key: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM deliveries WHERE key = ?", (key,))
+            conn.commit()
+
+
+class S3DeliveryLog:
+    """Claims as S3 objects created with a conditional write, so only one container or worker wins each key."""
+
+    def __init__(self, prefix: str = f"{REVIEW_STATE_PREFIX}/deliveries", ttl: int = DELIVERY_DEDUPE_TTL_SECONDS):
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{sha256(key.encode('utf-8')).hexdigest()}"
+
+    ### CALLED BY: webhook
+    ### PURPOSE: Atomically records a key, reporting whether this caller is the first to see it
+    # 1. Create the claim object only if it does not exist (IfNoneMatch="*")
+    # 2. If it exists but expired, replace it only if it is still the version read (IfMatch), so one caller wins
+    # @param key: str - e.g. "delivery:<X-GitHub-Delivery>" or "head:<repo>#<pr>@<sha>"
+    # @return: bool - True if the key was not claimed yet (within the TTL)
+    def claim(self, key: str) -> bool:
+        # Imported here: boto3 stays off the web handler's cold start until a delivery arrives
+        from logic_functions.s3_upload import get_s3_object, put_s3_object
+        object_key = self._key(key)
+        body = json.dumps({"key": key, "created": time.time()}).encode("utf-8")
+        if put_s3_object(object_key, body, if_none_match="*") is not None:
+            return True
+        existing, etag = get_s3_object(object_key)
+        if existing is None:
+            # Released in between
+            return put_s3_object(object_key, body, if_none_match="*") is not None
+        if json.loads(existing)["created"] > time.time() - self.ttl:
+            return False
+        return put_s3_object(object_key, body, if_match=etag) is not None
+
+    ### CALLED BY: webhook, abandon_job
+    ### PURPOSE: Releases a claim whose review did not complete, so a redelivery or re-trigger can run it
+    def release(self, key: str):
+        from logic_functions.s3_upload import delete_s3_object
+        delete_s3_object(self._key(key))
+
+
+class ReviewState(_SqliteTable):
+    """Per pull request: the last reviewed head commit and the review comment kept up to date for it."""
+
+    schema = ("CREATE TABLE IF NOT EXISTS pull_requests (key TEXT PRIMARY KEY, head_sha TEXT NOT NULL, "
+              "comment_url TEXT, body TEXT, updated REAL NOT NULL)")
+
+    ### CALLED BY: run_orchestration_agent
+    ### PURPOSE: Looks up the last review of a pull request
+    # @param key: str - "<owner>/<repo>#<number>"
+    # @return: dict | None - {"head_sha", "comment_url", "body", "version"} of the last review, if any
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT head_sha, comment_url, body, updated FROM pull_requests WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"head_sha": row[0], "comment_url": row[1], "body": row[2], "version": row[3]}
+
+    ### CALLED BY: run_orchestration_agent
+    ### PURPOSE: Records a review only if the state is still the version the caller read, like the manifest's conditional put
+    # @param version: float | None - The "version" of the state read, or None if there was none
+    # @return: bool - False if another review wrote the state in between
+    def put(self, key: str, head_sha: str, comment_url: str | None, body: str | None, version: float | None = None) -> bool:
+        with self._lock:
+            conn = self._connection()
+            if version is None:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO pull_requests (key, head_sha, comment_url, body, updated) VALUES (?, ?, ?, ?, ?)",
+                    (key, head_sha, comment_url, body, time.time())
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE pull_requests SET head_sha = ?, comment_url = ?, body = ?, updated = ? WHERE key = ? AND updated = ?",
+                    (head_sha, comment_url, body, max(time.time(), version + 1e-3), key, version)
+                )
+            conn.commit()
+            return cursor.rowcount == 1
+
+
+class S3ReviewState:
+    """ReviewState as one S3 object per pull request, versioned by its ETag."""
+
+    def __init__(self, prefix: str = f"{REVIEW_STATE_PREFIX}/pull_requests"):
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{sha256(key.encode('utf-8')).hexdigest()}.json"
+
+    def get(self, key: str) -> dict | None:
+        from logic_functions.s3_upload import get_s3_object
+        body, etag = get_s3_object(self._key(key))
+        if body is None:
+            return None
+        state = json.loads(body)
+        return {"head_sha": state["head_sha"], "comment_url": state["comment_url"], "body": state["body"], "version": etag}
+
+    def put(self, key: str, head_sha: str, comment_url: str | None, body: str | None, version: str | None = None) -> bool:
+        from logic_functions.s3_upload import put_s3_object
+        state = json.dumps({"key": key, "head_sha": head_sha, "comment_url": comment_url, "body": body, "updated": time.time()})
+        if version is None:
+            etag = put_s3_object(self._key(key), state.encode("utf-8"), if_none_match="*")
+        else:
+            etag = put_s3_object(self._key(key), state.encode("utf-8"), if_match=version)
+        return etag is not None
+
+
+# Shared for the whole process, so warm invocations reuse them
+review_cache = ReviewCache()
+if REVIEW_STATE_BACKEND == "s3":
+    delivery_log = S3DeliveryLog()
+    review_state = S3ReviewState()
+elif REVIEW_STATE_BACKEND == "sqlite":
+    delivery_log = DeliveryLog()
+    review_state = ReviewState()
+else:
+    raise ValueError(f"Unknown REVIEW_STATE_BACKEND: {REVIEW_STATE_BACKEND}")
@@ -1,57 +1,95 @@
 import os
-import json
-import boto3
 import dotenv
 
-from pathlib import Path
+from botocore.exceptions import ClientError
+
+from logic_functions.telemetry import span
+from logic_functions.clients import get_client
 
 dotenv.load_dotenv()
 
-# const for local chunk storage to be placed in s3 bucket
-CHUNK_STORE_FILE = "/tmp/chunk_s3.json"
 S3_BUCKET = os.getenv("S3_BUCKET_NAME")
-S3_OBJECT_KEY = "chunk_s3.json"
+# Sharded layout: <prefix>/manifest.json, listing for each <prefix>/<repo>/<path prefix>/ shard
+# a base-<version>.json.gz snapshot and its segment-<version>.json.gz delta log
+CHUNK_STORE_PREFIX = "chunk_store"
+CHUNK_STORE_MANIFEST_KEY = f"{CHUNK_STORE_PREFIX}/manifest.json"
+# The single-file store written before sharding; imported once into the shards when no manifest exists yet
+LEGACY_CHUNK_STORE_KEY = "chunk_s3.json"
+
+# ----------------------------
+# Generic S3 object helpers
+# ----------------------------
+
+def get_s3_object(key, if_none_match=None):
+    """
+    Conditionally downloads an object into memory.
+    Returns (body, etag): (None, None) if the object does not exist,
+    and (None, if_none_match) if it is unchanged since that ETag.
+    """
+    kwargs = {"Bucket": S3_BUCKET, "Key": key}
+    if if_none_match:
+        kwargs["IfNoneMatch"] = if_none_match
+    with span("s3.get", key=key) as attributes:
+        try:
+            response = get_client("s3").get_object(**kwargs)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            attributes["result"] = code
+            if code in ("304", "NotModified"):
+                return None, if_none_match
+            if code in ("404", "NoSuchKey"):
+                return None, None
+            raise
+        body = response["Body"].read()
+        attributes["bytes"] = len(body)
+    return body, response["ETag"]
 
-s3 = boto3.client("s3")
+def put_s3_object(key, body, if_match=None, if_none_match=None):
+    """
+    Uploads bytes and returns the new ETag, so the writer can revalidate against its own upload.
+    With if_match (the ETag the writer last read) or if_none_match="*" (create only), the write is
+    conditional, and None is returned if another writer changed the object first.
+    """
+    kwargs = {"Bucket": S3_BUCKET, "Key": key, "Body": body}
+    if if_match:
+        kwargs["IfMatch"] = if_match
+    if if_none_match:
+        kwargs["IfNoneMatch"] = if_none_match
+    with span("s3.put", key=key, bytes=len(body)) as attributes:
+        try:
+            response = get_client("s3").put_object(**kwargs)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            attributes["result"] = code
+            # 409: a concurrent conditional write to the same key was in flight
+            if code in ("412", "PreconditionFailed", "409", "ConditionalRequestConflict"):
+                return None
+            raise
+    return response["ETag"]
+
+def delete_s3_object(key):
+    get_client("s3").delete_object(Bucket=S3_BUCKET, Key=key)
 
 # ----------------------------
 # Save locally & upload to S3
 # ----------------------------
 
-def save_chunk_store_locally(chunks):
-    store = {
-        chunk["id"]: {
+def save_chunk_store_locally(chunks, store):
+    for chunk in chunks:
+        store.put(chunk["metadata"]["repo"], chunk["id"], {
             "text": chunk["text"],
             "path": chunk["metadata"]["path"],
-            "chunk_id": chunk["metadata"]["chunk_id"]
-        }
-        for chunk in chunks
-    }
-
-    
-    with open(CHUNK_STORE_FILE, "w") as f:
-        json.dump(store, f, indent=2)
-
-def upload_chunk_store_to_s3():
-    if not Path(CHUNK_STORE_FILE).exists():
-        raise FileNotFoundError(f"{CHUNK_STORE_FILE} does not exist")
-    
-    s3.upload_file(CHUNK_STORE_FILE, S3_BUCKET, S3_OBJECT_KEY)
-    print(f"✅ Uploaded chunk store to s3://{S3_BUCKET}/{S3_OBJECT_KEY}")
+            "chunk_id": chunk["metadata"]["chunk_id"],
+            "repo": chunk["metadata"]["repo"]
+        })
+
+def upload_chunk_store_to_s3(store):
+    uploaded = store.flush()
+    print(f"✅ Appended {uploaded} chunk store segment(s) to s3://{S3_BUCKET}/{CHUNK_STORE_PREFIX}/")
 
 # -----------------------------------------------------------------
-# Download & Load in FastAPI ('/tmp' directory)
-# serverless/containerized only allows writing to '/tmp' directory
+# Lookup in FastAPI, against the shards loaded for the current review
 # -----------------------------------------------------------------
 
-def download_chunk_store_from_s3(dest_path="/tmp/chunk_store.json"):
-    s3.download_file(S3_BUCKET, S3_OBJECT_KEY, dest_path)
-    print(f"✅ Downloaded chunk store to {dest_path}")
-    return dest_path
-
-def load_chunk_store(path="/tmp/chunk_store.json"):
-    with open(path) as f:
-        return json.load(f)
-
 def get_full_chunk_by_id(chunk_id, store):
     return store.get(chunk_id, {}).get("text", "")
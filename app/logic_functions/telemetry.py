@@ -0,0 +1,199 @@
+# TRACING SPANS, COUNTERS AND HISTOGRAMS FOR THE REVIEW PIPELINE
+# Spans time each pipeline stage and external call and are logged as JSON lines carrying the review's trace id;
+# counters and histograms are rendered in the Prometheus text format by the /metrics endpoint
+from contextlib import contextmanager
+from contextvars import ContextVar
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import dotenv
+
+dotenv.load_dotenv()
+
+METRICS_PREFIX = "gitlint"
+# Seconds; spans range from sub-millisecond local lookups to minute-long model calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# USD per million (input, output) tokens
+MODEL_PRICES_PER_MILLION = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "text-embedding-3-small": (0.02, 0.0),
+}
+TELEMETRY_JSON_LOGS = os.getenv("TELEMETRY_JSON_LOGS", "true").lower() == "true"
+
+_trace_id = ContextVar("trace_id", default=None)
+_current_span = ContextVar("current_span", default=None)
+
+
+def _json_logger() -> logging.Logger:
+    json_logger = logging.getLogger("gitlint.telemetry")
+    if not json_logger.handlers:
+        # One JSON object per line, kept apart from the human-readable logs
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        json_logger.addHandler(handler)
+        json_logger.propagate = False
+        json_logger.setLevel(logging.INFO)
+    return json_logger
+
+
+json_logger = _json_logger()
+
+
+def log_event(event: str, **fields):
+    if not TELEMETRY_JSON_LOGS:
+        return
+    record = {"ts": round(time.time(), 3), "event": event, "trace_id": _trace_id.get(), **fields}
+    json_logger.info(json.dumps(record, default=str))
+
+
+class MetricsRegistry:
+    """Thread-safe counters and fixed-bucket histograms, keyed by metric name and label set."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1, help: str = "", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._help.setdefault(name, (help, "counter"))
+
+    def observe(self, name: str, value: float, help: str = "", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # [count per bucket..., +Inf count, sum]
+            histogram = self._histograms.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[len(self.buckets)] += 1
+            histogram[-1] += value
+            self._help.setdefault(name, (help, "histogram"))
+
+    def value(self, name: str, **labels) -> float:
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    ### CALLED BY: /metrics
+    ### PURPOSE: Renders every metric in the Prometheus text exposition format
+    # @return: str - The exposition body
+    def render(self) -> str:
+        def label_text(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+            return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted(self._help):
+                help_text, kind = self._help[name]
+                full_name = f"{METRICS_PREFIX}_{name}"
+                lines.append(f"# HELP {full_name} {help_text or name}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                if kind == "counter":
+                    for (metric, labels), value in sorted(self._counters.items()):
+                        if metric == name:
+                            lines.append(f"{full_name}{label_text(labels)} {value}")
+                    continue
+                for (metric, labels), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(self.buckets, histogram):
+                        lines.append(f"{full_name}_bucket{label_text(labels, (('le', bound),))} {count}")
+                    lines.append(f"{full_name}_bucket{label_text(labels, (('le', '+Inf'),))} {histogram[len(self.buckets)]}")
+                    lines.append(f"{full_name}_sum{label_text(labels)} {histogram[-1]}")
+                    lines.append(f"{full_name}_count{label_text(labels)} {histogram[len(self.buckets)]}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared for the whole process, so /metrics sees every review run by this instance
+metrics = MetricsRegistry()
+
+
+### CALLED BY: run_orchestration_agent
+### PURPOSE: Starts a trace for one review, so every span and log line of it shares an id
+# @param trace_id: str | None - An existing id (e.g. the webhook delivery id), or None for a new one
+# @return: str - The trace id
+def start_trace(trace_id: str | None = None) -> str:
+    trace_id = trace_id or uuid.uuid4().hex
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+### CALLED BY: pipeline stages and external calls
+### PURPOSE: Times a block, recording its latency histogram and outcome, and logging it as a JSON line
+# @param name: str - The span name, e.g. "get_diff" or "vector_index.query"
+# @param attributes: Extra fields for the log line (not used as metric labels, to keep cardinality bounded)
+# @return: dict - Mutable attributes; fields set inside the block are logged with the span
+@contextmanager
+def span(name: str, **attributes):
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attributes
+    except BaseException as e:
+        status = "error"
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span.reset(token)
+        metrics.observe("span_duration_seconds", duration, help="Latency of pipeline stages and external calls", span=name)
+        metrics.inc("spans_total", help="Spans by outcome", span=name, status=status)
+        log_event("span", **{**attributes, "span": name, "parent": parent, "status": status, "duration_ms": round(duration * 1000, 2)})
+
+
+### CALLED BY: EmbeddingCache, run_review_agent, RetrievalContext
+### PURPOSE: Counts cache lookups, from which hit rates are derived
+# @param cache: str - The cache name
+# @param hits: int - The number of hits
+# @param misses: int - The number of misses
+def record_cache(cache: str, hits: int, misses: int):
+    if hits:
+        metrics.inc("cache_requests_total", hits, help="Cache lookups by result", cache=cache, result="hit")
+    if misses:
+        metrics.inc("cache_requests_total", misses, help="Cache lookups by result", cache=cache, result="miss")
+
+
+### CALLED BY: record_run_usage, embed_texts
+### PURPOSE: Counts tokens and their estimated cost for one model
+# @param model: str - The model name
+# @param input_tokens: int - Prompt (or embedding input) tokens
+# @param output_tokens: int - Completion tokens
+# @param requests: int - Number of API requests
+def record_usage(model: str, input_tokens: int, output_tokens: int = 0, requests: int = 1):
+    input_price, output_price = MODEL_PRICES_PER_MILLION.get(model, (0.0, 0.0))
+    cost = (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+    metrics.inc("model_requests_total", requests, help="Model API requests", model=model)
+    metrics.inc("model_tokens_total", input_tokens, help="Model tokens by direction", model=model, direction="input")
+    metrics.inc("model_tokens_total", output_tokens, help="Model tokens by direction", model=model, direction="output")
+    metrics.inc("model_cost_usd_total", cost, help="Estimated model cost in USD", model=model)
+    log_event("usage", model=model, input_tokens=input_tokens, output_tokens=output_tokens, cost_usd=round(cost, 6))
+
+
+### CALLED BY: run_review_agent, run_orchestration_agent
+### PURPOSE: Records the token usage of an Agents SDK Runner result
+# @param model: str - The agent's model
+# @param result: RunResult - The result of Runner.run
+def record_run_usage(model: str, result):
+    input_tokens = output_tokens = requests = 0
+    for response in getattr(result, "raw_responses", None) or []:
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            continue
+        input_tokens += usage.input_tokens or 0
+        output_tokens += usage.output_tokens or 0
+        requests += usage.requests or 0
+    record_usage(model, input_tokens, output_tokens, requests)
@@ -0,0 +1,41 @@
+# SELECTS THE VECTOR INDEX BACKEND USED FOR RETRIEVAL AND INDEXING
+# "pinecone" (default) talks to the hosted index; "local" keeps the whole index in process memory,
+# which removes the retrieval round trip for small repos and gives an offline mode for tests and benchmarks
+import os
+import dotenv
+
+dotenv.load_dotenv()
+
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "pinecone").lower()
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "git-lint")
+
+
+### CALLED BY: diff_functions, embeddings
+### PURPOSE: Opens the configured vector index; both backends expose query / upsert / delete / update
+# @return: The Pinecone index, or a LocalVectorIndex loaded from its persisted copy
+def open_vector_index():
+    if VECTOR_INDEX_BACKEND == "local":
+        from logic_functions.local_vector_index import LocalVectorIndex
+        return LocalVectorIndex.load()
+    if VECTOR_INDEX_BACKEND != "pinecone":
+        raise ValueError(f"Unknown VECTOR_INDEX_BACKEND: {VECTOR_INDEX_BACKEND}")
+
+    from pinecone import Pinecone
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return pc.Index(PINECONE_INDEX_NAME)
+
+
+### CALLED BY: update_file_embeddings, _IndexRun.commit
+### PURPOSE: Persists a local index after writes; the hosted index is durable on its own
+# @param index: The index returned by open_vector_index
+def flush_vector_index(index):
+    if VECTOR_INDEX_BACKEND == "local":
+        index.flush()
+
+
+### CALLED BY: initialize_chunk_store
+### PURPOSE: Brings a local index kept across warm invocations up to date with the S3 copy; the hosted index always is
+# @param index: The index returned by open_vector_index
+def revalidate_vector_index(index):
+    if VECTOR_INDEX_BACKEND == "local" and index.revalidate():
+        print("[PROCESS]: Vector index reloaded from a newer S3 copy")
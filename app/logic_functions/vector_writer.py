@@ -0,0 +1,129 @@
+# BATCHED, CONCURRENT AND RETRIED WRITES TO THE VECTOR INDEX
+# Upserts are split into batches bounded by vector count and request size; deletes of a whole PR are coalesced into
+# batched calls; every batch is retried on its own, so one failed request no longer discards the rest of the work
+from logic_functions.async_utils import run_blocking
+from logic_functions.telemetry import span, metrics
+
+import os
+import json
+import random
+import asyncio
+import logging
+import dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+
+# Pinecone limits: 1000 vectors and 2MB per upsert (100 vectors is its recommended batch), 1000 ids per delete
+VECTOR_UPSERT_BATCH_VECTORS = int(os.getenv("VECTOR_UPSERT_BATCH_VECTORS", "100"))
+VECTOR_UPSERT_BATCH_BYTES = int(os.getenv("VECTOR_UPSERT_BATCH_BYTES", str(2 * 1024 * 1024)))
+VECTOR_DELETE_BATCH_IDS = int(os.getenv("VECTOR_DELETE_BATCH_IDS", "1000"))
+VECTOR_WRITE_CONCURRENCY = int(os.getenv("VECTOR_WRITE_CONCURRENCY", "4"))
+VECTOR_WRITE_MAX_RETRIES = int(os.getenv("VECTOR_WRITE_MAX_RETRIES", "3"))
+# Deleting removed files by metadata filter takes one call for any number of files, but serverless Pinecone
+# indexes do not support it; the local index and pod-based indexes do
+VECTOR_DELETE_BY_FILTER = os.getenv("VECTOR_DELETE_BY_FILTER", "false").lower() == "true"
+
+
+def _request_bytes(vector: dict) -> int:
+    # JSON size estimate: ~10 bytes per float value, plus id and metadata
+    return len(vector["values"]) * 10 + len(vector["id"]) + len(json.dumps(vector.get("metadata") or {}, default=str)) + 32
+
+
+### CALLED BY: VectorWriter.upsert, upsert_to_pinecone
+### PURPOSE: Splits vectors into upsert batches bounded by VECTOR_UPSERT_BATCH_VECTORS and VECTOR_UPSERT_BATCH_BYTES
+# @param vectors: list[dict] - {"id", "values", "metadata"} records
+# @return: list[list[dict]] - The batches, in order
+def vector_batches(vectors: list[dict]) -> list[list[dict]]:
+    batches = []
+    current = []
+    current_bytes = 0
+    for vector in vectors:
+        size = _request_bytes(vector)
+        if current and (len(current) >= VECTOR_UPSERT_BATCH_VECTORS or current_bytes + size > VECTOR_UPSERT_BATCH_BYTES):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(vector)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _retryable(error: Exception) -> bool:
+    # Client errors other than rate limits (e.g. a malformed vector) fail the same way on every attempt
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    return not isinstance(status, int) or status == 429 or status >= 500
+
+
+class VectorWriter:
+    """Writes to one vector index in bounded, concurrent batches, retrying each batch with backoff."""
+
+    def __init__(self, index, concurrency: int = VECTOR_WRITE_CONCURRENCY, max_retries: int = VECTOR_WRITE_MAX_RETRIES):
+        self.index = index
+        self.max_retries = max_retries
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def _call(self, operation: str, size: int, func, **kwargs) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._slots:
+                    # Each batch is its own span, so span_duration_seconds carries per-batch latency
+                    with span(f"vector_index.{operation}_batch", size=size, attempt=attempt):
+                        await run_blocking(func, **kwargs)
+                metrics.inc("vector_writes_total", help="Vector index write batches by outcome", operation=operation, status="ok")
+                return True
+            except Exception as e:
+                if attempt == self.max_retries or not _retryable(e):
+                    metrics.inc("vector_writes_total", help="Vector index write batches by outcome", operation=operation, status="failed")
+                    logger.error(f"Vector index {operation} of {size} failed after {attempt + 1} attempts: {e}")
+                    return False
+                metrics.inc("vector_write_retries_total", help="Vector index write batches retried", operation=operation)
+                delay = min(2 ** attempt, 30) + random.uniform(0, 1)
+                logger.warning(f"Vector index {operation} of {size} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    ### CALLED BY: update_file_embeddings, _upsert_worker
+    ### PURPOSE: Upserts embedded chunks in concurrent, size-bounded batches
+    # @param chunks: list[dict] - Chunks with "id", "embedding" and "metadata"
+    # @return: list[dict] - The chunks whose batch was written; the others failed after retries
+    async def upsert(self, chunks: list[dict]) -> list[dict]:
+        by_id = {chunk["id"]: chunk for chunk in chunks}
+        vectors = [{"id": chunk["id"], "values": chunk["embedding"], "metadata": chunk["metadata"]} for chunk in chunks]
+        batches = vector_batches(vectors)
+        results = await asyncio.gather(*(
+            self._call("upsert", len(batch), self.index.upsert, vectors=batch) for batch in batches
+        ))
+        return [by_id[vector["id"]] for batch, ok in zip(batches, results) if ok for vector in batch]
+
+    ### CALLED BY: update_file_embeddings
+    ### PURPOSE: Deletes vectors by id in concurrent batches of up to VECTOR_DELETE_BATCH_IDS
+    # @param ids: list[str] - The vector ids, across any number of files
+    # @return: list[str] - The ids whose batch was deleted
+    async def delete(self, ids: list[str]) -> list[str]:
+        batches = [ids[start:start + VECTOR_DELETE_BATCH_IDS] for start in range(0, len(ids), VECTOR_DELETE_BATCH_IDS)]
+        results = await asyncio.gather(*(
+            self._call("delete", len(batch), self.index.delete, ids=batch) for batch in batches
+        ))
+        return [chunk_id for batch, ok in zip(batches, results) if ok for chunk_id in batch]
+
+    ### CALLED BY: update_file_embeddings
+    ### PURPOSE: Deletes every vector of the given files with a single metadata-filtered call
+    # @param repo_name: str - The repository
+    # @param paths: list[str] - The repo-relative file paths
+    # @return: bool - Whether the delete succeeded
+    async def delete_paths(self, repo_name: str, paths: list[str]) -> bool:
+        return await self._call("delete", len(paths), self.index.delete, filter={"repo": {"$eq": repo_name}, "path": {"$in": paths}})
+
+    ### CALLED BY: update_file_embeddings
+    ### PURPOSE: Sets metadata on many vectors; the index API has no batch form, so the calls run concurrently
+    # @param updates: list[tuple[str, dict]] - (vector id, metadata to set)
+    # @return: list[str] - The ids that were updated
+    async def update_metadata(self, updates: list[tuple[str, dict]]) -> list[str]:
+        results = await asyncio.gather(*(
+            self._call("update", 1, self.index.update, id=chunk_id, set_metadata=metadata) for chunk_id, metadata in updates
+        ))
+        return [chunk_id for (chunk_id, _), ok in zip(updates, results) if ok]
@@ -1,42 +1,122 @@
-from agent_workflow.run_agent import run_orchestration_agent
-from fastapi import FastAPI, Request, BackgroundTasks
+from logic_functions.job_queue import get_job_queue, JOB_QUEUE_BACKEND
+from logic_functions.review_cache import delivery_log
+from logic_functions.async_utils import run_blocking
+from logic_functions.telemetry import metrics, log_event
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, JSONResponse
 from mangum import Mangum
+from dotenv import load_dotenv
+import os
 import asyncio
 import logging
 
+load_dotenv()
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Drain the queue from this process; turn off when separate workers (or an SQS-triggered Lambda) consume it.
+# Never on Lambda: the container is frozen once an invocation returns, so a worker there would only run mid-request;
+# an SQS-triggered Lambda (agent_workflow.review_worker.sqs_handler) runs the reviews instead
+ON_LAMBDA = bool(os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+REVIEW_WORKER_IN_PROCESS = not ON_LAMBDA and os.getenv("REVIEW_WORKER_IN_PROCESS", str(JOB_QUEUE_BACKEND == "sqlite")).lower() == "true"
+
 background_tasks_set = set()
+# Created per startup, so a restarted app does not start its worker already stopped
+worker_stop = None
 
 app = FastAPI()
 
+
+@app.on_event("startup")
+async def start_worker():
+    global worker_stop
+    if REVIEW_WORKER_IN_PROCESS:
+        worker_stop = asyncio.Event()
+        # Imported here: the review pipeline (Agents SDK, OpenAI, boto3) stays off the cold start of health checks and pings
+        from agent_workflow.review_worker import ReviewWorkerPool
+        task = asyncio.create_task(ReviewWorkerPool().run(worker_stop))
+        background_tasks_set.add(task)
+        task.add_done_callback(background_tasks_set.discard)
+
+
+@app.on_event("shutdown")
+async def stop_worker():
+    # In-flight reviews finish; queued ones stay in the queue for the next start
+    if worker_stop is not None:
+        worker_stop.set()
+    if background_tasks_set:
+        await asyncio.gather(*background_tasks_set, return_exceptions=True)
+
+
 @app.get("/")
 def read_root():
     logger.info("Service is running successfully through EC2 instance of Docker container.")
     return {"Status": "200 OK"}
     
+@app.get("/metrics")
+def read_metrics():
+    # Prometheus text exposition of this instance's stage latencies, token usage, cost and cache hit rates
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/review")
-async def webhook(request: Request, background_tasks: BackgroundTasks): 
+async def webhook(request: Request):
     print("[/review] Request received")
 
+    # GitHub retries deliveries it considers failed; each delivery id is processed once
+    delivery_id = request.headers.get("X-GitHub-Delivery")
+    delivery_key = f"delivery:{delivery_id}"
+    event = request.headers.get("X-GitHub-Event")
+    metrics.inc("webhook_deliveries_total", help="Webhook deliveries by event", event=event or "unknown")
+    log_event("webhook", delivery_id=delivery_id, github_event=event)
+
     # Handle ping event from GitHub Webhook
     if request.headers.get("X-GitHub-Event") == "ping":
         logger.info("[/review] Ping received")
         return {"message": "Ping received!"}
     elif request.headers.get("X-GitHub-Event") == "pull_request":
         data = await request.json()
-        if data["action"] != "opened":
-            logger.info("[/review] Pull request merged, skipping review")
-            return {"message": "Pull request merged, skipping review"}
+        # New pushes ("synchronize") are reviewed incrementally against the last reviewed commit
+        if data["action"] not in ("opened", "synchronize"):
+            logger.info(f"[/review] Pull request {data['action']}, skipping review")
+            return {"message": f"Pull request {data['action']}, skipping review"}
+        # Claimed only for deliveries that start a review, so pings and other events never touch the delivery log
+        if delivery_id and not await run_blocking(delivery_log.claim, delivery_key):
+            metrics.inc("webhook_duplicates_total", help="Webhook deliveries dropped as duplicates", kind="delivery")
+            logger.info(f"[/review] Duplicate delivery {delivery_id}, skipping")
+            return {"message": "Duplicate delivery, skipping review"}
         full_repo = data["repository"]["full_name"]
         repo_name = full_repo.split("/")[-1] # Parse repo name for custom filter search
         diff_url = data["pull_request"]["diff_url"]
         issue_url = data["pull_request"]["issue_url"]
+
+        pr_number = data["pull_request"]["number"]
+        head_sha = data["pull_request"]["head"]["sha"]
+
+        # A commit that was already reviewed (e.g. a manual re-trigger) is not reviewed again
+        head_key = f"head:{full_repo}#{pr_number}@{head_sha}"
+        if not await run_blocking(delivery_log.claim, head_key):
+            metrics.inc("webhook_duplicates_total", help="Webhook deliveries dropped as duplicates", kind="head")
+            logger.info(f"[/review] {head_key} already reviewed, skipping")
+            return {"message": "Commit already reviewed, skipping review"}
         
-        # Call function chain to process diff and generate a review comment
-        background_tasks.add_task(run_orchestration_agent, diff_url, repo_name, issue_url)
-        print("[/review] Responding immediately")
+        # Queue the review; a worker runs the function chain that processes the diff and posts a review comment
+        claim_keys = [delivery_key, head_key] if delivery_id else [head_key]
+        payload = {
+            "diff_url": diff_url, "repo_name": repo_name, "issue_url": issue_url, "full_repo": full_repo,
+            "pr_number": pr_number, "head_sha": head_sha, "claim_keys": claim_keys, "delivery_id": delivery_id
+        }
+        try:
+            # One group per PR: its pushes are reviewed one at a time and in order, and a busy PR cannot starve the others
+            await run_blocking(get_job_queue().enqueue, payload, group=f"{full_repo}#{pr_number}", deduplication_id=head_key)
+        except Exception as e:
+            # Nothing was queued: release the claims so GitHub's redelivery is not dropped as a duplicate
+            logger.error(f"[/review] Error enqueuing review: {e}")
+            for key in claim_keys:
+                await run_blocking(delivery_log.release, key)
+            return JSONResponse({"message": "Error queuing review"}, status_code=503)
+        metrics.inc("review_jobs_total", help="Review jobs by outcome", outcome="queued")
+        print("[/review] Review queued, responding immediately")
         
         # Return response to GitHub to confirm receiving Pull Request webhook
         return {"message": "Review started, response will be posted shortly."}
@@ -45,4 +125,6 @@ async def webhook(request: Request, background_tasks: BackgroundTasks):
         logger.info("[/review] Unknown event received")
         return {"message": "Unknown event received"}
     
-handler = Mangum(app)
\ No newline at end of file
+# No lifespan on Lambda: the startup hook would run on every cold start (and shutdown after each request), and there is
+# no in-process worker to start there
+handler = Mangum(app, lifespan="off")
\ No newline at end of file
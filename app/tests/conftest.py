@@ -0,0 +1,42 @@
+# SHARED TEST SETUP
+# Placeholder credentials and private /tmp paths for every SQLite store, set before any app module reads them
+import os
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+_scratch = tempfile.mkdtemp(prefix="gitlint-tests-")
+for _name, _filename in (
+    ("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3"),
+    ("REVIEW_CACHE_PATH", "review_cache.sqlite3"),
+    ("JOB_QUEUE_PATH", "review_jobs.sqlite3"),
+    ("LOCAL_VECTOR_INDEX_PATH", "vector_index.npz"),
+):
+    os.environ.setdefault(_name, os.path.join(_scratch, _filename))
+for _name in ("OPENAI_API_KEY", "PINECONE_API_KEY", "GITHUB_ACCESS_TOKEN"):
+    os.environ.setdefault(_name, "test")
+os.environ.setdefault("S3_BUCKET_NAME", "test-bucket")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+
+@pytest.fixture
+def fake_s3(tmp_path):
+    """A FilesystemS3 with no latency, installed as the shared "s3" client for the test."""
+    from benchmarks.fakes import FilesystemS3
+    from logic_functions.clients import set_client, reset_clients
+    s3 = FilesystemS3(str(tmp_path / "s3"), latency=0)
+    set_client("s3", s3)
+    yield s3
+    reset_clients("s3")
+
+
+@pytest.fixture
+def set_openai():
+    """Installs a stand-in "openai" client for the test."""
+    from logic_functions.clients import set_client, reset_clients
+    yield lambda client: set_client("openai", client)
+    reset_clients("openai")
@@ -0,0 +1,51 @@
+import asyncio
+import os
+
+from logic_functions import bulk_indexer
+from logic_functions.chunk_store import ChunkStore
+
+
+def source(version: int) -> str:
+    return f"def f():\n    # Long enough to be kept as a chunk of its own\n    return {version} + sum(range(100)) * 2 - len('padding text')\n"
+
+
+def test_reindexing_an_edited_file_deletes_its_previous_chunks(fake_s3, set_openai, monkeypatch, tmp_path):
+    from benchmarks.fakes import FakeEmbeddings, FakeOpenAIClient
+    from logic_functions.local_vector_index import LocalVectorIndex
+
+    set_openai(FakeOpenAIClient(FakeEmbeddings(latency=0)))
+    monkeypatch.setattr(bulk_indexer, "INDEX_CHUNK_WORKERS", 1)
+    repo_path = tmp_path / "repo"
+    (repo_path / "app").mkdir(parents=True)
+    file_path = repo_path / "app" / "a.py"
+    index = LocalVectorIndex(path=str(tmp_path / "index.npz"), key="test/index.npz")
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    def index_version(version: int):
+        file_path.write_text(source(version))
+        # A new signature even if the edit lands within the filesystem's timestamp resolution
+        os.utime(file_path, ns=(version, version))
+        return asyncio.run(bulk_indexer.run_bulk_index([str(repo_path)], index, checkpoint_path))
+
+    index_version(1)
+    first_ids = set(index._rows)
+    stats = index_version(2)
+
+    assert stats["upserted"] == stats["chunks"] > 0
+    assert not first_ids & set(index._rows)
+    store = ChunkStore()
+    store.load_manifest()
+    assert set(store.ids_for_path("repo", "app/a.py")) == set(index._rows)
+    assert [record["text"] for record in map(store.get, index._rows)] == [source(2).strip()]
+
+
+def test_commit_evicts_the_shards_it_flushed(fake_s3, tmp_path):
+    store = ChunkStore()
+    store.put("repo", "a", {"text": "a", "path": "app/a.py", "chunk_id": 0})
+    run = bulk_indexer._IndexRun(None, store, {}, str(tmp_path / "checkpoint.json"))
+
+    asyncio.run(run.commit(force=True))
+
+    assert len(store) == 0 and not store._shards
+    # Still readable: the shard is reloaded from the segment the commit flushed
+    assert store.ids_for_path("repo", "app/a.py") == ["a"]
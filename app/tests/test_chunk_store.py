@@ -0,0 +1,174 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from logic_functions.chunk_store import ChunkStore
+from logic_functions.clients import set_client, reset_clients
+from logic_functions.s3_upload import put_s3_object, get_s3_object, CHUNK_STORE_MANIFEST_KEY, LEGACY_CHUNK_STORE_KEY
+
+
+def record(path: str, position: int = 0, repo: str | None = "repo") -> dict:
+    record = {"text": f"chunk {position} of {path}", "path": path, "chunk_id": position}
+    if repo:
+        record["repo"] = repo
+    return record
+
+
+def loaded(store: ChunkStore, repo: str = "repo") -> dict:
+    store.ensure_loaded(repo)
+    return dict(store.items())
+
+
+def test_legacy_chunk_store_is_imported_once_when_no_manifest_exists(fake_s3):
+    # Pre-sharding records carry no repo; it comes from the vector's metadata
+    legacy = {
+        "/src/repo/app/main.py-0-aaa": record("app/main.py", repo=None),
+        "/src/repo/app/util.py-0-bbb": record("app/util.py"),
+        "/src/gone/x.py-0-ccc": record("x.py", repo=None),
+    }
+    put_s3_object(LEGACY_CHUNK_STORE_KEY, json.dumps(legacy, indent=2).encode())
+
+    class Index:
+        def fetch(self, ids):
+            return SimpleNamespace(vectors={
+                chunk_id: SimpleNamespace(metadata={"repo": "repo"}) for chunk_id in ids if "/src/repo/" in chunk_id
+            })
+
+    set_client("vector_index", Index())
+    try:
+        store = ChunkStore()
+        assert store.load_manifest()
+    finally:
+        reset_clients("vector_index")
+
+    assert get_s3_object(CHUNK_STORE_MANIFEST_KEY)[0] is not None
+    fresh = ChunkStore()
+    fresh.load_manifest()
+    assert set(loaded(fresh)) == {"/src/repo/app/main.py-0-aaa", "/src/repo/app/util.py-0-bbb"}
+    assert fresh.ids_for_path("repo", "app/main.py") == ["/src/repo/app/main.py-0-aaa"]
+
+    # With a manifest in place, the legacy file is not read again
+    requests = fake_s3.requests
+    assert ChunkStore().load_manifest()
+    assert fake_s3.requests == requests + 1
+
+
+def test_concurrent_flushes_both_land_through_the_etag_retry(fake_s3):
+    # Two containers read the same manifest, then both append to the same shard
+    first, second = ChunkStore(), ChunkStore()
+    first.load_manifest()
+    second.load_manifest()
+    first.put("repo", "a", record("app/a.py", 0))
+    second.put("repo", "b", record("app/b.py", 1))
+
+    assert first.flush() == 1
+    # second's conditional write fails against first's manifest; it adopts it and publishes again
+    assert second.flush() == 1
+
+    fresh = ChunkStore()
+    fresh.load_manifest()
+    assert set(loaded(fresh)) == {"a", "b"}
+    assert len(fresh.manifest["repos"]["repo"]["app"]["segments"]) == 2
+
+
+def test_compaction_keeps_a_segment_appended_while_it_ran(fake_s3):
+    store = ChunkStore()
+    store.load_manifest()
+    for position in range(3):
+        store.put("repo", f"c{position}", record(f"app/{position}.py", position))
+        store.flush()
+
+    writer = ChunkStore()
+    writer.load_manifest()
+    read_shard = store._read_shard
+
+    def read_shard_while_a_writer_flushes(state):
+        records = read_shard(state)
+        writer.put("repo", "late", record("app/late.py", 9))
+        writer.flush()
+        return records
+
+    store._read_shard = read_shard_while_a_writer_flushes
+    assert store.compact(min_segments=3) == 1
+
+    fresh = ChunkStore()
+    fresh.load_manifest()
+    entry = fresh.manifest["repos"]["repo"]["app"]
+    assert entry["base"] is not None and len(entry["segments"]) == 1
+    assert set(loaded(fresh)) == {"c0", "c1", "c2", "late"}
+
+
+def test_flush_uploads_without_holding_the_store_lock(fake_s3):
+    store = ChunkStore()
+    store.load_manifest()
+    store.put("repo", "a", record("app/a.py"))
+    put_object = fake_s3.put_object
+    lock_free = []
+
+    def try_lock():
+        acquired = store._lock.acquire(timeout=1)
+        if acquired:
+            store._lock.release()
+        lock_free.append(acquired)
+
+    def put_object_checking_the_lock(**kwargs):
+        # Another thread (e.g. a review loading a shard) must be able to take the lock mid-upload
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        return put_object(**kwargs)
+
+    fake_s3.put_object = put_object_checking_the_lock
+    assert store.flush() == 1
+    assert lock_free and all(lock_free)
+
+
+def test_failed_flush_keeps_its_changes_under_newer_ones(fake_s3):
+    store = ChunkStore()
+    store.load_manifest()
+    store.put("repo", "a", record("app/a.py", 0))
+    store.put("repo", "b", record("app/b.py", 1))
+    put_object = fake_s3.put_object
+
+    def put_object_failing_once(**kwargs):
+        fake_s3.put_object = put_object
+        # A change made while the flush is in flight
+        store.pop("b")
+        raise OSError("connection reset")
+
+    fake_s3.put_object = put_object_failing_once
+    with pytest.raises(OSError):
+        store.flush()
+    assert store.flush() == 1
+
+    fresh = ChunkStore()
+    fresh.load_manifest()
+    assert set(loaded(fresh)) == {"a"}
+
+
+def test_put_reloads_a_shard_evicted_between_its_load_and_the_write(fake_s3):
+    store = ChunkStore()
+    store.load_manifest()
+    store.put("repo", "a", record("app/a.py", 0))
+    store.flush()
+    load_shard = store._load_shard
+    evictions = []
+
+    def load_shard_then_evict(repo, shard):
+        records = load_shard(repo, shard)
+        if not evictions:
+            # A manifest adopted by another thread drops the shard right after it was returned
+            with store._lock:
+                store._evict_shard(repo, shard)
+            evictions.append(shard)
+        return records
+
+    store._load_shard = load_shard_then_evict
+    store.put("repo", "a", record("app/a.py", 1))
+
+    assert evictions == ["app"]
+    assert store.get("a")["chunk_id"] == 1
+    assert store.pop("a")["chunk_id"] == 1
+    assert store.get("a") is None
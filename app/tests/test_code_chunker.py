@@ -0,0 +1,96 @@
+import pytest
+
+from logic_functions import code_chunker
+from logic_functions.code_chunker import build_chunks, chunk_source
+from logic_functions.embedding_service import estimate_tokens
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Limits small enough that a few short definitions exercise the splitting and merging."""
+    monkeypatch.setattr(code_chunker, "CHUNK_MIN_TOKENS", 10)
+    monkeypatch.setattr(code_chunker, "CHUNK_TARGET_TOKENS", 40)
+    monkeypatch.setattr(code_chunker, "CHUNK_MAX_TOKENS", 60)
+
+
+def python_method(name: str) -> str:
+    return f"    def {name}(self, value):\n        # Scales the value before it is stored\n        return value * {len(name)} + self.offset\n\n"
+
+
+def js_function(name: str, body: str) -> str:
+    return f"function {name}(value) {{\n{body}    return value + {len(name)};\n}}\n\n"
+
+
+def test_oversized_python_class_is_split_by_method_under_its_header(small_chunks):
+    source = "class Service:\n" + "".join(python_method(name) for name in ("load", "store", "remove"))
+
+    chunks = chunk_source(source, "app/service.py")
+
+    assert len(chunks) == 3
+    for chunk, name in zip(chunks, ("load", "store", "remove")):
+        assert chunk.startswith("class Service:\n")
+        assert chunk.count("def ") == 1 and f"def {name}(" in chunk
+
+
+def test_braces_in_js_strings_and_comments_do_not_end_a_function(small_chunks):
+    tricky = "    const open = \"{ not a block\";\n    // a stray } in a comment\n    /* and { another */\n"
+    source = js_function("first", tricky) + js_function("second", "    const close = '}}';\n")
+
+    chunks = chunk_source(source, "web/app.js")
+
+    assert chunks == [js_function("first", tricky).strip(), js_function("second", "    const close = '}}';\n").strip()]
+
+
+def test_oversized_java_class_is_split_by_method_despite_braces_in_strings(small_chunks):
+    methods = "".join(
+        f"    public String {name}() {{\n        // closes }} early?\n        return \"{{{name}}}\" + \"padding text\";\n    }}\n"
+        for name in ("alpha", "beta", "gamma")
+    )
+    source = "public class Names {\n" + methods + "}\n"
+
+    chunks = chunk_source(source, "src/Names.java")
+
+    assert len(chunks) == 3
+    for chunk, name in zip(chunks, ("alpha", "beta", "gamma")):
+        assert chunk.startswith("public class Names {")
+        assert f"String {name}()" in chunk and chunk.count("public String") == 1
+
+
+def test_chunks_stay_under_the_maximum_and_small_neighbours_are_merged(small_chunks):
+    # One function far over the maximum, with no members to split at
+    long_body = "".join(f"    total = total + {i} * factor\n" for i in range(60))
+    assert all(estimate_tokens(chunk) <= code_chunker.CHUNK_MAX_TOKENS for chunk in chunk_source(f"def f(factor):\n{long_body}", "a.py"))
+
+    # Definitions well under the minimum are packed together instead of becoming chunks of their own
+    tiny = "".join(f"X{i} = {i}\nY{i} = {i}\n" for i in range(20))
+    chunks = chunk_source(tiny, "constants.py")
+    assert 1 < len(chunks) and all(chunk.count("\n") >= 5 for chunk in chunks)
+    assert "\n".join(chunks).split() == tiny.split()
+    assert all(estimate_tokens(chunk) <= code_chunker.CHUNK_MAX_TOKENS for chunk in chunks)
+
+
+def test_chunks_too_short_to_be_useful_are_dropped():
+    assert chunk_source("", "pkg/__init__.py") == []
+    assert chunk_source("from .core import run\n", "pkg/__init__.py") == []
+
+
+def test_unparseable_file_falls_back_to_line_chunks(small_chunks):
+    broken = "".join(f"def f{i}(value:\n    return value + {i} * 1000 - len('still indexed')\n" for i in range(6))
+
+    chunks = chunk_source(broken, "broken.py")
+
+    assert len(chunks) > 1
+    assert "\n".join(chunks).split() == broken.split()
+    assert all(estimate_tokens(chunk) <= code_chunker.CHUNK_MAX_TOKENS for chunk in chunks)
+
+
+def test_build_chunks_ids_carry_path_position_and_content_hash(small_chunks):
+    source = "class Service:\n" + "".join(python_method(name) for name in ("load", "store", "remove"))
+
+    chunks = build_chunks("repo", "app/service.py", source)
+
+    assert [chunk["metadata"]["chunk_id"] for chunk in chunks] == [0, 1, 2]
+    for chunk in chunks:
+        metadata = chunk["metadata"]
+        assert chunk["id"] == f"app/service.py-{metadata['chunk_id']}-{metadata['hash']}"
+        assert metadata["repo"] == "repo" and metadata["path"] == "app/service.py"
@@ -0,0 +1,109 @@
+import asyncio
+
+from logic_functions import diff_functions
+from logic_functions.chunk_store import ChunkStore
+from logic_functions.clients import set_client, reset_clients
+from logic_functions.diff_parser import parse_diff
+
+DIFF = """diff --git a/app/a.py b/app/a.py
+--- a/app/a.py
++++ b/app/a.py
+@@ -1,2 +1,2 @@
+ def f():
+-    return 0
++    return 1
+"""
+
+
+def source(version: int) -> str:
+    return f"def f():\n    # Long enough to be kept as a chunk of its own\n    return {version} + sum(range(100)) * 2 - len('padding text')\n"
+
+
+def test_review_update_compacts_the_log_it_grew(fake_s3, set_openai, monkeypatch, tmp_path):
+    from benchmarks.fakes import FakeEmbeddings, FakeOpenAIClient
+    from logic_functions.local_vector_index import LocalVectorIndex
+
+    set_openai(FakeOpenAIClient(FakeEmbeddings(latency=0)))
+    set_client("vector_index", LocalVectorIndex(path=str(tmp_path / "index.npz"), key="test/index.npz"))
+    files = {}
+
+    async def get_file_content(repo_name, path):
+        return files[path]
+
+    monkeypatch.setattr(diff_functions, "get_file_content", get_file_content)
+    monkeypatch.setattr(diff_functions, "chunk_store", None)
+    monkeypatch.setattr(diff_functions, "CHUNK_STORE_COMPACT_SEGMENTS", 3)
+
+    async def review(version: int):
+        files["app/a.py"] = source(version)
+        await diff_functions.initialize_chunk_store()
+        await diff_functions.update_file_embeddings("repo", list(parse_diff(DIFF)))
+
+    try:
+        # Each push appends one segment; the third reaches the threshold and is compacted before the review returns
+        for version in range(3):
+            asyncio.run(review(version))
+    finally:
+        reset_clients("vector_index")
+
+    fresh = ChunkStore()
+    fresh.load_manifest()
+    entry = fresh.manifest["repos"]["repo"]["app"]
+    assert entry["base"] is not None and entry["segments"] == []
+    fresh.ensure_loaded("repo")
+    assert [record["text"] for _, record in fresh.items()] == [source(2).strip()]
+
+
+def chunk(position: int, content_hash: str, path: str = "app/a.py") -> dict:
+    return {"id": f"{path}-{position}-{content_hash}", "text": content_hash,
+            "metadata": {"path": path, "chunk_id": position, "hash": content_hash}}
+
+
+def stored(monkeypatch, *chunks: dict) -> list[str]:
+    # Installs a chunk store holding the given chunks, and returns their ids
+    store = ChunkStore()
+    for stored_chunk in chunks:
+        store.put("repo", stored_chunk["id"], {"text": stored_chunk["text"], "path": stored_chunk["metadata"]["path"],
+                                               "chunk_id": stored_chunk["metadata"]["chunk_id"], "repo": "repo"})
+    monkeypatch.setattr(diff_functions, "chunk_store", store)
+    return [stored_chunk["id"] for stored_chunk in chunks]
+
+
+def test_plan_keeps_unchanged_chunks(fake_s3, monkeypatch):
+    existing = stored(monkeypatch, chunk(0, "aaa"), chunk(1, "bbb"))
+
+    assert diff_functions.plan_chunk_changes(existing, [chunk(0, "aaa"), chunk(1, "bbb")]) == ([], [], [])
+
+
+def test_plan_renumbers_shifted_chunks_without_re_embedding_them(fake_s3, monkeypatch):
+    existing = stored(monkeypatch, chunk(0, "aaa"), chunk(1, "bbb"))
+    inserted = chunk(0, "new")
+
+    new_chunks, renumbered, stale = diff_functions.plan_chunk_changes(existing, [inserted, chunk(1, "aaa"), chunk(2, "bbb")])
+
+    assert new_chunks == [inserted]
+    # The kept ids still carry their old position; only the position metadata moves
+    assert sorted(renumbered) == [("app/a.py-0-aaa", 1), ("app/a.py-1-bbb", 2)]
+    assert stale == []
+
+
+def test_plan_matches_identical_chunks_one_to_one(fake_s3, monkeypatch):
+    existing = stored(monkeypatch, chunk(0, "dup"), chunk(1, "dup"))
+
+    # One copy removed: one id is kept, the other deleted
+    new_chunks, renumbered, stale = diff_functions.plan_chunk_changes(existing, [chunk(0, "dup")])
+    assert (new_chunks, renumbered, stale) == ([], [], ["app/a.py-1-dup"])
+
+    # One copy added: the third is embedded
+    third = chunk(2, "dup")
+    assert diff_functions.plan_chunk_changes(existing, [chunk(0, "dup"), chunk(1, "dup"), third]) == ([third], [], [])
+
+
+def test_plan_deletes_removed_chunks(fake_s3, monkeypatch):
+    existing = stored(monkeypatch, chunk(0, "aaa"), chunk(1, "bbb"), chunk(2, "ccc"))
+
+    new_chunks, renumbered, stale = diff_functions.plan_chunk_changes(existing, [chunk(0, "aaa"), chunk(1, "ccc")])
+
+    assert new_chunks == []
+    assert renumbered == [("app/a.py-2-ccc", 1)]
+    assert stale == ["app/a.py-1-bbb"]
@@ -0,0 +1,61 @@
+from logic_functions.diff_packing import pack_file_diffs, _split_hunk
+from logic_functions.diff_parser import parse_diff, HUNK_HEADER
+
+
+def oversized_diff() -> str:
+    lines = []
+    for i in range(60):
+        lines.append(f" context line {i} of the module")
+        if i % 3 == 0:
+            lines.append(f"-removed line {i}")
+        if i % 2 == 0:
+            lines.append(f"+added line {i}")
+    old_count = sum(1 for line in lines if line[0] in " -")
+    new_count = sum(1 for line in lines if line[0] in " +")
+    return (f"diff --git a/big.py b/big.py\n--- a/big.py\n+++ b/big.py\n"
+            f"@@ -10,{old_count} +12,{new_count} @@ def build():\n" + "\n".join(lines) + "\n")
+
+
+def test_each_window_of_a_split_hunk_has_its_own_header():
+    (file_diff,) = parse_diff(oversized_diff())
+    windows = _split_hunk(file_diff.hunks[0], budget=100)
+    assert len(windows) > 2
+
+    next_old, next_new = 10, 12
+    for window in windows:
+        header, *lines = window.text.splitlines()
+        old_start, old_count, new_start, new_count = (int(group) for group in HUNK_HEADER.match(header).groups())
+        assert header.endswith("@@ def build():")
+        assert (old_start, new_start) == (next_old, next_new)
+        assert old_count == sum(1 for line in lines if line[0] in " -")
+        assert new_count == sum(1 for line in lines if line[0] in " +")
+        assert not any(line.startswith("@@") for line in lines)
+        next_old, next_new = old_start + old_count, new_start + new_count
+
+
+def test_split_parts_parse_back_to_their_lines():
+    (file_diff,) = parse_diff(oversized_diff())
+    units = pack_file_diffs([file_diff], budget=150)
+    assert len(units) > 1
+
+    added = removed = 0
+    for unit in units:
+        (part,) = parse_diff(unit.text)
+        # Correct counts let the parser consume every window exactly: context lines count on both sides
+        for hunk in part.hunks:
+            assert hunk.old_count - hunk.removed == hunk.new_count - hunk.added
+        added += sum(hunk.added for hunk in part.hunks)
+        removed += sum(hunk.removed for hunk in part.hunks)
+    assert added >= file_diff.added and removed >= file_diff.removed
+
+
+def test_windows_of_an_added_file_number_the_empty_old_side_like_git():
+    lines = [f"+line {i} of a generated file" for i in range(40)]
+    diff = "diff --git a/gen.py b/gen.py\nnew file mode 100644\n--- /dev/null\n+++ b/gen.py\n" \
+           f"@@ -0,0 +1,{len(lines)} @@\n" + "\n".join(lines) + "\n"
+    (file_diff,) = parse_diff(diff)
+    windows = _split_hunk(file_diff.hunks[0], budget=60)
+
+    assert [(w.old_start, w.old_count) for w in windows] == [(0, 0)] * len(windows)
+    assert windows[0].new_start == 1
+    assert windows[1].new_start == 1 + windows[0].new_count
@@ -0,0 +1,52 @@
+from logic_functions.diff_parser import parse_diff
+
+# a.py's hunk header claims more lines than the hunk holds
+MISCOUNTED = """diff --git a/a.py b/a.py
+--- a/a.py
++++ b/a.py
+@@ -1,5 +1,6 @@
+ import os
+-x = 1
++x = 2
++y = 3
+diff --git a/b.py b/b.py
+--- a/b.py
++++ b/b.py
+@@ -1,2 +1,2 @@
+-print(1)
++print(2)
+ done
+"""
+
+
+def test_miscounted_hunk_ends_at_the_next_file_header():
+    files = list(parse_diff(MISCOUNTED))
+
+    assert [file_diff.path for file_diff in files] == ["a.py", "b.py"]
+    a, b = files
+    assert (a.added, a.removed) == (2, 1)
+    assert a.text.count("diff --git") == 1
+    assert (b.added, b.removed) == (1, 1)
+    assert b.text.startswith("diff --git a/b.py")
+
+
+def test_miscounted_hunk_ends_at_the_next_hunk_header():
+    diff = (
+        "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n"
+        "@@ -1,9 +1,9 @@\n-a\n+b\n"
+        "@@ -20,1 +20,1 @@\n-c\n+d\n"
+    )
+    [file_diff] = parse_diff(diff)
+
+    assert [(hunk.old_start, hunk.added, hunk.removed) for hunk in file_diff.hunks] == [(1, 1, 1), (20, 1, 1)]
+
+
+def test_header_lookalikes_inside_a_hunk_stay_content():
+    diff = (
+        "diff --git a/q.sql b/q.sql\n--- a/q.sql\n+++ b/q.sql\n"
+        "@@ -1,2 +1,2 @@\n--- old comment\n+++ new comment\n \n"
+        "\\ No newline at end of file\n"
+    )
+    [file_diff] = parse_diff(diff)
+
+    assert (file_diff.added, file_diff.removed, len(file_diff.hunks)) == (1, 1, 1)
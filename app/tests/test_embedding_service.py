@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+from logic_functions import embedding_service
+from logic_functions.embedding_service import count_tokens, build_batches, embed_texts, MAX_INPUT_TOKENS, _truncate
+from logic_functions.embedding_cache import EmbeddingCache
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+class LimitedEmbeddings:
+    """Rejects requests, as the API does, with an input over the per-input limit or more than max_items inputs."""
+
+    def __init__(self, max_items: int = 2048):
+        self.max_items = max_items
+        self.requests = []
+
+    async def create(self, input, model):
+        self.requests.append(len(input))
+        if len(input) > self.max_items:
+            raise BadRequest("too many tokens in request")
+        for text in input:
+            if count_tokens(text) > MAX_INPUT_TOKENS:
+                raise BadRequest("input too long")
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=[float(len(text)), 1.0]) for i, text in enumerate(input)],
+            usage=SimpleNamespace(prompt_tokens=0)
+        )
+
+
+def test_count_tokens_does_not_undercount_dense_text():
+    minified = "a=1;b=2;" * 1000
+    non_ascii = "日本語のコード" * 1000
+    assert count_tokens(minified) > len(minified) // 4 + 1
+    assert count_tokens(non_ascii) >= len(non_ascii)
+
+
+def test_truncate_keeps_oversized_and_non_ascii_inputs_under_the_limit():
+    for text in ("x = 1\n" * 20000, "日本語" * 20000, "é" * 40000):
+        truncated = _truncate(text)
+        assert truncated and text.startswith(truncated)
+        assert count_tokens(truncated) <= MAX_INPUT_TOKENS
+
+
+def test_build_batches_respects_the_request_token_limit(monkeypatch):
+    monkeypatch.setattr(embedding_service, "MAX_BATCH_TOKENS", 10000)
+    texts = ["日本語" * 1000] * 10
+    for batch in build_batches(texts):
+        assert sum(min(count_tokens(texts[i]), MAX_INPUT_TOKENS) for i in batch) <= 10000 or len(batch) == 1
+
+
+def test_rejected_batch_is_split_instead_of_dropped(set_openai):
+    embeddings = LimitedEmbeddings(max_items=3)
+    set_openai(SimpleNamespace(embeddings=embeddings))
+    texts = [f"def f{i}(): return '{'ü' * i}'" for i in range(10)] + ["x" * 200000, "日本語" * 30000]
+
+    vectors = asyncio.run(embed_texts(texts, model="split-test"))
+
+    assert all(vector is not None for vector in vectors)
+    # The first request carried everything and was rejected; the halves were split again until they fit
+    assert embeddings.requests[0] == len(texts)
+    assert len(embeddings.requests) > 1
+
+
+def test_sqlite_tier_prunes_the_least_recently_used_rows_past_its_cap(monkeypatch, tmp_path):
+    from logic_functions import embedding_cache
+    clock = iter(range(1, 100))
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: next(clock))
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_entries=1, max_rows=10)
+
+    for start in range(0, 10, 2):
+        cache.put_many("m", {f"h{i}": [float(i)] for i in range(start, start + 2)})
+    # Read back from SQLite (the LRU tier holds one entry), so h0 and h1 become the most recently used
+    assert cache.get_many("m", ["h0", "h1"]) == {"h0": [0.0], "h1": [1.0]}
+    cache.put_many("m", {"h10": [10.0]})
+
+    rows = {content_hash for content_hash, in cache._connection().execute("SELECT hash FROM embeddings")}
+    assert len(rows) == 9
+    assert {"h0", "h1", "h10"} <= rows and not {"h2", "h3"} & rows
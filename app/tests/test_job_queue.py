@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+import pytest
+
+from agent_workflow import review_worker
+from logic_functions.job_queue import SQLiteJobQueue, SQSJobQueue
+from logic_functions.review_cache import DeliveryLog
+
+
+def test_expired_lease_is_reclaimed_and_the_old_receipt_is_void(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    queue.enqueue({"n": 1}, group="owner/repo#1")
+
+    (first,) = queue.receive(10, visibility_timeout=0.05)
+    # Leased: neither redelivered nor a second job of its PR
+    assert queue.receive(10, visibility_timeout=0.05, max_per_group=1) == []
+
+    time.sleep(0.1)
+    (second,) = queue.receive(10, visibility_timeout=30, max_per_group=1)
+    assert (second.id, second.attempts) == (first.id, 2)
+
+    # The worker whose lease expired cannot ack the job out from under the new holder
+    queue.ack(first)
+    assert len(queue) == 1
+    queue.ack(second)
+    assert len(queue) == 0
+
+
+def test_abandoned_job_is_dead_lettered_and_its_claims_released(tmp_path, monkeypatch):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    claims = DeliveryLog(str(tmp_path / "claims.sqlite3"))
+    monkeypatch.setattr(review_worker, "delivery_log", claims)
+    keys = ["delivery:1", "head:owner/repo#1@abc"]
+    for key in keys:
+        assert claims.claim(key)
+    queue.enqueue({"claim_keys": keys}, group="owner/repo#1")
+    (job,) = queue.receive(10)
+
+    asyncio.run(review_worker.abandon_job(queue, job, "RuntimeError: boom"))
+
+    assert len(queue) == 0
+    assert queue.receive(10) == []
+    # GitHub's redelivery or a re-trigger of the same head is accepted again
+    assert all(claims.claim(key) for key in keys)
+
+
+def test_sqs_queue_without_a_url_names_the_missing_setting():
+    with pytest.raises(ValueError, match="JOB_QUEUE_URL"):
+        SQSJobQueue(None)
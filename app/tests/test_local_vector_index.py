@@ -0,0 +1,55 @@
+from logic_functions.local_vector_index import LocalVectorIndex
+from logic_functions.s3_upload import get_s3_object
+
+KEY = "test/vector_index.npz"
+
+
+def vector(chunk_id: str, x: float) -> dict:
+    return {"id": chunk_id, "values": [x, 1.0, 0.0], "metadata": {"repo": "repo", "path": f"{chunk_id}.py"}}
+
+
+def published_ids() -> set:
+    body, _ = get_s3_object(KEY)
+    return set(LocalVectorIndex._deserialize(body, "unused", KEY)._ids)
+
+
+def test_concurrent_flushes_keep_both_writers_changes(fake_s3, tmp_path):
+    seed = LocalVectorIndex(path=str(tmp_path / "seed.npz"), key=KEY)
+    seed.upsert([vector("shared", 1.0), vector("doomed", 2.0)])
+    seed.flush()
+
+    a = LocalVectorIndex.load(str(tmp_path / "a.npz"), KEY)
+    b = LocalVectorIndex.load(str(tmp_path / "b.npz"), KEY)
+    a.upsert([vector("from_a", 3.0)])
+    b.upsert([vector("from_b", 4.0)])
+    b.delete(ids=["doomed"])
+    b.update(id="shared", set_metadata={"chunk_id": 7})
+    a.flush()
+    # b's conditional write fails, so it replays its writes onto a's copy
+    b.flush()
+
+    assert published_ids() == {"shared", "from_a", "from_b"}
+    assert set(b._ids) == {"shared", "from_a", "from_b"}
+    merged = LocalVectorIndex.load(str(tmp_path / "merged.npz"), KEY)
+    assert merged._metadata[merged._rows["shared"]]["chunk_id"] == 7
+
+
+def test_stale_local_copy_is_revalidated_against_s3(fake_s3, tmp_path):
+    path = str(tmp_path / "warm.npz")
+    warm = LocalVectorIndex(path=path, key=KEY)
+    warm.upsert([vector("old", 1.0)])
+    warm.flush()
+
+    other = LocalVectorIndex.load(str(tmp_path / "other.npz"), KEY)
+    other.upsert([vector("new", 2.0)])
+    other.flush()
+
+    # A container starting from its /tmp copy sees the newer S3 version
+    assert set(LocalVectorIndex.load(path, KEY)._ids) == {"old", "new"}
+    # A warm, already loaded index picks it up on revalidation, keeping unpublished writes
+    warm.upsert([vector("pending", 3.0)])
+    assert warm.revalidate()
+    assert set(warm._ids) == {"old", "new", "pending"}
+    assert not warm.revalidate()
+    warm.flush()
+    assert published_ids() == {"old", "new", "pending"}
@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+
+import main
+from agent_workflow import review_worker
+from benchmarks.fakes import MemorySQS
+from benchmarks.startup import api_gateway_event
+from logic_functions import job_queue
+from logic_functions.clients import set_client, reset_clients
+
+LAMBDA_CONTEXT = SimpleNamespace(function_name="gitlint", aws_request_id="test", get_remaining_time_in_millis=lambda: 30000)
+
+
+def pull_request_event(delivery_id: str) -> dict:
+    payload = {
+        "action": "opened",
+        "repository": {"full_name": "owner/repo"},
+        "pull_request": {"number": 7, "diff_url": "https://github.com/owner/repo/pull/7.diff",
+                         "issue_url": "https://api.github.com/repos/owner/repo/issues/7", "head": {"sha": delivery_id * 8}},
+    }
+    return api_gateway_event("POST", "/review", {"X-GitHub-Event": "pull_request", "X-GitHub-Delivery": delivery_id}, payload)
+
+
+def test_job_queued_by_the_lambda_handler_completes_after_later_invocations(monkeypatch):
+    # Mangum runs on the thread's event loop, which earlier asyncio.run calls in this process have closed
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    sqs = MemorySQS()
+    set_client("sqs", sqs)
+    monkeypatch.setattr(job_queue, "_queue", job_queue.SQSJobQueue("https://sqs.us-east-1.amazonaws.com/1/reviews.fifo"))
+    reviewed = []
+
+    async def run_orchestration_agent(diff_url, repo_name, issue_url, full_repo, pr_number, head_sha, trace_id=None):
+        reviewed.append((full_repo, pr_number, head_sha))
+        return "review"
+
+    monkeypatch.setattr(review_worker, "run_orchestration_agent", run_orchestration_agent)
+    try:
+        # Two web invocations, as two webhook deliveries reach the function
+        first = main.handler(pull_request_event("a1"), LAMBDA_CONTEXT)
+        second = main.handler(api_gateway_event("GET", "/"), LAMBDA_CONTEXT)
+        assert (first["statusCode"], second["statusCode"]) == (200, 200)
+        # The web function never runs reviews itself
+        assert not main.background_tasks_set
+
+        response = review_worker.sqs_handler(sqs.lambda_event())
+    finally:
+        reset_clients("sqs")
+        loop.close()
+
+    assert response == {"batchItemFailures": []}
+    assert reviewed == [("owner/repo", 7, "a1" * 8)]
+
+
+def test_in_process_worker_restarts_with_a_fresh_stop_event(monkeypatch):
+    monkeypatch.setattr(main, "REVIEW_WORKER_IN_PROCESS", True)
+    runs = []
+
+    class Pool:
+        async def run(self, stop):
+            runs.append(stop.is_set())
+            await stop.wait()
+
+    monkeypatch.setattr(review_worker, "ReviewWorkerPool", Pool)
+
+    async def start_and_stop():
+        await main.start_worker()
+        await asyncio.sleep(0)
+        await main.stop_worker()
+
+    # A stopped app that starts again gets a running worker, not one stopped by the last shutdown
+    asyncio.run(start_and_stop())
+    asyncio.run(start_and_stop())
+    assert runs == [False, False]
+
+
+def test_only_reviewable_pull_request_events_claim_their_delivery(monkeypatch):
+    claimed = []
+
+    class DeliveryLog:
+        def claim(self, key):
+            claimed.append(key)
+            return True
+
+    monkeypatch.setattr(main, "delivery_log", DeliveryLog())
+    monkeypatch.setattr(job_queue, "_queue", job_queue.SQLiteJobQueue(job_queue.JOB_QUEUE_PATH))
+    closed = pull_request_event("c1")
+    closed["body"] = closed["body"].replace('"opened"', '"closed"')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        main.handler(api_gateway_event("POST", "/review", {"X-GitHub-Event": "ping", "X-GitHub-Delivery": "p1"}, {"zen": "hi"}), LAMBDA_CONTEXT)
+        main.handler(api_gateway_event("POST", "/review", {"X-GitHub-Event": "issues", "X-GitHub-Delivery": "i1"}, {}), LAMBDA_CONTEXT)
+        main.handler(closed, LAMBDA_CONTEXT)
+        assert claimed == []
+
+        main.handler(pull_request_event("o1"), LAMBDA_CONTEXT)
+    finally:
+        loop.close()
+    assert claimed == ["delivery:o1", "head:owner/repo#7@" + "o1" * 8]
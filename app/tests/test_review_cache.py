@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+from logic_functions.diff_parser import parse_diff
+from logic_functions.diff_functions import retrieve_context_from_diff
+from logic_functions.review_cache import S3DeliveryLog, ReviewState, S3ReviewState
+from logic_functions.s3_upload import put_s3_object
+
+DIFF = """diff --git a/a.py b/a.py
+--- a/a.py
++++ b/a.py
+@@ -1,1 +1,1 @@
+-x = 1
++x = 2
+"""
+
+
+def test_review_runs_without_context_when_retrieval_fails(monkeypatch):
+    from agent_workflow import review_agent
+    from benchmarks.fakes import FakeRunner
+
+    class BrokenRetrieval:
+        async def ensure_loaded(self, paths):
+            raise RuntimeError("vector index unavailable")
+
+    monkeypatch.setattr(FakeRunner, "latency", 0)
+    monkeypatch.setattr(review_agent, "Runner", FakeRunner)
+
+    async def review():
+        context = await retrieve_context_from_diff("repo", list(parse_diff(DIFF)), retrieval=BrokenRetrieval())
+        return context, await review_agent.run_review_agent("a.py", DIFF, context)
+
+    context, review = asyncio.run(review())
+
+    assert context == ""
+    assert review.startswith("Review by")
+
+
+def test_s3_delivery_log_claims_once_across_instances(fake_s3):
+    # Two containers share nothing but the bucket
+    first, second = S3DeliveryLog(), S3DeliveryLog()
+
+    assert first.claim("delivery:1")
+    assert not second.claim("delivery:1")
+    assert second.claim("delivery:2")
+
+    first.release("delivery:1")
+    assert second.claim("delivery:1")
+
+
+def test_s3_delivery_log_takes_over_an_expired_claim(fake_s3):
+    log = S3DeliveryLog(ttl=60)
+    stale = json.dumps({"key": "delivery:1", "created": 0}).encode()
+    put_s3_object(log._key("delivery:1"), stale)
+
+    assert log.claim("delivery:1")
+    assert not log.claim("delivery:1")
+
+
+def test_review_state_writes_only_over_the_version_read(fake_s3, tmp_path):
+    for state in (ReviewState(str(tmp_path / "state.sqlite3")), S3ReviewState()):
+        assert state.put("o/r#1", "aaa", "url", "first")
+        assert not state.put("o/r#1", "bbb", "url", "lost", None)
+        read = state.get("o/r#1")
+        assert state.put("o/r#1", "bbb", "url", "second", read["version"])
+        # A review that read the state before "bbb" was written cannot overwrite it
+        assert not state.put("o/r#1", "ccc", "url", "stale", read["version"])
+        assert state.get("o/r#1")["head_sha"] == "bbb"
+
+
+def test_review_state_only_moves_forward(fake_s3, monkeypatch):
+    from agent_workflow import run_agent
+    # a1 < a2 < a3 on one branch
+    order = {"a1": 1, "a2": 2, "a3": 3}
+
+    async def compare_status(full_repo, base_sha, head_sha):
+        return "ahead" if order[head_sha] > order[base_sha] else "behind"
+
+    state = S3ReviewState()
+    monkeypatch.setattr(run_agent, "review_state", state)
+    monkeypatch.setattr(run_agent, "get_compare_status", compare_status)
+    state.put("o/r#1", "a1", "url", "a1")
+    read = state.get("o/r#1")
+
+    async def record(head_sha):
+        return await run_agent._record_review_state("o/r#1", read, "o/r", head_sha, "url", head_sha)
+
+    # Both reviews started from a1; a3 finishes first, then the older a2 must not move the state back
+    assert asyncio.run(record("a3"))
+    assert not asyncio.run(record("a2"))
+    assert state.get("o/r#1")["body"] == "a3"
@@ -0,0 +1,76 @@
+import asyncio
+
+from agent_workflow import run_agent
+from logic_functions.diff_packing import pack_file_diffs
+from logic_functions.diff_parser import parse_diff
+
+BINARY_DIFF = """diff --git a/logo.png b/logo.png
+index 1111111..2222222 100644
+Binary files a/logo.png and b/logo.png differ
+"""
+
+TWO_FILES = """diff --git a/a.py b/a.py
+--- a/a.py
++++ b/a.py
+@@ -1,1 +1,1 @@
+-a = 1
++a = 2
+diff --git a/b.py b/b.py
+--- a/b.py
++++ b/b.py
+@@ -1,1 +1,1 @@
+-b = 1
++b = 2
+"""
+
+
+class Comment:
+    def __init__(self, *args, **kwargs):
+        self.updates = []
+
+    async def start(self, text):
+        raise AssertionError("no comment should be posted")
+
+    def update(self, text):
+        self.updates.append(text)
+
+
+async def no_summary(*args, **kwargs):
+    raise AssertionError("the summarizer should not be called")
+
+
+def test_full_review_without_reviewable_files_posts_nothing(monkeypatch):
+    async def nothing(*args, **kwargs):
+        return None
+
+    async def get_diff(url):
+        return BINARY_DIFF
+
+    monkeypatch.setattr(run_agent, "initialize_chunk_store", nothing)
+    monkeypatch.setattr(run_agent, "get_diff", get_diff)
+    monkeypatch.setattr(run_agent, "ProgressiveComment", Comment)
+    monkeypatch.setattr(run_agent, "summarize_reviews", no_summary)
+
+    result = asyncio.run(run_agent.run_orchestration_agent("https://github.com/o/r/pull/1.diff", "r", "https://api.github.com/repos/o/r/issues/1"))
+
+    assert result == ""
+
+
+def test_failed_reviews_are_posted_without_a_summary(monkeypatch):
+    async def no_context(*args, **kwargs):
+        return ""
+
+    async def failing_review(*args, **kwargs):
+        raise TimeoutError("model unavailable")
+
+    monkeypatch.setattr(run_agent, "create_retrieval_context", lambda repo_name: None)
+    monkeypatch.setattr(run_agent, "retrieve_context_from_diff", no_context)
+    monkeypatch.setattr(run_agent, "run_review_agent", failing_review)
+    monkeypatch.setattr(run_agent, "summarize_reviews", no_summary)
+    units = pack_file_diffs(list(parse_diff(TWO_FILES)), max_files=1)
+    assert len(units) == 2
+
+    review = asyncio.run(run_agent._write_review(units, "r", None, Comment()))
+
+    assert review == ("Review for `a.py` could not be completed (TimeoutError).\n\n"
+                      "Review for `b.py` could not be completed (TimeoutError).")
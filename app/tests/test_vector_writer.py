@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from logic_functions import vector_writer
+from logic_functions.vector_writer import VectorWriter, vector_batches
+
+
+class IndexHTTPError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+class FlakyIndex:
+    """Records upserted batches; the first call for each id in fail_once fails with the given status."""
+
+    def __init__(self, fail_once: set[str] = frozenset(), status: int = 503):
+        self.fail_once = set(fail_once)
+        self.status = status
+        self.calls = []
+        self.written = []
+
+    def upsert(self, vectors):
+        ids = [vector["id"] for vector in vectors]
+        self.calls.append(ids)
+        if self.fail_once & set(ids):
+            self.fail_once -= set(ids)
+            raise IndexHTTPError(self.status)
+        self.written.extend(ids)
+
+
+def vector(i: int, dimension: int = 4) -> dict:
+    return {"id": f"v{i}", "values": [0.0] * dimension, "metadata": {"path": "a.py"}}
+
+
+def chunk(i: int) -> dict:
+    return {"id": f"v{i}", "embedding": [0.0] * 4, "metadata": {"path": "a.py"}}
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(vector_writer.asyncio, "sleep", sleep)
+    return delays
+
+
+def test_batches_are_bounded_by_vector_count(monkeypatch):
+    monkeypatch.setattr(vector_writer, "VECTOR_UPSERT_BATCH_VECTORS", 3)
+
+    batches = vector_batches([vector(i) for i in range(7)])
+
+    assert [[v["id"] for v in batch] for batch in batches] == [["v0", "v1", "v2"], ["v3", "v4", "v5"], ["v6"]]
+
+
+def test_batches_are_bounded_by_request_bytes(monkeypatch):
+    monkeypatch.setattr(vector_writer, "VECTOR_UPSERT_BATCH_VECTORS", 100)
+    size = vector_writer._request_bytes(vector(0, dimension=100))
+    monkeypatch.setattr(vector_writer, "VECTOR_UPSERT_BATCH_BYTES", size * 2 + 1)
+
+    batches = vector_batches([vector(i, dimension=100) for i in range(5)])
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    # A single vector over the byte limit still goes out, alone
+    monkeypatch.setattr(vector_writer, "VECTOR_UPSERT_BATCH_BYTES", 1)
+    assert [len(batch) for batch in vector_batches([vector(i) for i in range(2)])] == [1, 1]
+
+
+def test_failed_batch_is_retried_with_backoff_without_resending_the_others(monkeypatch, no_backoff):
+    monkeypatch.setattr(vector_writer, "VECTOR_UPSERT_BATCH_VECTORS", 2)
+    index = FlakyIndex(fail_once={"v2"})
+
+    written = asyncio.run(VectorWriter(index, max_retries=3).upsert([chunk(i) for i in range(5)]))
+
+    assert [c["id"] for c in written] == ["v0", "v1", "v2", "v3", "v4"]
+    assert sorted(index.written) == ["v0", "v1", "v2", "v3", "v4"]
+    assert sum(call == ["v2", "v3"] for call in index.calls) == 2 and len(index.calls) == 4
+    assert len(no_backoff) == 1 and 1 <= no_backoff[0] <= 2
+
+
+def test_client_errors_are_not_retried_and_only_drop_their_batch(monkeypatch, no_backoff):
+    monkeypatch.setattr(vector_writer, "VECTOR_UPSERT_BATCH_VECTORS", 2)
+    index = FlakyIndex(fail_once={"v0"}, status=400)
+
+    written = asyncio.run(VectorWriter(index, max_retries=3).upsert([chunk(i) for i in range(4)]))
+
+    assert [c["id"] for c in written] == ["v2", "v3"]
+    assert len(index.calls) == 2 and no_backoff == []
+
+
+def test_batch_failing_past_the_retry_limit_is_reported_as_not_written(monkeypatch, no_backoff):
+    monkeypatch.setattr(vector_writer, "VECTOR_UPSERT_BATCH_VECTORS", 2)
+
+    class DownIndex:
+        calls = 0
+
+        def upsert(self, vectors):
+            DownIndex.calls += 1
+            raise IndexHTTPError(503)
+
+    written = asyncio.run(VectorWriter(DownIndex(), max_retries=2).upsert([chunk(0)]))
+
+    assert written == [] and DownIndex.calls == 3
+    # Exponential backoff between attempts, with up to a second of jitter
+    assert [int(delay) for delay in no_backoff] == [1, 2]